@@ -1,40 +1,109 @@
 import os
 import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from langchain_ollama import OllamaLLM
+from llm_cache import cached_invoke
+from dataset_store import DatasetReader, PACKED_ROOT, REAL_SUBSET
+from job_state import JobState, DONE_STAGE, output_hash
+from near_duplicates import NearDuplicateIndex
+from ordered_pool import iter_ordered
 
 # --- KONFIGURACJA ---
 INPUT_DIR = "content"
 OUTPUT_DIR = "synthetic_content"
-LOG_FILE = "synthetic_processed_files.log"  # Plik z historią przetworzonych dokumentów
+LOG_FILE = "synthetic_processed_files.log"  # Stara historia - importowana raz do job_state
+PIPELINE_NAME = "augmentation"
 MODEL_NAME = "llama3"
 
+# Cache odpowiedzi (klucz: prompt + numer wariantu). True = zawsze nowe próbki z modelu
+CACHE_BYPASS = False
+
 TARGET_COUNT_PER_TYPE = 60
 MIN_SYNTHETIC_PER_FILE = 1
+PLAN_SEED = 42  # Stały przydział dodatkowych wariantów - wznowienie daje ten sam plan
+
+GENERATION_WORKERS = 4                           # Równoległe zapytania (dopasuj do OLLAMA_NUM_PARALLEL serwera)
+GENERATION_MAX_IN_FLIGHT = GENERATION_WORKERS * 2  # Limit zleconych, a jeszcze nie zapisanych wariantów
 
 # Ustawienia AI - obniżona temperatura dla stabilności formatu, 
 # ale wciąż wystarczająca dla różnorodności
 llm = OllamaLLM(model=MODEL_NAME, temperature=0.7)
+job_state = JobState(PIPELINE_NAME)
+
+def variant_stage(i):
+    return f"variant:{i}"
 
 def load_processed_files():
-    """Wczytuje listę już przetworzonych plików."""
-    if not Path(LOG_FILE).exists():
-        return set()
-    return set(Path(LOG_FILE).read_text(encoding='utf-8').splitlines())
+    """Zbiór w pełni przetworzonych plików (po jednorazowej migracji starego logu)."""
+    migrated = job_state.migrate_history_file(LOG_FILE)
+    if migrated:
+        print(f"📥 Zaimportowano {migrated} wpisów z {LOG_FILE} do bazy stanu.")
+    return job_state.done_docs()
 
 def save_to_log(file_path):
-    """Zapisuje ścieżkę pliku do logu."""
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"{file_path}\n")
+    """Oznacza plik (wszystkie warianty) jako zakończony."""
+    job_state.finish(file_path, DONE_STAGE)
 
 def get_files_by_category(input_path):
+    """
+    {kategoria: [pliki]} oraz {plik: treść}. Jeśli istnieje spakowany zbiór,
+    lista i treści pochodzą z niego (bez chodzenia po tysiącach plików .txt).
+    """
+    reader = DatasetReader(PACKED_ROOT / REAL_SUBSET)
+    if reader.exists():
+        categories, texts = {}, {}
+        for folder, documents in reader.documents_by_folder().items():
+            if not folder:
+                continue  # Pliki luzem w content/ (jak przy iterdir) pomijamy
+            files = [input_path / doc_id for doc_id in sorted(documents)]
+            categories[folder] = files
+            texts.update({input_path / doc_id: documents[doc_id] for doc_id in documents})
+        return categories, texts
+
     categories = {}
     for item in input_path.iterdir():
         if item.is_dir():
             files = list(item.glob("*.txt"))
             if files:
                 categories[item.name] = files
-    return categories
+    return categories, {}
+
+def read_text(file_path, texts):
+    try:
+        return texts.get(file_path) or file_path.read_text(encoding='utf-8')
+    except Exception:
+        return None
+
+def drop_near_duplicates(categories, texts, processed_files):
+    """
+    Usuwa z planu bliskie duplikaty (MinHash/LSH) - kolejne kopie tego samego
+    wzoru nie są mnożone na warianty. Już przetworzone pliki trafiają do indeksu jako pierwsze.
+    """
+    index = NearDuplicateIndex()
+    for files in categories.values():
+        for f in files:
+            if str(f) in processed_files:
+                text = read_text(f, texts)
+                if text:
+                    index.register(text, f)
+
+    skipped = 0
+    unique = {}
+    for cat_name, files in categories.items():
+        kept = []
+        for f in files:
+            text = read_text(f, texts)
+            if str(f) in processed_files or text is None or index.check(text, f) is None:
+                kept.append(f)
+            else:
+                skipped += 1
+        if kept:
+            unique[cat_name] = kept
+    if skipped:
+        print(f"♻️ Pominięto {skipped} bliskich duplikatów (bez generowania wariantów).")
+    return unique
 
 def calculate_variants_map(files, target_total):
     current_count = len(files)
@@ -49,12 +118,15 @@ def calculate_variants_map(files, target_total):
     remainder = missing % current_count
     for f in files:
         assignments[f] += base_add
-    for f in random.sample(files, remainder):
+    for f in random.Random(PLAN_SEED).sample(files, remainder):
         assignments[f] += 1
     return assignments
 
-def generate_synthetic_text(text):
-    """Generuje tekst, wymuszając brak komentarzy od AI."""
+def generate_synthetic_text(text, variant=None):
+    """
+    Generuje tekst, wymuszając brak komentarzy od AI (variant - numer próbki dla cache).
+    Wywoływana z wątków roboczych - nic nie wypisuje, błędy propaguje do wywołującego.
+    """
     prompt = f"""[SYSTEM: You are a raw data generator. Return ONLY the document text. No conversational fillers.]
 SOURCE DOCUMENT TO TRANSFORM:
 {text[:3500]}
@@ -70,16 +142,12 @@ OUTPUT ONLY THE TRANSFORMED TEXT. DO NOT EXPLAIN. DO NOT SAY "HERE IS THE TEXT".
 ---
 SYNTHETIC TEXT START:"""
 
-    try:
-        response = llm.invoke(prompt)
-        # Czyszczenie techniczne
-        clean_text = response.replace("SYNTHETIC TEXT START:", "").strip()
-        # Usuwanie ewentualnych bloków kodu markdown
-        clean_text = clean_text.replace("```text", "").replace("```", "").strip()
-        return clean_text
-    except Exception as e:
-        print(f"      ❌ Błąd AI: {e}")
-        return None
+    response = cached_invoke(llm, prompt, bypass=CACHE_BYPASS, key_extra=variant)
+    # Czyszczenie techniczne
+    clean_text = response.replace("SYNTHETIC TEXT START:", "").strip()
+    # Usuwanie ewentualnych bloków kodu markdown
+    clean_text = clean_text.replace("```text", "").replace("```", "").strip()
+    return clean_text
 
 def main():
     input_path = Path(INPUT_DIR)
@@ -91,7 +159,8 @@ def main():
         return
 
     print("🔍 Analiza struktury i historii...")
-    categories = get_files_by_category(input_path)
+    categories, texts = get_files_by_category(input_path)
+    categories = drop_near_duplicates(categories, texts, processed_files)
     if not categories:
         return
 
@@ -100,45 +169,85 @@ def main():
     if final_target < max_files:
         final_target = max_files + (max_files * MIN_SYNTHETIC_PER_FILE)
 
-    total_generated = 0
-
+    # Plan: (kategoria, plik, treść, liczba wariantów) - wypisywanie i zapis w kolejności planu
+    plan = []
     for cat_name, files in categories.items():
-        target_dir = output_path / cat_name
-        target_dir.mkdir(parents=True, exist_ok=True)
-
         # Filtrowanie plików, które już były przetwarzane
         files_to_process = [f for f in files if str(f) not in processed_files]
-        
+
         if not files_to_process:
             print(f"✅ Kategoria [{cat_name}] już w pełni przetworzona.")
             continue
 
         augment_plan = calculate_variants_map(files_to_process, final_target)
-        print(f"\n📂 Kategoria: [{cat_name}] (Przetwarzanie {len(files_to_process)} nowych plików)")
-
         for file_path in files_to_process:
-            try:
-                original_text = file_path.read_text(encoding='utf-8')
-            except:
-                continue
+            original_text = read_text(file_path, texts)
+            if original_text is not None:
+                plan.append((cat_name, file_path, original_text, augment_plan[file_path]))
+    files_per_category = Counter(cat_name for cat_name, *_ in plan)
 
-            # Kopiuj oryginał do folderu wyjściowego
-            (target_dir / file_path.name).write_text(original_text, encoding='utf-8')
+    def variant_tasks():
+        """Wszystkie warianty wszystkich kategorii jako jeden strumień zleceń."""
+        for entry in plan:
+            file_path, num_variants = entry[1], entry[3]
+            for i in range(1, num_variants + 1):
+                # Wznowienie: warianty zapisane w poprzednim przebiegu pomijamy
+                done = job_state.is_done(str(file_path), variant_stage(i))
+                if not done:
+                    job_state.start(str(file_path), variant_stage(i))
+                yield entry, i, done
 
-            num_variants = augment_plan[file_path]
-            print(f"   📄 {file_path.name} ({num_variants} wariantów)", end=" ", flush=True)
+    def generate(task):
+        (_, _, original_text, _), i, done = task
+        return None if done else generate_synthetic_text(original_text, variant=i)
 
-            for i in range(1, num_variants + 1):
-                new_text = generate_synthetic_text(original_text)
-                if new_text:
-                    new_name = f"{file_path.stem}_synth_{i}.txt"
-                    (target_dir / new_name).write_text(new_text, encoding='utf-8')
-                    total_generated += 1
-                    print(".", end="", flush=True)
-            
-            # Po udanym przetworzeniu wszystkich wariantów dla pliku, zapisz go do logu
-            save_to_log(str(file_path))
-            print(" Gotowe")
+    total_generated = 0
+    failed_files = set()  # Pliki z nieudanym wariantem - bez DONE_STAGE, wznowienie je ponowi
+    current_category = None
+    print(f"🚀 Generowanie wariantów (równolegle: {GENERATION_WORKERS})...")
+    pool = ThreadPoolExecutor(max_workers=GENERATION_WORKERS)
+    try:
+        for (entry, i, done), new_text, error in iter_ordered(pool, variant_tasks(), generate,
+                                                               GENERATION_MAX_IN_FLIGHT):
+            cat_name, file_path, original_text, num_variants = entry
+            target_dir = output_path / cat_name
+
+            if cat_name != current_category:
+                current_category = cat_name
+                target_dir.mkdir(parents=True, exist_ok=True)
+                print(f"\n📂 Kategoria: [{cat_name}] (Przetwarzanie {files_per_category[cat_name]} nowych plików)")
+
+            if i == 1:
+                # Kopiuj oryginał do folderu wyjściowego
+                (target_dir / file_path.name).write_text(original_text, encoding='utf-8')
+                print(f"   📄 {file_path.name} ({num_variants} wariantów)", end=" ", flush=True)
+
+            if done:
+                print("-", end="", flush=True)
+            elif error is not None:
+                print(f"\n      ❌ Błąd AI: {error}")
+                job_state.fail(str(file_path), variant_stage(i), str(error))
+                failed_files.add(file_path)
+            elif new_text:
+                new_name = f"{file_path.stem}_synth_{i}.txt"
+                (target_dir / new_name).write_text(new_text, encoding='utf-8')
+                job_state.finish(str(file_path), variant_stage(i), new_name, output_hash(new_text))
+                total_generated += 1
+                print(".", end="", flush=True)
+            else:
+                job_state.fail(str(file_path), variant_stage(i), "Brak wyniku")
+                failed_files.add(file_path)
+
+            if i == num_variants:
+                if file_path in failed_files:
+                    print(" ⚠️ Niekompletny - nieudane warianty zostaną ponowione przy wznowieniu")
+                else:
+                    # Po udanym przetworzeniu wszystkich wariantów dla pliku, zapisz go do logu
+                    save_to_log(str(file_path))
+                    print(" Gotowe")
+    finally:
+        # Przy przerwaniu nie czekamy na zlecone, a niezapisane warianty
+        pool.shutdown(wait=False, cancel_futures=True)
 
     print(f"\n✅ Zakończono! Wygenerowano {total_generated} nowych plików.")
 
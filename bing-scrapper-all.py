@@ -1,9 +1,6 @@
 import os
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
-import random
+import sys
+from scan_downloader import ScanDownloader, SEARCH_URL
 
 # --- KONFIGURACJA ---
 OUTPUT_DIR = "scan-candidates"
@@ -80,53 +77,24 @@ CATEGORIES = {
     "authorization": "upoważnienie wypełnione dane",
 }
 
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-}
-
-def download_images(query, folder_name):
-    print(f"\n🚀 POBIERANIE WYPEŁNIONYCH: {folder_name.upper()}")
-    search_url = f"https://www.bing.com/images/search?q={query.replace(' ', '+')}&form=HDRSC2"
-    
-    try:
-        response = requests.get(search_url, headers=HEADERS, timeout=15)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        target_path = os.path.join(OUTPUT_DIR, folder_name)
-        os.makedirs(target_path, exist_ok=True)
-
-        links = []
-        for a in soup.find_all("a", {"class": "iusc"}):
-            if "m" in a.attrs:
-                m = json.loads(a["m"])
-                links.append(m["murl"])
+def main():
+    # --search-url URL: inny adres wyszukiwarki (np. lokalny serwer testowy), {query} = zapytanie
+    args = sys.argv[1:]
+    search_url = SEARCH_URL
+    if "--search-url" in args:
+        position = args.index("--search-url") + 1
+        if position >= len(args):
+            print("❌ Użycie: python bing-scrapper-all.py [--search-url URL]  (URL z {query} w miejscu zapytania)")
+            sys.exit(2)
+        search_url = args[position]
 
-        print(f"  🔍 Linki: {len(links)}")
-        
-        downloaded = 0
-        for url in links:
-            if downloaded >= LIMIT: break
-            try:
-                if any(ext in url.lower() for ext in [".pdf", ".html", ".php"]): continue
-                ext = ".jpg" if ".png" not in url.lower() else ".png"
-                
-                res = requests.get(url, headers=HEADERS, timeout=7)
-                if res.status_code == 200 and "text/html" not in res.headers.get('Content-Type', ''):
-                    file_name = f"{folder_name}_{downloaded}{ext}"
-                    with open(os.path.join(target_path, file_name), "wb") as f:
-                        f.write(res.content)
-                    print(f"    ✅ [{downloaded+1}/{LIMIT}] {file_name}")
-                    downloaded += 1
-                    if downloaded % 5 == 0: time.sleep(1)
-            except: continue
-
-    except Exception as e:
-        print(f"  🚨 Błąd: {e}")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    downloader = ScanDownloader(OUTPUT_DIR, LIMIT, search_url=search_url)
+    results = downloader.run(CATEGORIES)
+    print(f"\n✨ Pobrano {sum(results.values())} obrazów w {len(results)} kategoriach.")
 
 if __name__ == "__main__":
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    for i, (folder, query) in enumerate(CATEGORIES.items()):
-        download_images(query, folder)
-        wait = random.uniform(3, 6)
-        print(f"😴 Przerwa {wait:.1f}s... ({i+1}/{len(CATEGORIES)})")
-        time.sleep(wait)
\ No newline at end of file
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n🛑 Zatrzymano.")
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+# --- KONFIGURACJA ---
+# Wspólny dla wszystkich skryptów (także uruchamianych z summarizer/)
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB na jeden plik cache
+EVICT_EVERY = 100                   # Co ile zapisów sprawdzać rozmiar
+EVICT_TARGET = 0.9                  # Po eviction zostaje 90% limitu
+
+
+def make_key(*parts):
+    """Stabilny klucz SHA-256 z dowolnych części serializowalnych do JSON."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 zawartości pliku (czytany kawałkami)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Trwały cache klucz -> tekst w SQLite (tryb WAL).
+    Bezpieczny dla wielu procesów/wątków piszących naraz, z eviction LRU
+    po łącznym rozmiarze wartości.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._pid = None
+        self._conn = None
+
+    def _connection(self):
+        # Po fork() połączenie z procesu-rodzica nie może być używane
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)")
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            return row[0]
+
+    def set(self, key, value):
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()))
+            conn.commit()
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        """Usuwa najdawniej używane wpisy, aż rozmiar spadnie poniżej limitu."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        to_free = total - int(self.max_bytes * EVICT_TARGET)
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        conn.commit()
+
+    def get_json(self, key):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key, value):
+        self.set(key, json.dumps(value, ensure_ascii=False))
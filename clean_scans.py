@@ -1,13 +1,25 @@
-import os
 import shutil
 import ollama
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from llm_cache import cached_chat_choice
+from job_state import JobState, DONE_STAGE
+from image_prefilter import ImagePrefilter
+from image_preprocess import prepare_vision_image
+from ordered_pool import iter_ordered
 
 # --- KONFIGURACJA ---
 ROOT_FOLDER = "scans"
 REJECTED_FOLDER = "_ODRZUCONE"
-HISTORY_FILE = "clean_scans_processed.txt"
+REVIEW_FOLDER = "_DO_PRZEJRZENIA"      # Niepewne decyzje modelu - do ręcznej weryfikacji
+HISTORY_FILE = "clean_scans_processed.txt"  # Stara historia - importowana raz do job_state
+PIPELINE_NAME = "clean_scans"
 MODEL_NAME = "llama3.2-vision"
+AUDIT_WORKERS = 4                      # Równoległe zapytania (dopasuj do OLLAMA_NUM_PARALLEL serwera)
+AUDIT_MAX_IN_FLIGHT = AUDIT_WORKERS * 2  # Limit zleconych, a jeszcze nie wypisanych audytów
+AUDIT_NUM_PREDICT = 3                  # Limit tokenów odpowiedzi - liczy się tylko pierwsze słowo
+AUDIT_CHOICES = {'TAK': True, 'YES': True, 'NIE': False, 'NO': False}
+UNCERTAIN_BAND = (0.2, 0.8)            # P("TAK") w tym przedziale -> REVIEW_FOLDER (gdy backend zwraca logprobs)
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.heic'}
 
 # Foldery, których NIE ruszać (bezpieczne)
@@ -111,26 +123,72 @@ DOCUMENT_TYPES = {
 
 DEFAULT_CRITERIA = "Oficjalny dokument z czytelnym tekstem i pieczęciami."
 
+job_state = JobState(PIPELINE_NAME)
+
 
 # --- LOGIKA ---
 
 def load_history():
-    if not os.path.exists(HISTORY_FILE):
-        return set()
-    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-        return set(line.strip() for line in f if line.strip())
+    migrated = job_state.migrate_history_file(HISTORY_FILE)
+    if migrated:
+        print(f"📥 Zaimportowano {migrated} wpisów z {HISTORY_FILE} do bazy stanu.")
+    return job_state.done_docs()
+
+
+def mark_as_done(rel_path, decision=None):
+    """Zapisuje wynik audytu pliku (np. "accepted"/"rejected") w bazie stanu."""
+    job_state.finish(rel_path, DONE_STAGE, decision)
+
 
+def reject_file(file_path, rejected_path, folder_name, rel_path_str, decision="rejected"):
+    """Przenosi plik do _ODRZUCONE/<folder> (albo _DO_PRZEJRZENIA/<folder>) i zapisuje decyzję (np. "rejected:blurry")."""
+    target_dir = rejected_path / folder_name
+    if not target_dir.exists():
+        target_dir.mkdir(parents=True)
 
-def mark_as_done(rel_path):
-    with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{rel_path}\n")
+    try:
+        shutil.move(str(file_path), str(target_dir / file_path.name))
+        mark_as_done(rel_path_str, decision)  # Oznaczamy jako przetworzony (usunięty)
+    except Exception as e:
+        print(f"     [!] Błąd przenoszenia: {e}")
+
+
+def iter_audit_folders(base_path):
+    """(folder, nazwa typu, kryteria, pliki) dla folderów podlegających audytowi."""
+    for folder in sorted(d for d in base_path.iterdir() if d.is_dir()):
+        folder_name = folder.name
+
+        # 1. Pomijanie folderów specjalnych
+        if folder_name in (REJECTED_FOLDER, REVIEW_FOLDER):
+            continue
+
+        # 2. Pomijanie folderów "bezpiecznych" (np. documentScan - szybki zrzut)
+        if folder_name in SAFE_FOLDERS:
+            # print(f"⏩ Pomijam bezpieczny folder: {folder_name}")
+            continue
+
+        # Pobieranie kryteriów z mapy
+        if folder_name in DOCUMENT_TYPES:
+            doc_name, doc_criteria = DOCUMENT_TYPES[folder_name]
+        else:
+            # Jeśli folderu nie ma w słowniku, można go pominąć lub użyć domyślnych
+            # print(f"⏩ Folder nieznany w systemie: {folder_name} (pomijam)")
+            continue
+
+        files = sorted(f for f in folder.iterdir() if f.suffix.lower() in IMAGE_EXTENSIONS)
+        if files:
+            yield folder, doc_name, doc_criteria, files
 
 
 def check_document_strict(file_path, doc_name, criteria):
     """
     Wysyła zapytanie do Llama Vision z BARDZO rygorystycznymi wymogami.
+    Wywoływana z wątków roboczych - nic nie wypisuje, błędy API propaguje do wywołującego.
+    Zwraca (decyzja, p_tak): generowanie kończy się na pierwszym słowie TAK/NIE,
+    p_tak to prawdopodobieństwo "TAK" z logprobs (None, gdy backend ich nie zwraca).
+    Decyzja None = model nie odpowiedział TAK/NIE (niepewne, nie odrzucenie).
+    Trzeci element to błąd przygotowania obrazu (wysłano oryginał) albo None.
     """
-    print(f" (Weryfikacja: {doc_name} -> {criteria[:30]}...)", end="", flush=True)
 
     prompt = f"""
     Działaj jako rygorystyczny audytor dokumentów. Twoim zadaniem jest potwierdzenie autentyczności typu dokumentu.
@@ -153,30 +211,31 @@ def check_document_strict(file_path, doc_name, criteria):
     Odpowiedz TYLKO jednym słowem: TAK lub NIE.
     """
 
-    try:
-        response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[{
-                'role': 'user',
-                'content': prompt,
-                'images': [str(file_path)]
-            }]
-        )
-        # Czyszczenie odpowiedzi (np. "TAK." -> "TAK")
-        answer = response['message']['content'].strip().upper().replace('.', '')
-
-        if "TAK" in answer or "YES" in answer:
-            return True
-        return False
+    # Zmniejszona, obrócona wg EXIF kopia JPEG zamiast oryginału w pełnej rozdzielczości
+    image_path, prepare_error = prepare_vision_image(file_path)
+    response = cached_chat_choice(
+        ollama,
+        MODEL_NAME,
+        messages=[{
+            'role': 'user',
+            'content': prompt,
+            'images': [str(image_path)]
+        }],
+        choices=AUDIT_CHOICES,
+        # Czas audytu to praktycznie sam prefill - odpowiedź ucinamy po kilku tokenach
+        options={'num_predict': AUDIT_NUM_PREDICT, 'temperature': 0},
+    )
+    return response['decision'], response['p_true'], prepare_error
 
-    except Exception as e:
-        print(f" ❌ Błąd API: {e}")
-        return None
+
+def is_uncertain(p_true):
+    return p_true is not None and UNCERTAIN_BAND[0] < p_true < UNCERTAIN_BAND[1]
 
 
 def main():
     base_path = Path(ROOT_FOLDER)
     rejected_path = base_path / REJECTED_FOLDER
+    review_path = base_path / REVIEW_FOLDER
 
     if not base_path.exists():
         print(f"❌ Folder '{ROOT_FOLDER}' nie istnieje!")
@@ -187,67 +246,85 @@ def main():
 
     processed_files = load_history()
     print(f"📂 Historia: {len(processed_files)} plików pominiętych.")
-    print(f"🚀 Start audytu wizualnego (Model: {MODEL_NAME})...")
+    print(f"🚀 Start audytu wizualnego (Model: {MODEL_NAME}, równolegle: {AUDIT_WORKERS})...")
 
-    # Pobieramy listę folderów w katalogu scans
-    subdirs = [d for d in base_path.iterdir() if d.is_dir()]
-
-    for folder in subdirs:
-        folder_name = folder.name
-
-        # 1. Pomijanie folderów specjalnych
-        if folder_name == REJECTED_FOLDER:
-            continue
+    # Prefiltr: już zaakceptowane pliki trafiają do indeksu duplikatów (pHash)
+    prefilter = ImagePrefilter()
+    audit_folders = list(iter_audit_folders(base_path))
+    for _, _, _, files in audit_folders:
+        for file_path in files:
+            rel_path_str = str(file_path.relative_to(base_path))
+            if rel_path_str in processed_files:
+                prefilter.register(file_path, rel_path_str)
+
+    def audit_items():
+        """Pliki do audytu w kolejności folderów; prefiltr liczony w wątku głównym przy zlecaniu."""
+        for folder, doc_name, doc_criteria, files in audit_folders:
+            for file_path in files:
+                rel_path_str = str(file_path.relative_to(base_path))
+
+                # Sprawdzenie historii
+                if rel_path_str in processed_files:
+                    continue
+
+                # Tanie lokalne sprawdzenia (milisekundy) przed modelem wizyjnym (sekundy)
+                rejection = prefilter.check(file_path, rel_path_str)
+                yield folder.name, doc_name, doc_criteria, file_path, rel_path_str, rejection
+
+    def audit(item):
+        _, doc_name, doc_criteria, file_path, _, rejection = item
+        if rejection is not None:
+            return None
+        return check_document_strict(file_path, doc_name, doc_criteria)
+
+    current_folder = None
+    pool = ThreadPoolExecutor(max_workers=AUDIT_WORKERS)
+    try:
+        for item, result, error in iter_ordered(pool, audit_items(), audit, AUDIT_MAX_IN_FLIGHT):
+            folder_name, doc_name, doc_criteria, file_path, rel_path_str, rejection = item
 
-        # 2. Pomijanie folderów "bezpiecznych" (np. documentScan - szybki zrzut)
-        if folder_name in SAFE_FOLDERS:
-            # print(f"⏩ Pomijam bezpieczny folder: {folder_name}")
-            continue
+            if folder_name != current_folder:
+                current_folder = folder_name
+                print(f"\n📂 Audyt folderu: [{folder_name}]")
 
-        # Pobieranie kryteriów z mapy
-        if folder_name in DOCUMENT_TYPES:
-            doc_name, doc_criteria = DOCUMENT_TYPES[folder_name]
-        else:
-            # Jeśli folderu nie ma w słowniku, można go pominąć lub użyć domyślnych
-            # print(f"⏩ Folder nieznany w systemie: {folder_name} (pomijam)")
-            continue
-
-        files = [f for f in folder.iterdir() if f.suffix.lower() in IMAGE_EXTENSIONS]
-        if not files:
-            continue
+            print(f"  👁️  Plik: {file_path.name}...", end="", flush=True)
 
-        print(f"\n📂 Audyt folderu: [{folder_name}]")
+            if rejection is not None:
+                reason, detail = rejection
+                print(f" 🗑️  ODRZUCONY (prefiltr: {reason} - {detail})")
+                reject_file(file_path, rejected_path, folder_name, rel_path_str, f"rejected:{reason}")
+                continue
 
-        for file_path in files:
-            rel_path_str = str(file_path.relative_to(base_path))
+            print(f" (Weryfikacja: {doc_name} -> {doc_criteria[:30]}...)", end="", flush=True)
 
-            # Sprawdzenie historii
-            if rel_path_str in processed_files:
+            if error is not None:
+                print(f" ❌ Błąd API: {error}")
+                print("     ⚠️ Błąd modelu (spróbujemy ponownie).")
                 continue
 
-            print(f"  👁️  Plik: {file_path.name}...", end="", flush=True)
-
-            is_valid = check_document_strict(file_path, doc_name, doc_criteria)
+            is_valid, p_true, prepare_error = result
+            if prepare_error is not None:
+                print(f" [!] Nie udało się przygotować obrazu ({prepare_error}) - wysłano oryginał.", end="")
+            confidence = f" (p={p_true:.2f})" if p_true is not None else ""
 
-            if is_valid is True:
-                print(" ✅ OK")
-                mark_as_done(rel_path_str)
+            if is_valid is None:
+                print(f" 🤔 BRAK ODPOWIEDZI TAK/NIE -> {REVIEW_FOLDER}")
+                reject_file(file_path, review_path, folder_name, rel_path_str, "review")
 
-            elif is_valid is False:
-                print(" 🗑️  ODRZUCONY")
+            elif is_uncertain(p_true):
+                print(f" 🤔 NIEPEWNE{confidence} -> {REVIEW_FOLDER}")
+                reject_file(file_path, review_path, folder_name, rel_path_str, "review")
 
-                # Przenoszenie
-                target_dir = rejected_path / folder_name
-                if not target_dir.exists():
-                    target_dir.mkdir(parents=True)
+            elif is_valid:
+                print(f" ✅ OK{confidence}")
+                mark_as_done(rel_path_str, "accepted")
 
-                try:
-                    shutil.move(str(file_path), str(target_dir / file_path.name))
-                    mark_as_done(rel_path_str)  # Oznaczamy jako przetworzony (usunięty)
-                except Exception as e:
-                    print(f"     [!] Błąd przenoszenia: {e}")
             else:
-                print(" ⚠️ Błąd modelu (spróbujemy ponownie).")
+                print(f" 🗑️  ODRZUCONY{confidence}")
+                reject_file(file_path, rejected_path, folder_name, rel_path_str)
+    finally:
+        # Przy przerwaniu nie czekamy na zlecone, a niewypisane audyty
+        pool.shutdown(wait=False, cancel_futures=True)
 
     print("\n✨ Zakończono.")
 
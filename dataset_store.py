@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+from collections import Counter
+from pathlib import Path
+
+import pyarrow as pa
+
+# --- KONFIGURACJA ---
+BASE_DIR = Path(__file__).resolve().parent
+PACKED_ROOT = BASE_DIR / "packed_dataset"
+REAL_SUBSET = "real"            # scans -> retrieve_multilang.py
+SYNTHETIC_SUBSET = "synthetic"  # synthetic_content -> process_syntethic_content.py
+
+SHARD_SIZE = 256        # Dokumentów na jeden plik .arrow
+COMPRESSION = "zstd"    # None = brak kompresji (pełne zero-copy przy mmap)
+INDEX_FILE = "_index.jsonl"
+
+META_FIELDS = ("content", "category", "type", "info")
+LANG_FIELDS = {"titles": "titles", "summary": "summaries"}  # katalog -> kolumna
+
+SCHEMA = pa.schema([
+    ("doc_id", pa.string()),    # Ścieżka względna, np. "invoice/invoice_3.txt"
+    ("folder", pa.string()),    # Folder źródłowy (typ z nazwy katalogu)
+    ("content", pa.string()),
+    ("category", pa.string()),
+    ("type", pa.string()),
+    ("info", pa.string()),
+    ("titles", pa.map_(pa.string(), pa.string())),     # kod języka -> tytuł
+    ("summaries", pa.map_(pa.string(), pa.string())),  # kod języka -> streszczenie
+    ("updated_at", pa.float64()),
+])
+
+
+def make_doc_id(sub_dir, filename):
+    return (Path(sub_dir) / filename).as_posix()
+
+
+def _empty_record(doc_id):
+    folder = Path(doc_id).parent.as_posix()
+    return {"doc_id": doc_id, "folder": "" if folder == "." else folder,
+            "content": None, "category": None, "type": None, "info": None,
+            "titles": {}, "summaries": {}}
+
+
+class DatasetWriter:
+    """
+    Dopisuje jeden rekord na dokument do skompresowanych shardów Arrow IPC.
+    Pola zbierane są przez put(), a commit() zamyka rekord dokumentu.
+    Indeks (_index.jsonl) jest dopisywany dopiero po zapisaniu shardu,
+    więc przerwany zapis nie psuje danych. Nowszy rekord nadpisuje starszy.
+    on_flush(klucze) jest wołane po trwałym zapisie shardu z kluczami przekazanymi
+    do commit() - np. żeby oznaczyć dokument jako zakończony dopiero, gdy jest na dysku.
+    """
+
+    def __init__(self, root, shard_size=SHARD_SIZE, on_flush=None):
+        self.root = Path(root)
+        self.shard_size = shard_size
+        self.on_flush = on_flush
+        self._open = {}
+        self._rows = []
+        self._keys = []
+
+    def put(self, doc_id, field, value, lang=None):
+        record = self._open.setdefault(doc_id, _empty_record(doc_id))
+        if field in LANG_FIELDS:
+            record[LANG_FIELDS[field]][lang] = str(value)
+        elif field in META_FIELDS:
+            record[field] = str(value)
+        else:
+            raise ValueError(f"Nieznane pole rekordu: {field}")
+
+    def commit(self, doc_id, key=None):
+        record = self._open.pop(doc_id, None)
+        if record is None:
+            return
+        record["updated_at"] = time.time()
+        self._rows.append(record)
+        if key is not None:
+            self._keys.append(key)
+        if len(self._rows) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        rows = self._rows
+        for row in rows:
+            row["titles"] = list(row["titles"].items())
+            row["summaries"] = list(row["summaries"].items())
+        table = pa.Table.from_pylist(rows, schema=SCHEMA)
+
+        shard_name = f"shard-{time.time_ns()}-{os.getpid()}.arrow"
+        tmp_path = self.root / (shard_name + ".tmp")
+        options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, SCHEMA, options=options) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self.root / shard_name)
+
+        with open(self.root / INDEX_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"shard": shard_name, "doc_ids": [r["doc_id"] for r in rows]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._rows = []
+        keys, self._keys = self._keys, []
+        if self.on_flush is not None and keys:
+            self.on_flush(keys)
+
+    def close(self):
+        """Zapisuje zatwierdzone rekordy; niezatwierdzone (przerwane) są odrzucane."""
+        self.flush()
+        self._open.clear()
+
+
+class DatasetReader:
+    """
+    Odczyt spakowanego zbioru przez memory-mapping shardów.
+    Dla każdego doc_id widoczna jest tylko najnowsza wersja rekordu.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.locations = {}  # doc_id -> (shard, wiersz)
+        self.shards = []
+        self.imported = False  # Czy w indeksie jest znacznik pełnego importu drzew .txt
+        self._warned = False
+        index_path = self.root / INDEX_FILE
+        if not index_path.exists():
+            return
+        with open(index_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Urwana ostatnia linia po awarii
+                if "import_complete" in entry:
+                    self.imported = True
+                    continue
+                self.shards.append(entry["shard"])
+                for row, doc_id in enumerate(entry["doc_ids"]):
+                    self.locations[doc_id] = (entry["shard"], row)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.locations
+
+    def exists(self):
+        """
+        Zbiór gotowy do użycia zamiast drzew .txt - dopiero po pełnym imporcie.
+        Same przyrostowe zapisy (nowe dokumenty z pipeline'ów) to tylko część korpusu.
+        """
+        if self.locations and not self.imported and not self._warned:
+            print(f"⚠️ {self.root}: spakowany zbiór niepełny (brak pełnego importu) - używam drzew .txt. "
+                  f"Uruchom: python dataset_store.py import")
+            self._warned = True
+        return self.imported and bool(self.locations)
+
+    def _read_shard(self, shard, columns=None):
+        source = pa.memory_map(str(self.root / shard), "r")
+        table = pa.ipc.open_file(source).read_all()
+        return table.select(columns) if columns else table
+
+    def table(self, columns=None):
+        """Tabela Arrow z najnowszymi rekordami (opcjonalnie tylko wybrane kolumny)."""
+        live_rows = {}
+        for shard, row in self.locations.values():
+            live_rows.setdefault(shard, []).append(row)
+
+        parts = []
+        for shard in self.shards:
+            rows = live_rows.pop(shard, None)
+            if rows:
+                parts.append(self._read_shard(shard, columns).take(sorted(rows)))
+        if not parts:
+            return SCHEMA.empty_table().select(columns) if columns else SCHEMA.empty_table()
+        return pa.concat_tables(parts)
+
+    def iter_records(self, columns=None):
+        for record in self.table(columns).to_pylist():
+            for field in ("titles", "summaries"):
+                if field in record and record[field] is not None:
+                    record[field] = dict(record[field])
+            yield record
+
+    def class_counts(self, field="folder"):
+        """Liczba dokumentów na klasę (domyślnie folder źródłowy) - bez czytania treści."""
+        return Counter(self.table([field]).column(field).to_pylist())
+
+    def documents_by_folder(self):
+        """{folder: {doc_id: treść}} - zamiennik chodzenia po drzewie content/."""
+        grouped = {}
+        for record in self.iter_records(["doc_id", "folder", "content"]):
+            grouped.setdefault(record["folder"], {})[record["doc_id"]] = record["content"]
+        return grouped
+
+
+# --- IMPORT ISTNIEJĄCYCH DRZEW .txt ---
+
+def _read(path):
+    return path.read_text(encoding="utf-8").strip() if path.exists() else None
+
+
+def import_trees(tree_root, packed_root, languages):
+    """
+    Jednorazowy import drzew content/titles/summary/category/type/info.
+    Obsługuje oba układy etykiet: titles/<lang>/<rel> oraz stary titles/<rel> (EN).
+    """
+    tree_root = Path(tree_root)
+    content_root = tree_root / "content"
+    if not content_root.exists():
+        print(f"⚠️ Brak {content_root} - pomijam.")
+        return 0
+
+    writer = DatasetWriter(packed_root)
+    count = 0
+    for txt_file in sorted(content_root.rglob("*.txt")):
+        rel_path = txt_file.relative_to(content_root)
+        doc_id = rel_path.as_posix()
+
+        writer.put(doc_id, "content", txt_file.read_text(encoding="utf-8"))
+        for field in ("category", "type", "info"):
+            value = _read(tree_root / field / rel_path)
+            if value is not None:
+                writer.put(doc_id, field, value)
+
+        for kind in LANG_FIELDS:
+            for lang in languages:
+                value = _read(tree_root / kind / lang / rel_path)
+                if value is None and lang == "en":
+                    value = _read(tree_root / kind / rel_path)
+                if value is not None:
+                    writer.put(doc_id, kind, value, lang=lang)
+
+        writer.commit(doc_id)
+        count += 1
+    writer.close()
+    mark_import_complete(packed_root, count)
+    return count
+
+
+def mark_import_complete(packed_root, count):
+    """Znacznik w indeksie: zbiór zawiera pełny import drzew (czytelnicy mogą z niego korzystać)."""
+    Path(packed_root).mkdir(parents=True, exist_ok=True)
+    with open(Path(packed_root) / INDEX_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"import_complete": True, "doc_count": count, "at": time.time()}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("Użycie: python dataset_store.py import")
+        return
+
+    languages = ["pl", "en", "de", "fr", "es", "it", "uk"]
+    sources = {
+        REAL_SUBSET: BASE_DIR,
+        SYNTHETIC_SUBSET: BASE_DIR / "synthetic_dataset",
+    }
+    for subset, tree_root in sources.items():
+        print(f"📦 Import [{subset}] z: {tree_root}")
+        count = import_trees(tree_root, PACKED_ROOT / subset, languages)
+        print(f"   ✅ Zaimportowano {count} dokumentów.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from transformers import AutoTokenizer
+
+# --- CONFIGURATION ---
+CLASSIFIER_DIR = Path(__file__).resolve().parent
+BATCH_MODEL_PATH = CLASSIFIER_DIR / "document_type_classifier_batch.tflite"  # Dynamic batch (preferred)
+FLUTTER_MODEL_PATH = CLASSIFIER_DIR / "document_type_classifier.tflite"     # Fixed [1, MAX_LEN]
+LABELS_PATH = CLASSIFIER_DIR / "document_type_labels.txt"
+
+# Must match classifier_training.py
+MODEL_ID = "distilbert-base-multilingual-cased"
+MAX_LEN = 256
+
+BATCH_SIZE = 32
+SORT_WINDOW = 1024  # Texts sorted by length within this window to minimise padding
+NUM_THREADS = os.cpu_count() or 1
+
+
+def load_labels(path=LABELS_PATH):
+    return Path(path).read_text(encoding="utf-8").splitlines()
+
+
+def _softmax(logits):
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class DocumentClassifier:
+    """
+    Batched TFLite inference for the document type classifier.
+    With the dynamic-batch export, each batch is padded to its longest text and
+    the interpreter is resized only when the batch shape changes. The fixed
+    Flutter export ([1, MAX_LEN]) is supported as a fallback, one text at a time.
+    """
+
+    def __init__(self, model_path=None, labels_path=LABELS_PATH, num_threads=NUM_THREADS):
+        if model_path is None:
+            model_path = BATCH_MODEL_PATH if BATCH_MODEL_PATH.exists() else FLUTTER_MODEL_PATH
+        self.model_path = Path(model_path)
+        self.labels = load_labels(labels_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_ID, use_fast=True)
+
+        self.interpreter = tf.lite.Interpreter(model_path=str(self.model_path), num_threads=num_threads)
+        self.inputs = {detail["name"]: detail for detail in self.interpreter.get_input_details()}
+        self.output = self.interpreter.get_output_details()[0]
+        self.dynamic = any(-1 in detail["shape_signature"] for detail in self.inputs.values())
+        self._shape = None
+        if not self.dynamic:
+            self.interpreter.allocate_tensors()
+
+    def _input(self, name):
+        return next(detail for key, detail in self.inputs.items() if name in key)
+
+    def _run(self, input_ids, attention_mask):
+        if self.dynamic and input_ids.shape != self._shape:
+            for name in ("input_ids", "attention_mask"):
+                self.interpreter.resize_tensor_input(self._input(name)["index"], input_ids.shape)
+            self.interpreter.allocate_tensors()
+            self._shape = input_ids.shape
+
+        self.interpreter.set_tensor(self._input("input_ids")["index"], input_ids)
+        if any("attention_mask" in key for key in self.inputs):
+            self.interpreter.set_tensor(self._input("attention_mask")["index"], attention_mask)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output["index"])
+
+    def classify_batch(self, texts):
+        """[(label, confidence), ...] in input order."""
+        if self.dynamic:
+            encoded = self.tokenizer(texts, truncation=True, max_length=MAX_LEN, padding="longest",
+                                     return_tensors="np")
+            logits = self._run(encoded["input_ids"].astype(np.int32), encoded["attention_mask"].astype(np.int32))
+        else:
+            encoded = self.tokenizer(texts, truncation=True, max_length=MAX_LEN, padding="max_length",
+                                     return_tensors="np")
+            logits = np.concatenate([
+                self._run(encoded["input_ids"][i:i + 1].astype(np.int32),
+                          encoded["attention_mask"][i:i + 1].astype(np.int32))
+                for i in range(len(texts))
+            ])
+
+        probs = _softmax(logits)
+        best = probs.argmax(axis=-1)
+        return [(self.labels[i], float(probs[row, i])) for row, i in enumerate(best)]
+
+    def classify(self, items, batch_size=BATCH_SIZE):
+        """
+        Classifies a stream of (id, text) pairs. Within each window of SORT_WINDOW
+        texts, batches are formed from texts of similar length; results are
+        yielded in input order as (id, label, confidence).
+        """
+        window = []
+        for item in items:
+            window.append(item)
+            if len(window) >= SORT_WINDOW:
+                yield from self._classify_window(window, batch_size)
+                window = []
+        if window:
+            yield from self._classify_window(window, batch_size)
+
+    def _classify_window(self, window, batch_size):
+        order = sorted(range(len(window)), key=lambda i: len(window[i][1]))
+        results = [None] * len(window)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, prediction in zip(batch, self.classify_batch([window[i][1] for i in batch])):
+                results[i] = prediction
+        for (item_id, _), (label, confidence) in zip(window, results):
+            yield item_id, label, confidence
+
+
+# --- INPUT SOURCES ---
+def iter_directory(directory):
+    directory = Path(directory)
+    for text_file in sorted(directory.rglob("*.txt")):
+        yield text_file.relative_to(directory).as_posix(), text_file.read_text(encoding="utf-8")
+
+
+def iter_stream(stream):
+    """JSONL ({"id": ..., "text": ...}) or plain text, one document per line."""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if isinstance(record, dict) and "text" in record:
+                yield record.get("id", line_no), record["text"]
+                continue
+        except json.JSONDecodeError:
+            pass
+        yield line_no, line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch document type classification (TFLite).")
+    parser.add_argument("source", help="Directory with .txt files, or '-' to read texts from stdin")
+    parser.add_argument("--model", type=Path, help="Default: batch export, else the Flutter export")
+    parser.add_argument("--labels", type=Path, default=LABELS_PATH)
+    parser.add_argument("--threads", type=int, default=NUM_THREADS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--output", type=Path, help="JSONL output (default: stdout)")
+    args = parser.parse_args()
+
+    classifier = DocumentClassifier(args.model, args.labels, args.threads)
+    mode = "dynamic batch" if classifier.dynamic else "fixed [1, MAX_LEN]"
+    print(f"🚀 {classifier.model_path.name} ({mode}), {args.threads} threads", file=sys.stderr)
+
+    items = iter_stream(sys.stdin) if args.source == "-" else iter_directory(args.source)
+    output = args.output.open("w", encoding="utf-8") if args.output else sys.stdout
+
+    count = 0
+    start = time.perf_counter()
+    try:
+        for item_id, label, confidence in classifier.classify(items, args.batch_size):
+            output.write(json.dumps({"id": item_id, "label": label, "confidence": round(confidence, 4)},
+                                    ensure_ascii=False) + "\n")
+            count += 1
+            if count % 1000 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"  📦 {count} documents ({count / elapsed:.1f} docs/s)", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ {count} documents in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} docs/s, "
+          f"batch {args.batch_size}, {args.threads} threads)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import sys
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from collections import Counter
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import classification_report
+from sklearn.preprocessing import LabelEncoder
+from transformers import AutoTokenizer, TFDistilBertForSequenceClassification
+
+# --- 1. PATH CONFIGURATION ---
+CLASSIFIER_DIR = Path(__file__).resolve().parent
+BASE_DIR = CLASSIFIER_DIR.parent
+DATA_ROOT = BASE_DIR / "content"
+LABEL_ROOT = BASE_DIR / "synthetic_dataset" / "type"
+
+# Packed dataset (dataset_store.py) - used instead of the .txt trees when present
+sys.path.append(str(BASE_DIR))
+from dataset_store import DatasetReader, PACKED_ROOT, REAL_SUBSET, SYNTHETIC_SUBSET  # noqa: E402
+from near_duplicates import find_leakage  # noqa: E402
+
+TFLITE_OUTPUT = CLASSIFIER_DIR / "document_type_classifier.tflite"
+TFLITE_BATCH_OUTPUT = CLASSIFIER_DIR / "document_type_classifier_batch.tflite"  # Offline batch inference
+LABELS_OUTPUT = CLASSIFIER_DIR / "document_type_labels.txt"
+
+# Model Parameters
+MODEL_ID = "distilbert-base-multilingual-cased"
+MIN_SAMPLES_PER_CLASS = 2
+MAX_LEN = 256
+BATCH_SIZE = 16
+EPOCHS = 10
+VALIDATION_SPLIT = 0.20
+SPLIT_SEED = 42
+
+# tf.data pipeline
+TOKENIZE_CHUNK = 256                 # Texts per fast-tokenizer call
+LENGTH_BUCKETS = (64, 128, 192)      # Batches are padded to the longest text in their bucket
+SHUFFLE_BUFFER = 2048
+
+
+# --- 2. DATA LOADING ---
+def load_packed_data(content_reader, label_reader):
+    labels_by_id = {r["doc_id"]: r["type"] for r in label_reader.iter_records(["doc_id", "type"])}
+    texts, labels = [], []
+    for record in content_reader.iter_records(["doc_id", "content"]):
+        content = (record["content"] or "").strip()
+        label = (labels_by_id.get(record["doc_id"]) or "").strip().lower()
+        if content and label:
+            texts.append(content)
+            labels.append(label)
+    return texts, labels
+
+
+def load_data():
+    content_reader = DatasetReader(PACKED_ROOT / REAL_SUBSET)
+    label_reader = DatasetReader(PACKED_ROOT / SYNTHETIC_SUBSET)
+    if content_reader.exists() and label_reader.exists():
+        print(f"📦 Loading packed dataset from: {PACKED_ROOT}")
+        return load_packed_data(content_reader, label_reader)
+
+    texts, labels = [], []
+    print(f"📂 Loading data from: {DATA_ROOT}")
+    if not DATA_ROOT.exists():
+        print("❌ ERROR: Data folder not found!")
+        return [], []
+
+    for text_file in DATA_ROOT.rglob("*.txt"):
+        rel_path = text_file.relative_to(DATA_ROOT)
+        label_file = LABEL_ROOT / rel_path
+        if label_file.exists():
+            content = text_file.read_text(encoding="utf-8").strip()
+            label = label_file.read_text(encoding="utf-8").strip().lower()
+            if content and label:
+                texts.append(content)
+                labels.append(label)
+    return texts, labels
+
+
+def filter_rare_classes(texts, labels, min_samples=MIN_SAMPLES_PER_CLASS):
+    counts = Counter(labels)
+    valid_classes = {cls for cls, count in counts.items() if count >= min_samples}
+    kept = [(t, l) for t, l in zip(texts, labels) if l in valid_classes]
+    return [t for t, _ in kept], [l for _, l in kept]
+
+
+# --- 3. TF.DATA PIPELINE ---
+def load_tokenizer():
+    # Fast (Rust) tokenizer - batched calls are an order of magnitude quicker than DistilBertTokenizer
+    return AutoTokenizer.from_pretrained(MODEL_ID, use_fast=True)
+
+
+def make_dataset(texts, labels, tokenizer, batch_size=BATCH_SIZE, training=False, cache_path=""):
+    """
+    Streaming pipeline: texts are tokenized in chunks (no padding), cached as
+    variable-length token ids, bucketed by length, padded per batch and prefetched.
+    cache_path="" keeps the cache in memory; a file path caches on disk.
+    """
+    def generate():
+        for start in range(0, len(texts), TOKENIZE_CHUNK):
+            chunk = texts[start:start + TOKENIZE_CHUNK]
+            encoded = tokenizer(chunk, truncation=True, max_length=MAX_LEN)["input_ids"]
+            for ids, label in zip(encoded, labels[start:start + TOKENIZE_CHUNK]):
+                yield np.asarray(ids, dtype=np.int32), np.int32(label)
+
+    dataset = tf.data.Dataset.from_generator(generate, output_signature=(
+        tf.TensorSpec([None], tf.int32),
+        tf.TensorSpec([], tf.int32),
+    )).cache(str(cache_path))
+
+    if training:
+        dataset = dataset.shuffle(SHUFFLE_BUFFER, seed=SPLIT_SEED, reshuffle_each_iteration=True)
+
+    pad_id = tokenizer.pad_token_id
+    dataset = dataset.bucket_by_sequence_length(
+        element_length_func=lambda ids, label: tf.shape(ids)[0],
+        bucket_boundaries=list(LENGTH_BUCKETS),
+        bucket_batch_sizes=[batch_size] * (len(LENGTH_BUCKETS) + 1),
+        padding_values=(pad_id, 0),
+    )
+    dataset = dataset.map(
+        lambda ids, label: ({"input_ids": ids, "attention_mask": tf.cast(ids != pad_id, tf.int32)}, label),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+# --- 4. TRAINING ---
+def build_model(num_labels):
+    print("🏗️ Initializing DistilBERT...")
+    model = TFDistilBertForSequenceClassification.from_pretrained(MODEL_ID, num_labels=num_labels, from_pt=True)
+    optimizer = tf.keras.optimizers.legacy.Adam(learning_rate=3e-5)
+    model.compile(
+        optimizer=optimizer,
+        loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+        metrics=['accuracy']
+    )
+    return model
+
+
+def prepare_data(texts=None, labels=None):
+    """Filtered, label-encoded, stratified split. Saves the label list for the Flutter app."""
+    if texts is None:
+        texts, labels = load_data()
+    texts, labels = filter_rare_classes(texts, labels)
+    print(f"✅ Loaded {len(texts)} documents across {len(set(labels))} categories.")
+
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(labels)
+    with open(LABELS_OUTPUT, "w", encoding="utf-8") as f:
+        f.write("\n".join(label_encoder.classes_))
+
+    train_texts, val_texts, train_labels, val_labels = train_test_split(
+        texts, y, test_size=VALIDATION_SPLIT, random_state=SPLIT_SEED, stratify=y
+    )
+    leaks = find_leakage(train_texts, val_texts)
+    if leaks:
+        print(f"⚠️ Leakage: {len(leaks)}/{len(val_texts)} validation documents are near-duplicates "
+              f"of training documents (MinHash).")
+    return label_encoder, (train_texts, train_labels), (val_texts, val_labels)
+
+
+def train(epochs=EPOCHS, batch_size=BATCH_SIZE, texts=None, labels=None):
+    """Full training run. Returns (model, history, label_encoder, val_dataset)."""
+    label_encoder, (train_texts, train_labels), (val_texts, val_labels) = prepare_data(texts, labels)
+
+    tokenizer = load_tokenizer()
+    train_dataset = make_dataset(train_texts, train_labels, tokenizer, batch_size, training=True)
+    val_dataset = make_dataset(val_texts, val_labels, tokenizer, batch_size)
+
+    model = build_model(len(label_encoder.classes_))
+
+    print("\n🚀 Starting Training...")
+    history = model.fit(train_dataset, validation_data=val_dataset, epochs=epochs)
+    return model, history, label_encoder, val_dataset
+
+
+def collect_predictions(model, dataset):
+    """(y_true, y_pred) - labels are read from the dataset, since bucketing reorders examples."""
+    y_true, y_pred = [], []
+    for features, labels in dataset:
+        logits = model(features, training=False).logits
+        y_true.extend(labels.numpy().tolist())
+        y_pred.extend(np.argmax(logits, axis=1).tolist())
+    return np.array(y_true), np.array(y_pred)
+
+
+# --- 5. TFLITE CONVERSION ---
+def export_tflite(model, output=TFLITE_OUTPUT):
+    print("\n🔧 Converting to TFLite (Flutter compatibility mode)...")
+
+    @tf.function(input_signature=[tf.TensorSpec([1, MAX_LEN], tf.int32, name="input_ids")])
+    def serving_fn(input_ids):
+        return model(input_ids, training=False)
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([serving_fn.get_concrete_function()], model)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    converter.optimizations = []  # Disable optimizations to prevent opcode version issues in Flutter
+    converter.target_spec.supported_types = [tf.float32]
+
+    tflite_model = converter.convert()
+    with Path(output).open("wb") as f:
+        f.write(tflite_model)
+
+    print(f"✨ SUCCESS! Model saved as {output}")
+
+
+def export_tflite_batched(model, output=TFLITE_BATCH_OUTPUT):
+    """Dynamic [batch, length] export with attention mask, for classifier_inference.py."""
+    print("\n🔧 Converting to TFLite (dynamic batch)...")
+
+    @tf.function(input_signature=[
+        tf.TensorSpec([None, None], tf.int32, name="input_ids"),
+        tf.TensorSpec([None, None], tf.int32, name="attention_mask"),
+    ])
+    def serving_fn(input_ids, attention_mask):
+        return {"logits": model(input_ids=input_ids, attention_mask=attention_mask, training=False).logits}
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([serving_fn.get_concrete_function()], model)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+
+    tflite_model = converter.convert()
+    with Path(output).open("wb") as f:
+        f.write(tflite_model)
+
+    print(f"✨ SUCCESS! Model saved as {output}")
+
+
+def main():
+    """Headless run: train, print the validation report and export the TFLite model."""
+    model, history, label_encoder, val_dataset = train()
+
+    y_true, y_pred = collect_predictions(model, val_dataset)
+    present = sorted(set(y_true) | set(y_pred))
+    print(classification_report(y_true, y_pred, labels=present,
+                                target_names=[label_encoder.classes_[i] for i in present], zero_division=0))
+
+    export_tflite(model)
+    export_tflite_batched(model)
+
+
+if __name__ == "__main__":
+    main()
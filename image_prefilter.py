@@ -0,0 +1,178 @@
+import numpy as np
+from PIL import Image, ImageOps
+from cache_store import CACHE_DIR, DiskCache, make_key
+
+# --- KONFIGURACJA ---
+MIN_SHORT_EDGE = 500          # Krótszy bok w px - mniejsze to miniatury
+BLUR_THRESHOLD = 60.0         # Wariancja Laplasjanu (po zmniejszeniu do ANALYSIS_LONG_EDGE) - niżej = rozmazane
+ANALYSIS_LONG_EDGE = 1024     # Analiza na zmniejszonej kopii (milisekundy zamiast dekodowania 12 MP)
+PHASH_MAX_DISTANCE = 6        # Maks. odległość Hamminga 64-bitowych pHash dla duplikatu
+
+# Heurystyki zrzutów ekranu
+SCREENSHOT_NAME_HINTS = ("screenshot", "screen shot", "screen_", "zrzut", "scr_")
+SCREEN_ASPECTS = (16 / 9, 16 / 10, 18 / 9, 19 / 9, 19.5 / 9, 20 / 9)
+SCREEN_ASPECT_TOLERANCE = 0.02
+UI_BAR_FRACTION = 0.04        # Wysokość sprawdzanego pasa (góra/dół) jako ułamek wysokości obrazu
+UI_BAR_MAX_STD = 3.0          # Wiersz "jednolity", gdy odchylenie jasności jest mniejsze
+UI_BAR_MIN_UNIFORM = 0.6      # Ułamek jednolitych wierszy w pasie
+UI_BAR_MAX_BRIGHTNESS = 230   # Jasny pas to raczej margines kartki niż pasek interfejsu
+
+PREFILTER_CACHE_FILE = CACHE_DIR / "image_prefilter.sqlite"
+PREFILTER_VERSION = 1  # Zmiana metryk = podbić wersję (unieważnia cache)
+
+# Kody powodów odrzucenia
+REASON_DUPLICATE = "duplicate"
+REASON_LOW_RESOLUTION = "low_resolution"
+REASON_BLURRY = "blurry"
+REASON_SCREENSHOT = "screenshot"
+
+EXIF_MAKE, EXIF_MODEL = 0x010F, 0x0110
+
+_DCT_SIZE = 32
+_DCT = np.cos(np.pi * np.outer(np.arange(_DCT_SIZE), 2 * np.arange(_DCT_SIZE) + 1) / (2 * _DCT_SIZE))
+
+
+def phash(image):
+    """64-bitowy perceptual hash (DCT 32x32, niskie częstotliwości 8x8 względem mediany)."""
+    small = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ small @ _DCT.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def laplacian_variance(gray):
+    """Ostrość: wariancja dyskretnego Laplasjanu (mała = brak krawędzi = rozmazane)."""
+    lap = gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * gray[1:-1, 1:-1]
+    return float(lap.var())
+
+
+def _has_ui_bar(gray):
+    band = max(2, int(gray.shape[0] * UI_BAR_FRACTION))
+    for strip in (gray[:band], gray[-band:]):
+        uniform = (strip.std(axis=1) < UI_BAR_MAX_STD).mean()
+        if uniform >= UI_BAR_MIN_UNIFORM and strip.mean() < UI_BAR_MAX_BRIGHTNESS:
+            return True
+    return False
+
+
+def looks_like_screenshot(file_path, width, height, has_camera_exif, gray):
+    """Nazwa pliku, brak EXIF aparatu + proporcje ekranu + jednolity pasek interfejsu."""
+    name = file_path.name.lower()
+    if any(hint in name for hint in SCREENSHOT_NAME_HINTS):
+        return True
+    if has_camera_exif:
+        return False
+    aspect = max(width, height) / min(width, height)
+    if not any(abs(aspect - screen) < SCREEN_ASPECT_TOLERANCE for screen in SCREEN_ASPECTS):
+        return False
+    return _has_ui_bar(gray)
+
+
+def analyze_image(file_path):
+    """Metryki obrazu (wymiary, pHash, ostrość, zrzut ekranu) albo None, gdy nie da się go zdekodować."""
+    try:
+        with Image.open(file_path) as image:
+            exif = image.getexif()
+            has_camera_exif = EXIF_MAKE in exif or EXIF_MODEL in exif
+            image = ImageOps.exif_transpose(image)
+            width, height = image.size
+            image.thumbnail((ANALYSIS_LONG_EDGE, ANALYSIS_LONG_EDGE))
+            gray = np.asarray(image.convert("L"), dtype=np.float64)
+            return {
+                "width": width,
+                "height": height,
+                "phash": f"{phash(image):016x}",
+                "blur": laplacian_variance(gray),
+                "screenshot": looks_like_screenshot(file_path, width, height, has_camera_exif, gray),
+            }
+    except Exception:
+        return None
+
+
+class PhashIndex:
+    """
+    Indeks pHash do wyszukiwania bliskich duplikatów. Hash dzielony jest na
+    PHASH_MAX_DISTANCE + 1 pasm: przy odległości <= PHASH_MAX_DISTANCE
+    co najmniej jedno pasmo musi być identyczne (zasada szufladkowa).
+    """
+
+    def __init__(self, max_distance=PHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        self._bounds = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+        self._buckets = [{} for _ in self._bounds]
+
+    def _keys(self, value):
+        for (start, end), bucket in zip(self._bounds, self._buckets):
+            yield bucket, (value >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, value, ref):
+        for bucket, key in self._keys(value):
+            bucket.setdefault(key, []).append((value, ref))
+
+    def find(self, value):
+        """Najbliższy zarejestrowany obraz w zasięgu max_distance: (ref, odległość) albo None."""
+        best = None
+        for bucket, key in self._keys(value):
+            for other, ref in bucket.get(key, ()):
+                distance = hamming(value, other)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (ref, distance)
+        return best
+
+
+class ImagePrefilter:
+    """
+    Szybki lokalny filtr przed modelem wizyjnym: duplikaty (pHash w całym drzewie),
+    rozdzielczość, rozmycie i zrzuty ekranu. Metryki są cache'owane po ścieżce,
+    rozmiarze i dacie modyfikacji pliku.
+    """
+
+    def __init__(self, cache_path=PREFILTER_CACHE_FILE):
+        self.cache = DiskCache(cache_path)
+        self.index = PhashIndex()
+
+    def metrics(self, file_path):
+        stat = file_path.stat()
+        key = make_key("prefilter", PREFILTER_VERSION, str(file_path.resolve()), stat.st_size, stat.st_mtime_ns)
+        metrics = self.cache.get_json(key)
+        if metrics is None:
+            metrics = analyze_image(file_path)
+            if metrics is not None:
+                self.cache.set_json(key, metrics)
+        return metrics
+
+    def register(self, file_path, ref):
+        """Dodaje obraz (np. już zaakceptowany) do indeksu duplikatów."""
+        metrics = self.metrics(file_path)
+        if metrics is not None:
+            self.index.add(int(metrics["phash"], 16), ref)
+
+    def check(self, file_path, ref):
+        """
+        (kod_powodu, szczegóły) dla obrazu do odrzucenia albo None. Obrazy, które
+        przeszły, trafiają do indeksu duplikatów. Nieczytelne (np. HEIC bez
+        dekodera) przepuszczamy - oceni je model.
+        """
+        metrics = self.metrics(file_path)
+        if metrics is None:
+            return None
+
+        if min(metrics["width"], metrics["height"]) < MIN_SHORT_EDGE:
+            return REASON_LOW_RESOLUTION, f"{metrics['width']}x{metrics['height']}"
+        if metrics["screenshot"]:
+            return REASON_SCREENSHOT, "heurystyka zrzutu ekranu"
+        if metrics["blur"] < BLUR_THRESHOLD:
+            return REASON_BLURRY, f"wariancja Laplasjanu {metrics['blur']:.1f}"
+
+        value = int(metrics["phash"], 16)
+        match = self.index.find(value)
+        if match is not None:
+            return REASON_DUPLICATE, f"{match[0]} (odległość {match[1]})"
+
+        self.index.add(value, ref)
+        return None
@@ -0,0 +1,52 @@
+import os
+import threading
+from PIL import Image, ImageOps
+from cache_store import CACHE_DIR, make_key, file_sha256
+
+# HEIC/HEIF (zdjęcia z iPhone'a) - opcjonalnie, jeśli zainstalowano pillow-heif
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+# --- KONFIGURACJA ---
+VISION_LONG_EDGE = 1120       # Dłuższy bok po zmniejszeniu (model i tak skaluje do kafelków 560 px)
+VISION_JPEG_QUALITY = 85
+VISION_CACHE_DIR = CACHE_DIR / "vision_images"
+
+
+def prepare_vision_image(file_path, long_edge=VISION_LONG_EDGE, quality=VISION_JPEG_QUALITY):
+    """
+    Dekoduje obraz raz, obraca wg EXIF, zmniejsza do `long_edge` i zapisuje jako
+    kompaktowy JPEG. Wynik jest cache'owany po hashu treści pliku i ustawieniach.
+    Zwraca (ścieżka, błąd): przygotowany obraz i None albo oryginał i błąd, gdy nie da się
+    go zdekodować. Wywoływana z wątków roboczych - nic nie wypisuje, komunikat zostawia wywołującemu.
+    """
+    key = make_key("vision", file_sha256(file_path), long_edge, quality)
+    target = VISION_CACHE_DIR / f"{key}.jpg"
+    if target.exists():
+        return target, None
+
+    try:
+        with Image.open(file_path) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                # Przezroczystość na białe tło (jak kartka papieru)
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            else:
+                image = image.convert("RGB")
+            image.thumbnail((long_edge, long_edge), Image.LANCZOS)
+
+            VISION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(f"{target.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+            image.save(tmp_path, "JPEG", quality=quality, optimize=True)
+            os.replace(tmp_path, target)
+    except Exception as e:
+        return file_path, e
+
+    return target, None
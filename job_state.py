@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from cache_store import make_key
+
+# --- KONFIGURACJA ---
+BASE_DIR = Path(__file__).resolve().parent
+JOB_STATE_FILE = BASE_DIR / "job_state.sqlite"
+
+DONE_STAGE = "done"  # Cały dokument przetworzony (odpowiednik wpisu w starym pliku historii)
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+def make_fingerprint(*parts):
+    """Odcisk wejść etapu (hash źródła, wersja promptu, model, język...)."""
+    return make_key(*parts)
+
+
+def output_hash(output):
+    if output is None:
+        return None
+    return hashlib.sha256(output.encode("utf-8")).hexdigest()
+
+
+class JobState:
+    """
+    Transakcyjny stan przetwarzania (SQLite, WAL): status, czas i hash wyniku
+    dla każdej pary (dokument, etap) w danym pipeline. Wynik etapu jest
+    przechowywany, więc wznowienie zaczyna się od pierwszego niedokończonego etapu.
+    Etap zapisany z innym odciskiem (fingerprint) wejść jest traktowany jako nieaktualny.
+    Etap bez odcisku (baza sprzed odcisków) uznajemy za aktualny - nie znamy jego wejść,
+    a przeliczanie całego archiwum to nie "zmiana wejść". Przy pierwszym sprawdzeniu
+    dostaje bieżący odcisk, więc późniejsza prawdziwa zmiana promptu/modelu/źródła go unieważni.
+    """
+
+    def __init__(self, pipeline, path=JOB_STATE_FILE):
+        self.pipeline = pipeline
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stages (
+                    pipeline TEXT NOT NULL,
+                    doc TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    duration REAL,
+                    output TEXT,
+                    output_hash TEXT,
+                    error TEXT,
+                    fingerprint TEXT,
+                    PRIMARY KEY (pipeline, doc, stage)
+                )""")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(stages)")}
+            if "fingerprint" not in columns:  # Baza sprzed odcisków wejść
+                conn.execute("ALTER TABLE stages ADD COLUMN fingerprint TEXT")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS migrations (
+                    pipeline TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    imported_at REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (pipeline, source)
+                )""")
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, doc, stage):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT status, output, output_hash, duration, error, fingerprint FROM stages "
+                "WHERE pipeline = ? AND doc = ? AND stage = ?",
+                (self.pipeline, doc, stage)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("status", "output", "output_hash", "duration", "error", "fingerprint"), row))
+
+    def _is_current(self, doc, stage, stored, fingerprint):
+        """Porównuje odciski; brak zapisanego odcisku = aktualny (i uzupełniany bieżącym)."""
+        if fingerprint is None or stored == fingerprint:
+            return True
+        if stored is not None:
+            return False
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE stages SET fingerprint = ? WHERE pipeline = ? AND doc = ? AND stage = ? "
+                "AND fingerprint IS NULL",
+                (fingerprint, self.pipeline, doc, stage))
+            conn.commit()
+        return True
+
+    def is_done(self, doc, stage, fingerprint=None):
+        """Etap zakończony (i, jeśli podano fingerprint, policzony z tych samych wejść) - bez czytania wyniku."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT status, fingerprint FROM stages WHERE pipeline = ? AND doc = ? AND stage = ?",
+                (self.pipeline, doc, stage)).fetchone()
+        if row is None or row[0] != STATUS_DONE:
+            return False
+        return self._is_current(doc, stage, row[1], fingerprint)
+
+    def output(self, doc, stage, fingerprint=None):
+        """Zapisany wynik aktualnego, zakończonego etapu albo None."""
+        entry = self.get(doc, stage)
+        if entry is None or entry["status"] != STATUS_DONE:
+            return None
+        if not self._is_current(doc, stage, entry["fingerprint"], fingerprint):
+            return None
+        return entry["output"]
+
+    def result(self, doc, stage, fingerprint=None):
+        """Zapisany wynik (JSON) aktualnego, zakończonego etapu albo None."""
+        stored = self.output(doc, stage, fingerprint)
+        return None if stored is None else json.loads(stored)
+
+    def finish_result(self, doc, stage, result, fingerprint=None):
+        self.finish(doc, stage, json.dumps(result, ensure_ascii=False), fingerprint=fingerprint)
+
+    def start(self, doc, stage):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO stages (pipeline, doc, stage, status, started_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.pipeline, doc, stage, STATUS_RUNNING, time.time()))
+            conn.commit()
+
+    def finish(self, doc, stage, output=None, digest=None, fingerprint=None):
+        """Zamyka etap; digest nadpisuje hash wyniku (np. gdy output to tylko nazwa pliku)."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT started_at FROM stages WHERE pipeline = ? AND doc = ? AND stage = ?",
+                (self.pipeline, doc, stage)).fetchone()
+            started_at = row[0] if row and row[0] is not None else now
+            conn.execute(
+                "INSERT OR REPLACE INTO stages "
+                "(pipeline, doc, stage, status, started_at, finished_at, duration, output, output_hash, fingerprint) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.pipeline, doc, stage, STATUS_DONE, started_at, now, now - started_at,
+                 output, digest or output_hash(output), fingerprint))
+            conn.commit()
+
+    def fail(self, doc, stage, error):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE stages SET status = ?, finished_at = ?, error = ? "
+                "WHERE pipeline = ? AND doc = ? AND stage = ?",
+                (STATUS_FAILED, time.time(), str(error), self.pipeline, doc, stage))
+            conn.commit()
+
+    def run(self, doc, stage, fn, fingerprint=None):
+        """
+        Zwraca zapisany wynik etapu albo wykonuje fn() i go zapisuje.
+        Wynik jest serializowany do JSON; None oznacza porażkę (etap do powtórki).
+        Przy zmienionym fingerprint zapisany wynik jest nieaktualny i liczony od nowa.
+        """
+        stored = self.result(doc, stage, fingerprint)
+        if stored is not None:
+            return stored
+
+        self.start(doc, stage)
+        try:
+            result = fn()
+        except Exception as e:
+            self.fail(doc, stage, e)
+            raise
+        if result is None:
+            self.fail(doc, stage, "Brak wyniku")
+            return None
+        self.finish_result(doc, stage, result, fingerprint)
+        return result
+
+    def done_docs(self, stage=DONE_STAGE):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT doc FROM stages WHERE pipeline = ? AND stage = ? AND status = ?",
+                (self.pipeline, stage, STATUS_DONE)).fetchall()
+        return {row[0] for row in rows}
+
+    def staged_docs(self, stage):
+        """Dokumenty z jakimkolwiek wpisem etapu `stage` (niezależnie od statusu)."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT doc FROM stages WHERE pipeline = ? AND stage = ?",
+                (self.pipeline, stage)).fetchall()
+        return {row[0] for row in rows}
+
+    def migrate_history_file(self, history_file, stage=DONE_STAGE):
+        """
+        Jednorazowy import starego pliku historii (jedna ścieżka na linię):
+        każdy wpis staje się zakończonym etapem `stage`. Zwraca liczbę wpisów.
+        """
+        history_file = Path(history_file)
+        if not history_file.exists():
+            return 0
+        source = str(history_file.resolve())
+
+        with self._lock:
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM migrations WHERE pipeline = ? AND source = ?",
+                            (self.pipeline, source)).fetchone():
+                return 0
+
+            with open(history_file, "r", encoding="utf-8") as f:
+                docs = {line.strip() for line in f if line.strip()}
+            now = time.time()
+            conn.executemany(
+                "INSERT OR IGNORE INTO stages (pipeline, doc, stage, status, finished_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(self.pipeline, doc, stage, STATUS_DONE, now) for doc in docs])
+            conn.execute("INSERT INTO migrations (pipeline, source, imported_at, count) VALUES (?, ?, ?, ?)",
+                         (self.pipeline, source, now, len(docs)))
+            conn.commit()
+        return len(docs)
@@ -0,0 +1,158 @@
+import re
+import math
+import hashlib
+import threading
+
+from cache_store import CACHE_DIR, DiskCache, make_key, file_sha256
+
+# --- KONFIGURACJA ---
+LLM_CACHE_FILE = CACHE_DIR / "llm_cache.sqlite"
+LLM_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+_cache = None
+_cache_lock = threading.Lock()  # Pierwsze wywołanie może przyjść naraz z kilku wątków roboczych
+
+
+def get_llm_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DiskCache(LLM_CACHE_FILE, max_bytes=LLM_CACHE_MAX_BYTES)
+    return _cache
+
+
+def _llm_params(llm):
+    """Model i opcje generowania obiektu OllamaLLM (część klucza cache)."""
+    params = getattr(llm, "_identifying_params", None)
+    if params:
+        return dict(params)
+    return {"model": getattr(llm, "model", None), "temperature": getattr(llm, "temperature", None)}
+
+
+def _image_digest(image):
+    if isinstance(image, (bytes, bytearray)):
+        return hashlib.sha256(bytes(image)).hexdigest()
+    return file_sha256(image)
+
+
+def cached_invoke(llm, prompt, bypass=False, key_extra=None, **kwargs):
+    """
+    llm.invoke(prompt, **kwargs) z trwałym cache.
+    bypass=True -> zawsze nowe zapytanie (np. próbkowanie przy temperature > 0),
+    key_extra pozwala rozróżnić kolejne próbki tego samego promptu.
+    """
+    if bypass:
+        return llm.invoke(prompt, **kwargs)
+
+    key = make_key("invoke", _llm_params(llm), kwargs, key_extra, prompt)
+    cache = get_llm_cache()
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+
+    response = llm.invoke(prompt, **kwargs)
+    cache.set(key, response)
+    return response
+
+
+def cached_chat(client, model, messages, bypass=False, options=None, **kwargs):
+    """
+    client.chat(...) (moduł ollama) z trwałym cache. Obrazy wchodzą do klucza
+    przez hash zawartości, nie ścieżkę. Zwraca {'message': {'role', 'content'}}.
+    """
+    if bypass:
+        return client.chat(model=model, messages=messages, options=options, **kwargs)
+
+    key_messages = [
+        {**m, "images": [_image_digest(img) for img in m.get("images", [])]}
+        for m in messages
+    ]
+    key = make_key("chat", model, options, kwargs, key_messages)
+    cache = get_llm_cache()
+    hit = cache.get_json(key)
+    if hit is not None:
+        return hit
+
+    response = client.chat(model=model, messages=messages, options=options, **kwargs)
+    result = {"message": {"role": "assistant", "content": response["message"]["content"]}}
+    cache.set_json(key, result)
+    return result
+
+
+def _field(obj, name):
+    """Pole odpowiedzi ollama - słownik albo obiekt (nowsze wersje biblioteki)."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _normalize_token(token):
+    return re.sub(r"[^0-9A-ZĄĆĘŁŃÓŚŹŻ]", "", (token or "").upper())
+
+
+def _choice_probabilities(top_logprobs, choices):
+    """Suma prawdopodobieństw kandydatów tokenu dla każdej decyzji (token = początek słowa)."""
+    totals = {}
+    for candidate in top_logprobs or []:
+        token = _normalize_token(_field(candidate, "token"))
+        decision = next((d for word, d in choices.items() if token and word.startswith(token)), None)
+        if decision is not None:
+            totals[decision] = totals.get(decision, 0.0) + math.exp(_field(candidate, "logprob"))
+    return totals
+
+
+def cached_chat_choice(client, model, messages, choices, bypass=False, options=None, top_logprobs=5):
+    """
+    Decyzja z zamkniętej listy słów (np. TAK/NIE) z trwałym cache. Odpowiedź jest
+    strumieniowana i przerywana na pierwszym rozstrzygającym słowie (limit tokenów
+    ustawia się przez options["num_predict"]). choices: {SŁOWO: decyzja}.
+    Zwraca {'decision', 'p_true', 'content'}; p_true to prawdopodobieństwo decyzji
+    True z logprobs pierwszego tokenu decyzji - None, gdy backend ich nie zwraca.
+    Brak rozstrzygnięcia (decision None: limit tokenów, urwany strumień, inny format)
+    nie trafia do cache - kolejne wywołanie zapyta model ponownie.
+    """
+    key_messages = [
+        {**m, "images": [_image_digest(img) for img in m.get("images", [])]}
+        for m in messages
+    ]
+    key = make_key("chat_choice", model, options, sorted(choices.items()), key_messages)
+    cache = get_llm_cache()
+    if not bypass:
+        hit = cache.get_json(key)
+        if hit is not None:
+            return hit
+
+    try:
+        stream = client.chat(model=model, messages=messages, options=options, stream=True,
+                             logprobs=True, top_logprobs=top_logprobs)
+    except TypeError:  # Starsza biblioteka ollama bez obsługi logprobs
+        stream = client.chat(model=model, messages=messages, options=options, stream=True)
+
+    content, decision, p_true = "", None, None
+    try:
+        for chunk in stream:
+            content += _field(_field(chunk, "message"), "content") or ""
+
+            for entry in _field(chunk, "logprobs") or []:
+                token = _normalize_token(_field(entry, "token"))
+                if p_true is None and token and any(word.startswith(token) for word in choices):
+                    totals = _choice_probabilities(_field(entry, "top_logprobs"), choices)
+                    if totals:
+                        p_true = totals.get(True, 0.0) / sum(totals.values())
+
+            words = re.findall(r"[0-9A-ZĄĆĘŁŃÓŚŹŻ]+", content.upper())
+            decision = next((choices[w] for w in words if w in choices), None)
+            if decision is not None:
+                break  # Rozstrzygnięte - reszta generowania niepotrzebna
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+    result = {"decision": decision, "p_true": p_true, "content": content}
+    if decision is not None:
+        cache.set_json(key, result)
+    return result
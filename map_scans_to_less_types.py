@@ -1,10 +1,27 @@
 import os
+import sys
+import json
 import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # --- KONFIGURACJA ---
 SOURCE_DIR = Path("scans")
 DEST_DIR = Path("scans_less_types")
+DERIVED_DEST_DIR = Path("derived_less_types")  # --copy/--hardlink: drzewa pochodne w nowym układzie trafiają tutaj
+PLAN_FILE = Path("scans_migration_plan.jsonl")  # Plan migracji (--dry-run zapisuje tylko plan)
+MIGRATION_WORKERS = 8
+
+# Drzewa pochodne (OCR/LLM) w układzie <drzewo>/[<język>/]<folder>/<nazwa skanu>.txt
+DERIVED_TREES = ("content", "titles", "summary", "category", "type", "info")
+DERIVED_LANGUAGES = ("pl", "en", "de", "fr", "es", "it", "uk")
+LABEL_TREE = "type"  # Zawartość to nazwa typu - też mapowana przez FOLDER_MAPPING
+
+# Tryby wykonania
+MODE_MOVE = "move"
+MODE_COPY = "copy"
+MODE_HARDLINK = "hardlink"
 
 # --- MAPOWANIE (Na podstawie Twojej funkcji fromId) ---
 # Klucz: Stara nazwa folderu (z poprzedniego enuma)
@@ -93,42 +110,70 @@ FOLDER_MAPPING = {
 }
 
 
-def get_unique_filename(destination_folder, filename):
-    """
-    Zwraca unikalną nazwę pliku, jeśli taki już istnieje w folderze docelowym.
-    Np. jeśli 'plik.jpg' istnieje, zwróci 'plik_1.jpg'.
-    """
-    if not (destination_folder / filename).exists():
-        return filename
-
-    stem = Path(filename).stem
-    suffix = Path(filename).suffix
-    counter = 1
-
-    while True:
-        new_filename = f"{stem}_{counter}{suffix}"
-        if not (destination_folder / new_filename).exists():
-            return new_filename
-        counter += 1
-
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-def main():
-    if not SOURCE_DIR.exists():
-        print(f"❌ Folder źródłowy '{SOURCE_DIR}' nie istnieje!")
-        return
 
-    # Tworzenie folderu docelowego
-    if not DEST_DIR.exists():
-        DEST_DIR.mkdir()
-        print(f"📂 Utworzono folder docelowy: {DEST_DIR}")
-
-    print("🚀 Rozpoczynam migrację dokumentów...")
-
-    moved_count = 0
-    folders_processed = 0
+class FolderIndex:
+    """
+    Nazwy i zawartość plików jednego folderu docelowego w pamięci: unikalna nazwa
+    bez sprawdzania exists() w pętli, a duplikaty wykrywane po rozmiarze i SHA-256
+    (hash liczony tylko przy zgodnym rozmiarze).
+    """
 
-    # Iteracja po starych folderach w scans/
-    for old_folder_path in SOURCE_DIR.iterdir():
+    def __init__(self, folder):
+        self.names = set()
+        self._counters = {}
+        self._by_size = {}
+        if folder.exists():
+            for f in folder.iterdir():
+                if f.is_file():
+                    self.add(f, f.name)
+
+    def add(self, path, name):
+        self.names.add(name)
+        self._by_size.setdefault(path.stat().st_size, []).append([path, None, name])
+
+    def find_duplicate(self, path):
+        """Nazwa identycznego (bajt w bajt) pliku w folderze albo None."""
+        candidates = self._by_size.get(path.stat().st_size)
+        if not candidates:
+            return None
+        digest = file_sha256(path)
+        for entry in candidates:
+            if entry[1] is None:
+                entry[1] = file_sha256(entry[0])
+            if entry[1] == digest:
+                return entry[2]
+        return None
+
+    def unique_name(self, filename):
+        """
+        Zwraca unikalną nazwę pliku, jeśli taka już istnieje w folderze docelowym.
+        Np. jeśli 'plik.jpg' istnieje, zwróci 'plik_1.jpg'.
+        """
+        if filename not in self.names:
+            return filename
+        stem, suffix = Path(filename).stem, Path(filename).suffix
+        counter = self._counters.get(filename, 1)
+        while f"{stem}_{counter}{suffix}" in self.names:
+            counter += 1
+        self._counters[filename] = counter + 1
+        return f"{stem}_{counter}{suffix}"
+
+
+def plan_scans():
+    """
+    Plan dla skanów: [(akcja, źródło, cel, szczegóły)] oraz
+    {(stary folder, stem): (nowy folder, nowy stem, duplikat)} - dla duplikatu stem zachowanego skanu.
+    """
+    plan, renames = [], {}
+    indexes = {}
+    for old_folder_path in sorted(SOURCE_DIR.iterdir()):
         if not old_folder_path.is_dir():
             continue
 
@@ -145,43 +190,175 @@ def main():
             print(f"⚠️  Nieznany typ folderu: '{old_name}' - pomijam.")
             continue
 
-        # Tworzenie folderu w nowej strukturze
         target_folder = DEST_DIR / new_name
-        if not target_folder.exists():
-            target_folder.mkdir()
-
-        # Przenoszenie plików
-        files = [f for f in old_folder_path.iterdir() if f.is_file() and f.name != ".DS_Store"]
+        index = indexes.setdefault(new_name, FolderIndex(target_folder))
+
+        files = sorted(f for f in old_folder_path.iterdir() if f.is_file() and f.name != ".DS_Store")
+        for file in files:
+            duplicate = index.find_duplicate(file)
+            if duplicate is not None:
+                plan.append(("skip", file, target_folder / duplicate, "duplikat"))
+                renames[(old_name, file.stem)] = (new_name, Path(duplicate).stem, True)
+                continue
+            unique_name = index.unique_name(file.name)
+            index.add(file, unique_name)
+            plan.append(("scan", file, target_folder / unique_name, None))
+            renames[(old_name, file.stem)] = (new_name, Path(unique_name).stem, False)
+    return plan, renames
+
+
+def plan_derived(renames, dest_root=None):
+    """
+    Plan dla drzew pochodnych - ta sama zmiana folderu i nazwy co dla skanu.
+    dest_root=None: zmiana w miejscu (przeniesienie); inaczej całe drzewa w nowym
+    układzie powstają pod dest_root, a stare zostają nietknięte (kopia/dowiązanie).
+    Pliki pochodne duplikatu przejmuje zachowany skan, jeśli własnych nie ma;
+    w przeciwnym razie są usuwane ("drop"), żeby nie zostały w starym folderze.
+    Nazwa pliku pochodnego to zawsze stem skanu po migracji - zajęta nazwa jest
+    konfliktem ("conflict", plik zostaje na miejscu), a nie powodem do innego sufiksu.
+    """
+    plan = []
+    for tree in DERIVED_TREES:
+        for root in [Path(tree)] + [Path(tree) / lang for lang in DERIVED_LANGUAGES]:
+            if not root.is_dir():
+                continue
+            target_root = root if dest_root is None else dest_root / root
+            action = "label" if tree == LABEL_TREE else "derived"
+            indexes, duplicates = {}, []
+            for old_folder_path in sorted(d for d in root.iterdir() if d.is_dir()):
+                old_name = old_folder_path.name
+                new_name = FOLDER_MAPPING.get(old_name)
+                if not new_name:
+                    continue
+                for file in sorted(old_folder_path.glob("*.txt")):
+                    index = indexes.setdefault(new_name, FolderIndex(target_root / new_name))
+                    _, new_stem, duplicate = renames.get((old_name, file.stem), (new_name, file.stem, False))
+                    if duplicate:
+                        duplicates.append((file, new_name, new_stem))  # Po plikach zachowanych skanów
+                        continue
+                    if dest_root is None and new_name == old_name and new_stem == file.stem:
+                        label = file.read_text(encoding="utf-8").strip() if action == "label" else None
+                        if label is not None and FOLDER_MAPPING.get(label, label) != label:
+                            plan.append((action, file, file, None))  # Ten sam plik, nowa etykieta
+                        continue
+                    target = target_root / new_name / f"{new_stem}.txt"
+                    if target.name in index.names:
+                        plan.append(("conflict", file, target, "nazwa zajęta"))
+                        continue
+                    index.add(file, target.name)
+                    plan.append((action, file, target, None))
+
+            for file, new_name, kept_stem in duplicates:
+                index = indexes.setdefault(new_name, FolderIndex(target_root / new_name))
+                target = target_root / new_name / f"{kept_stem}.txt"
+                if target == file:  # To już plik pochodny zachowanego skanu (ten sam folder i nazwa)
+                    label = file.read_text(encoding="utf-8").strip() if action == "label" else None
+                    if label is not None and FOLDER_MAPPING.get(label, label) != label:
+                        plan.append((action, file, file, None))
+                    continue
+                if target.name in index.names:
+                    plan.append(("drop", file, target, "duplikat"))
+                    continue
+                index.add(file, target.name)
+                plan.append((action, file, target, "duplikat"))
+    return plan
+
+
+def write_plan(plan, path=PLAN_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        for action, source, target, detail in plan:
+            f.write(json.dumps({"action": action, "source": str(source), "target": str(target),
+                                "detail": detail}, ensure_ascii=False) + "\n")
+
+
+def transfer(source, target, mode):
+    if mode == MODE_HARDLINK:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            mode = MODE_COPY  # Inny system plików - kopia
+    if mode == MODE_COPY:
+        shutil.copy2(source, target)
+    else:
+        shutil.move(str(source), str(target))
+
+
+def execute(step, mode):
+    action, source, target, _ = step
+    if action == "drop":
+        source.unlink()  # Tylko przy przeniesieniu - plik pochodny duplikatu
+    elif action == "label":
+        if target == source and mode != MODE_MOVE:
+            return  # Kopia/dowiązanie nie zmienia plików źródłowych
+        # Etykieta typu przepisana przez mapowanie (np. "pit11" -> "taxDocument")
+        label = source.read_text(encoding="utf-8").strip()
+        target.write_text(FOLDER_MAPPING.get(label, label), encoding="utf-8")
+        if mode == MODE_MOVE and target != source:
+            source.unlink()
+    else:
+        transfer(source, target, mode)
 
-        if files:
-            print(f"📦 Przenoszę {len(files)} plików z '{old_name}' -> '{new_name}'")
 
-            for file in files:
-                unique_name = get_unique_filename(target_folder, file.name)
-                target_path = target_folder / unique_name
+def main():
+    args = sys.argv[1:]
+    dry_run = "--dry-run" in args
+    mode = MODE_HARDLINK if "--hardlink" in args else MODE_COPY if "--copy" in args else MODE_MOVE
 
-                try:
-                    # shutil.move przenosi plik (usuwa ze źródła)
-                    # Jeśli chcesz kopiować, użyj shutil.copy2
-                    shutil.move(str(file), str(target_path))
-                    moved_count += 1
-                except Exception as e:
-                    print(f"   ❌ Błąd przenoszenia {file.name}: {e}")
+    if not SOURCE_DIR.exists():
+        print(f"❌ Folder źródłowy '{SOURCE_DIR}' nie istnieje!")
+        return
 
-        folders_processed += 1
+    print("🔍 Planowanie migracji dokumentów...")
+    scan_plan, renames = plan_scans()
+    plan = scan_plan + plan_derived(renames, None if mode == MODE_MOVE else DERIVED_DEST_DIR)
+    write_plan(plan)
+
+    counts = {}
+    for action, *_ in plan:
+        counts[action] = counts.get(action, 0) + 1
+    print(f"📝 Plan zapisany: {PLAN_FILE} (skany: {counts.get('scan', 0)}, duplikaty: {counts.get('skip', 0)}, "
+          f"pliki pochodne: {counts.get('derived', 0)}, etykiety typu: {counts.get('label', 0)}, "
+          f"pochodne duplikatów do usunięcia: {counts.get('drop', 0)})")
+    conflicts = [step for step in plan if step[0] == "conflict"]
+    if conflicts:
+        print(f"⚠️  Konflikty nazw plików pochodnych ({len(conflicts)}) - zostają na miejscu, do ręcznego rozwiązania:")
+        for _, source, target, _ in conflicts:
+            print(f"   {source} -> {target} (już istnieje)")
+    if dry_run:
+        return
 
-        # Opcjonalnie: Usuń stary pusty folder
-        try:
-            old_folder_path.rmdir()
-        except:
-            pass  # Jeśli folder nie jest pusty (np. pliki ukryte), zostaw go
+    # Kopia/dowiązanie nie usuwa niczego ze starych drzew
+    steps = [step for step in plan if step[0] not in ("skip", "conflict") and (step[0] != "drop" or mode == MODE_MOVE)]
+    for target_dir in {step[2].parent for step in steps}:
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"🚀 Rozpoczynam migrację ({mode}, równolegle: {MIGRATION_WORKERS})...")
+    done_count = 0
+    with ThreadPoolExecutor(max_workers=MIGRATION_WORKERS) as pool:
+        futures = [(step, pool.submit(execute, step, mode)) for step in steps]
+        for (action, source, target, _), future in futures:
+            try:
+                future.result()
+                done_count += 1
+            except Exception as e:
+                print(f"   ❌ Błąd przenoszenia {source}: {e}")
+
+    # Opcjonalnie: Usuń stare puste foldery
+    if mode == MODE_MOVE:
+        for folder in {step[1].parent for step in steps}:
+            try:
+                folder.rmdir()
+            except OSError:
+                pass  # Jeśli folder nie jest pusty (np. pliki ukryte, duplikaty), zostaw go
 
     print("-" * 40)
     print(f"✅ Zakończono migrację.")
-    print(f"📂 Przetworzono folderów źródłowych: {folders_processed}")
-    print(f"📄 Przeniesiono plików: {moved_count}")
+    print(f"📄 Wykonano operacji: {done_count}/{len(steps)}, pominięto duplikatów: {counts.get('skip', 0)}")
     print(f"📍 Nowa lokalizacja: {DEST_DIR.absolute()}")
+    if mode != MODE_MOVE:
+        print(f"📍 Drzewa pochodne: {DERIVED_DEST_DIR.absolute()}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,120 @@
+import re
+import hashlib
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from cache_store import CACHE_DIR, DiskCache, make_key
+
+# --- KONFIGURACJA ---
+SHINGLE_SIZE = 5              # Shingle znakowe - odporne na błędy OCR lepiej niż słowa
+NUM_PERM = 128                # Długość sygnatury MinHash
+LSH_BANDS = 16                # 16 pasm x 8 wierszy - kandydaci od podobieństwa ~0.7
+JACCARD_THRESHOLD = 0.85      # Szacowane podobieństwo Jaccarda, od którego tekst jest duplikatem
+MINHASH_SEED = 1234           # Stałe permutacje - sygnatury w cache pozostają porównywalne
+
+MINHASH_CACHE_FILE = CACHE_DIR / "near_duplicates.sqlite"
+MINHASH_VERSION = 1  # Zmiana normalizacji/shingli = podbić wersję (unieważnia cache)
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(MINHASH_SEED)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_POWERS = np.uint64(1000003) ** np.arange(SHINGLE_SIZE, dtype=np.uint64)
+
+
+def normalize_text(text):
+    """Małe litery, bez interpunkcji i wielokrotnych spacji."""
+    return " ".join(re.sub(r"[^\w]+", " ", text.lower()).split())
+
+
+def shingle_hashes(text):
+    """32-bitowe hashe unikalnych shingli znakowych (liczone wektorowo)."""
+    codes = np.frombuffer(normalize_text(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_SIZE:
+        codes = np.pad(codes, (0, SHINGLE_SIZE - len(codes)))
+    windows = sliding_window_view(codes, SHINGLE_SIZE)
+    return np.unique((windows * _POWERS).sum(axis=1) & np.uint64(0xFFFFFFFF))
+
+
+def minhash(text):
+    """Sygnatura MinHash: minimum każdej permutacji (a*x + b) mod p po shinglach."""
+    hashes = shingle_hashes(text)
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(sig_a, sig_b):
+    """Szacowane podobieństwo Jaccarda dwóch sygnatur."""
+    return float(np.mean(sig_a == sig_b))
+
+
+class NearDuplicateIndex:
+    """
+    Indeks LSH na sygnaturach MinHash. Sygnatura dzielona jest na LSH_BANDS pasm -
+    kandydatami są teksty zgodne w co najmniej jednym paśmie, a o duplikacie
+    decyduje szacowane podobieństwo. Sygnatury są cache'owane po hashu treści,
+    więc przyrostowa aktualizacja liczy MinHash tylko dla nowych/zmienionych tekstów.
+    """
+
+    def __init__(self, threshold=JACCARD_THRESHOLD, cache_path=MINHASH_CACHE_FILE):
+        self.threshold = threshold
+        self.cache = DiskCache(cache_path)
+        rows = NUM_PERM // LSH_BANDS
+        self._bounds = [(i * rows, (i + 1) * rows) for i in range(LSH_BANDS)]
+        self._buckets = [{} for _ in self._bounds]
+
+    def signature(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key = make_key("minhash", MINHASH_VERSION, SHINGLE_SIZE, NUM_PERM, MINHASH_SEED, digest)
+        cached = self.cache.get_json(key)
+        if cached is not None:
+            return np.asarray(cached, dtype=np.uint64)
+        signature = minhash(text)
+        self.cache.set_json(key, signature.tolist())
+        return signature
+
+    def _keys(self, signature):
+        for (start, end), bucket in zip(self._bounds, self._buckets):
+            yield bucket, signature[start:end].tobytes()
+
+    def add(self, signature, ref):
+        for bucket, key in self._keys(signature):
+            bucket.setdefault(key, []).append((signature, ref))
+
+    def find(self, signature, skip=None):
+        """
+        Najbardziej podobny zarejestrowany tekst powyżej progu: (ref, podobieństwo) albo None.
+        skip(ref) -> True pomija kandydata (np. teksty z tego samego dokumentu źródłowego).
+        """
+        best = None
+        for bucket, key in self._keys(signature):
+            for other, ref in bucket.get(key, ()):
+                if skip is not None and skip(ref):
+                    continue
+                score = similarity(signature, other)
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (ref, score)
+        return best
+
+    def register(self, text, ref):
+        """Dodaje tekst (np. już przetworzony) do indeksu."""
+        self.add(self.signature(text), ref)
+
+    def check(self, text, ref, skip=None):
+        """(ref oryginału, podobieństwo) dla bliskiego duplikatu albo None - unikalny tekst trafia do indeksu."""
+        signature = self.signature(text)
+        match = self.find(signature, skip)
+        if match is None:
+            self.add(signature, ref)
+        return match
+
+
+def find_leakage(train_texts, test_texts, threshold=JACCARD_THRESHOLD):
+    """Przecieki między podziałami: [(indeks testowy, indeks treningowy, podobieństwo)]."""
+    index = NearDuplicateIndex(threshold)
+    for i, text in enumerate(train_texts):
+        index.register(text, i)
+    leaks = []
+    for i, text in enumerate(test_texts):
+        match = index.find(index.signature(text))
+        if match is not None:
+            leaks.append((i, match[0], match[1]))
+    return leaks
@@ -0,0 +1,125 @@
+import tempfile
+import pytesseract
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+from cache_store import CACHE_DIR, DiskCache, make_key, file_sha256
+
+# --- KONFIGURACJA ---
+TESSERACT_CMD = r'/opt/homebrew/bin/tesseract'
+OCR_LANGS = 'pol+eng'
+TESSERACT_CONFIG = ''  # Dodatkowe opcje Tesseracta (np. '--psm 6')
+
+# PDF: strony rasteryzowane oknami na dysk tymczasowy (nie wszystkie naraz do RAM)
+DEFAULT_PDF_DPI = 200  # Domyślne DPI pdf2image - tak powstał dotychczasowy OCR i klucze cache
+PDF_DPI = DEFAULT_PDF_DPI  # Wyższe (np. 300) tylko świadomie: inny tekst OCR, nowe klucze, ~2.25x RAM na stronę
+PDF_PAGE_WINDOW = 4     # Ile stron rasteryzować naraz
+PDF_PAGE_WORKERS = 2    # Równoległy OCR stron w oknie (x liczba procesów OCR!)
+
+OCR_CACHE_FILE = CACHE_DIR / "ocr_cache.sqlite"
+OCR_CACHE_MAX_BYTES = 1024 ** 3
+
+pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+_cache = None
+_tesseract_version = None
+
+
+def get_ocr_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(OCR_CACHE_FILE, max_bytes=OCR_CACHE_MAX_BYTES)
+    return _cache
+
+
+def ocr_settings(langs=OCR_LANGS, config=TESSERACT_CONFIG):
+    """Ustawienia wpływające na wynik OCR - wchodzą do klucza cache."""
+    global _tesseract_version
+    if _tesseract_version is None:
+        _tesseract_version = str(pytesseract.get_tesseract_version())
+    return {"tesseract": _tesseract_version, "langs": langs, "config": config}
+
+
+def document_settings(file_path, langs=OCR_LANGS, config=TESSERACT_CONFIG, dpi=PDF_DPI):
+    """Ustawienia OCR pliku; DPI wchodzi do klucza tylko dla PDF i tylko gdy różni się od domyślnego."""
+    settings = ocr_settings(langs, config)
+    if Path(file_path).suffix.lower() == ".pdf" and dpi != DEFAULT_PDF_DPI:
+        settings["dpi"] = dpi
+    return settings
+
+
+def _ocr_image(image, langs, config):
+    return pytesseract.image_to_string(image, lang=langs, config=config)
+
+
+def _ocr_pdf_pages(file_path, file_hash, settings, cache, dpi):
+    """
+    Strumieniowy OCR PDF: rasteryzuje okno PDF_PAGE_WINDOW stron do plików
+    tymczasowych, OCR-uje je równolegle i zwalnia przed kolejnym oknem.
+    Każda strona trafia do cache od razu (checkpoint) - przerwany dokument
+    wznawia się od pierwszej brakującej strony.
+    """
+    langs, config = settings["langs"], settings["config"]
+    page_count = pdfinfo_from_path(file_path)["Pages"]
+    texts = [None] * page_count
+    page_keys = [make_key("page", file_hash, settings, page_no) for page_no in range(page_count)]
+
+    if cache is not None:
+        for page_no, page_key in enumerate(page_keys):
+            texts[page_no] = cache.get(page_key)
+
+    with ThreadPoolExecutor(max_workers=PDF_PAGE_WORKERS) as pool:
+        for window_start in range(0, page_count, PDF_PAGE_WINDOW):
+            window = range(window_start, min(window_start + PDF_PAGE_WINDOW, page_count))
+            missing = [page_no for page_no in window if texts[page_no] is None]
+            if not missing:
+                continue
+
+            with tempfile.TemporaryDirectory(prefix="ocr_pages_") as tmp_dir:
+                # Numeracja stron w pdf2image od 1
+                image_paths = convert_from_path(
+                    file_path, dpi=dpi, first_page=missing[0] + 1, last_page=missing[-1] + 1,
+                    output_folder=tmp_dir, fmt="png", paths_only=True)
+                pages = dict(zip(range(missing[0], missing[-1] + 1), image_paths))
+
+                futures = {page_no: pool.submit(_ocr_image, pages[page_no], langs, config)
+                           for page_no in missing}
+                for page_no, future in futures.items():
+                    texts[page_no] = future.result()
+                    if cache is not None:
+                        cache.set(page_keys[page_no], texts[page_no])
+
+    return "".join(texts)
+
+
+def perform_ocr(file_path, langs=OCR_LANGS, config=TESSERACT_CONFIG, use_cache=True, dpi=PDF_DPI):
+    """
+    OCR obrazu lub PDF z trwałym cache (klucz: SHA-256 pliku + ustawienia OCR).
+    Dla PDF wyniki zapisywane są też osobno dla każdej strony.
+    """
+    file_path = Path(file_path)
+    try:
+        cache = get_ocr_cache() if use_cache else None
+        settings = document_settings(file_path, langs, config, dpi)
+        is_pdf = file_path.suffix.lower() == ".pdf"
+        file_hash = file_sha256(file_path)
+
+        doc_key = make_key("document", file_hash, settings)
+        if cache is not None:
+            hit = cache.get(doc_key)
+            if hit is not None:
+                return hit
+
+        if is_pdf:
+            text = _ocr_pdf_pages(file_path, file_hash, settings, cache, dpi)
+        else:
+            with Image.open(file_path) as image:
+                text = _ocr_image(image, langs, config)
+
+        if cache is not None:
+            cache.set(doc_key, text)
+        return text
+    except Exception as e:
+        print(f"  [!] Błąd OCR: {file_path.name}: {e}")
+        return ""
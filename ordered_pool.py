@@ -0,0 +1,26 @@
+from collections import deque
+
+
+def iter_ordered(pool, items, fn, max_in_flight):
+    """
+    Wykonuje fn(item) w puli wątków, trzymając co najwyżej max_in_flight zleceń,
+    i zwraca (item, wynik, błąd) w kolejności wejścia - wypisywanie, zapis plików
+    i stanu zostają w wątku głównym.
+    """
+    pending = deque()
+    items = iter(items)
+    end = object()
+    while True:
+        while len(pending) < max_in_flight:
+            item = next(items, end)
+            if item is end:
+                break
+            pending.append((item, pool.submit(fn, item)))
+        if not pending:
+            return
+
+        item, future = pending.popleft()
+        try:
+            yield item, future.result(), None
+        except Exception as e:
+            yield item, None, e
@@ -1,14 +1,29 @@
-import os
+import sys
 import json
 from pathlib import Path
 from langchain_ollama import OllamaLLM
+from llm_cache import cached_invoke
+from dataset_store import DatasetWriter, PACKED_ROOT, SYNTHETIC_SUBSET, make_doc_id
+from job_state import JobState, DONE_STAGE, make_fingerprint
+from near_duplicates import NearDuplicateIndex
 
 # --- KONFIGURACJA ---
 INPUT_DIR = "synthetic_content"       
 OUTPUT_ROOT = "synthetic_dataset"     
-HISTORY_FILE = "processed_synthetic_scans_contents.txt" 
+HISTORY_FILE = "processed_synthetic_scans_contents.txt"  # Stara historia - importowana raz do job_state
+PIPELINE_NAME = "synthetic_texts"
 MODEL_NAME = "llama3"
 
+# Wersje promptów - podbij po edycji promptu; tryb --refresh przeliczy tylko zależne wyniki
+CORE_PROMPT_VERSION = 1
+TRANSLATION_PROMPT_VERSION = 1
+
+# Tytuł i streszczenie we wszystkich językach w jednym zapytaniu do LLM
+BATCH_TRANSLATION = True
+
+# Wyniki trafiają do spakowanego zbioru (packed_dataset/synthetic); stare drzewa .txt opcjonalnie
+WRITE_TEXT_TREES = True
+
 # Definicja języków
 TARGET_LANGUAGES = {
     "pl": "Polish",
@@ -22,24 +37,78 @@ TARGET_LANGUAGES = {
 
 # Inicjalizacja LLM z niską temperaturą dla powtarzalności
 llm = OllamaLLM(model=MODEL_NAME, temperature=0)
+job_state = JobState(PIPELINE_NAME)
 
 # --- OBSŁUGA HISTORII (RESUME) ---
+# Etapy na dokument: core -> title:<kod>/summary:<kod> -> done
+CORE_STAGE = "core"
+LABEL_FIELDS = ("title", "summary")
+
+def label_stage(field, code):
+    return f"{field}:{code}"
+
+def core_fingerprint(raw_text, doc_type):
+    return make_fingerprint(CORE_STAGE, CORE_PROMPT_VERSION, MODEL_NAME, doc_type, raw_text)
+
+def label_fingerprint(field, code, source_text):
+    return make_fingerprint(field, TRANSLATION_PROMPT_VERSION, MODEL_NAME, code,
+                            TARGET_LANGUAGES[code], source_text)
+
 def load_history():
-    if not os.path.exists(HISTORY_FILE):
-        return set()
-    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-        return set(line.strip() for line in f if line.strip())
+    migrated = job_state.migrate_history_file(HISTORY_FILE)
+    if migrated:
+        print(f"📥 Zaimportowano {migrated} wpisów z {HISTORY_FILE} do bazy stanu.")
+    return job_state.done_docs()
 
 def mark_as_done(rel_path):
-    with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{rel_path}\n")
+    job_state.finish(rel_path, DONE_STAGE)
+
+def mark_flushed_as_done(rel_paths):
+    for rel_path in rel_paths:
+        mark_as_done(rel_path)
+
+# Plik oznaczany jako zakończony dopiero po zapisaniu jego shardu (twarde przerwanie nie gubi rekordów)
+dataset_writer = DatasetWriter(PACKED_ROOT / SYNTHETIC_SUBSET, on_flush=mark_flushed_as_done)
+
+def source_document(rel_path):
+    """Dokument źródłowy pliku: X_synth_N.txt i X.txt w tym samym folderze to jedna rodzina."""
+    path = Path(rel_path)
+    return str(path.parent / path.stem.split("_synth_")[0])
+
+def near_duplicate_files(files, input_path, processed):
+    """
+    Pliki będące bliskimi duplikatami (MinHash/LSH) wcześniejszych lub już
+    przetworzonych plików - nie wysyłamy ich do LLM. {ścieżka względna: oryginał}.
+    Warianty porównujemy tylko z innymi dokumentami źródłowymi - podobieństwo
+    do własnego oryginału (ten sam układ formularza) jest zamierzone.
+    """
+    index = NearDuplicateIndex()
+    texts = {}
+    for f in files:
+        try:
+            texts[f] = f.read_text(encoding='utf-8')
+        except Exception:
+            continue  # Błąd odczytu zgłosi process_file
+        rel_path = str(f.relative_to(input_path))
+        if rel_path in processed:
+            index.register(texts[f], rel_path)
+
+    duplicates = {}
+    for f, text in texts.items():
+        rel_path = str(f.relative_to(input_path))
+        if rel_path not in processed:
+            family = source_document(rel_path)
+            match = index.check(text, rel_path, skip=lambda ref: source_document(ref) == family)
+            if match is not None:
+                duplicates[rel_path] = match[0]
+    return duplicates
 
 # --- PROMPTY LLM ---
 def ask_llm_json(prompt):
     """Wywołuje LLM w trybie JSON i bezpiecznie parsuje wynik."""
     try:
         # format="json" to kluczowa funkcja Ollama, która wymusza poprawny JSON
-        response = llm.invoke(prompt, format="json")
+        response = cached_invoke(llm, prompt, format="json")
         return json.loads(response)
     except json.JSONDecodeError as e:
         print(f"\n   ⚠️ Błąd składni JSON od AI: {e}")
@@ -50,7 +119,7 @@ def ask_llm_json(prompt):
 
 def ask_llm_text(prompt):
     try:
-        response = llm.invoke(prompt)
+        response = cached_invoke(llm, prompt)
         return response.strip().strip('"').strip("'")
     except Exception:
         return "Translation Error"
@@ -84,7 +153,63 @@ def translate_section(text, target_lang, content_type="text"):
     """
     return ask_llm_text(prompt)
 
+def translate_labels(base_title, base_summary, needed=None):
+    """
+    Tłumaczy tytuł i streszczenie (needed: pary (kod, pole); domyślnie
+    wszystkie poza EN) jednym zapytaniem JSON; osobne wywołania tylko dla
+    brakujących/pustych pól. Zwraca {kod: {pole: tłumaczenie}}.
+    """
+    if needed is None:
+        needed = {(code, field) for code in TARGET_LANGUAGES if code != "en" for field in LABEL_FIELDS}
+    targets = {code: name for code, name in TARGET_LANGUAGES.items()
+               if any((code, field) in needed for field in LABEL_FIELDS)}
+
+    batch = None
+    if BATCH_TRANSLATION and targets:
+        lang_list = "\n".join(f"    - {code}: {name}" for code, name in targets.items())
+        example = ", ".join(f'"{code}": {{"title": "...", "summary": "..."}}' for code in targets)
+        prompt = f"""
+    Translate the document TITLE and SUMMARY below into each of these languages:
+{lang_list}
+
+    Return ONLY a JSON object with one key per language code:
+    {{{example}}}
+
+    Ensure all quotes inside the text are properly escaped.
+
+    TITLE:
+    {base_title}
+
+    SUMMARY:
+    {base_summary}
+    """
+        batch = ask_llm_json(prompt)
+
+    results = {}
+    missing = 0
+    for code, lang_name in targets.items():
+        entry = batch.get(code) if isinstance(batch, dict) else None
+        entry = entry if isinstance(entry, dict) else {}
+        translated = {}
+        for field, source in (("title", base_title), ("summary", base_summary)):
+            if (code, field) not in needed:
+                continue
+            value = entry.get(field)
+            if not isinstance(value, str) or not value.strip():
+                missing += 1
+                value = translate_section(source, lang_name, field)
+            translated[field] = value.strip()
+        results[code] = translated
+
+    if BATCH_TRANSLATION and missing:
+        print(f" (dotłumaczono osobno: {missing})", end="", flush=True)
+    return results
+
 def save_output(root, kind, lang, subdir, filename, content):
+    dataset_writer.put(make_doc_id(subdir, filename), kind, content, lang=lang)
+    if not WRITE_TEXT_TREES:
+        return
+
     if lang:
         path = Path(root) / kind / lang / subdir
     else:
@@ -97,6 +222,7 @@ def save_output(root, kind, lang, subdir, filename, content):
 # --- GŁÓWNA LOGIKA PLIKU ---
 def process_file(file_path, input_root):
     rel_path = file_path.relative_to(input_root)
+    rel_path_str = str(rel_path)
     base_filename = rel_path.name
     sub_dir = rel_path.parent
     doc_type = sub_dir.name
@@ -108,44 +234,64 @@ def process_file(file_path, input_root):
         return
 
     # 2. Generowanie metadanych (JSON)
-    meta = get_metadata(raw_text, doc_type)
+    def generate_core():
+        meta = get_metadata(raw_text, doc_type)
+        return meta if isinstance(meta, dict) and meta else None  # Zły JSON -> etap do powtórki
+
+    core_fp = core_fingerprint(raw_text, doc_type)
+    stale = not job_state.is_done(rel_path_str, CORE_STAGE, core_fp)  # Czy cokolwiek liczono od nowa
+    meta = job_state.run(rel_path_str, CORE_STAGE, generate_core, fingerprint=core_fp)
     if not meta or not isinstance(meta, dict):
         print("   ❌ Błąd AI: Nie udało się wygenerować poprawnego JSONa.")
         return
 
+    base_title = meta.get("title_base", "Document")
+    base_summary = meta.get("summary_base", "No summary available.")
+
+    sources = {"title": base_title, "summary": base_summary}
+    fingerprints = {(code, field): label_fingerprint(field, code, sources[field])
+                    for code in TARGET_LANGUAGES if code != "en" for field in LABEL_FIELDS}
+    needed = {key for key, fp in fingerprints.items()
+              if not job_state.is_done(rel_path_str, label_stage(key[1], key[0]), fp)}
+
+    if not stale and not needed and job_state.is_done(rel_path_str, DONE_STAGE):
+        # --refresh: wszystkie etapy aktualne - bez ponownego zapisu drzew i rekordu w spakowanym zbiorze
+        print("   ⏩ Wszystkie etapy aktualne - pomijam zapis.")
+        return
+
     # 3. Zapisywanie danych podstawowych
     save_output(OUTPUT_ROOT, "content", None, sub_dir, base_filename, raw_text)
     save_output(OUTPUT_ROOT, "category", None, sub_dir, base_filename, meta.get("category", "other"))
     save_output(OUTPUT_ROOT, "type", None, sub_dir, base_filename, doc_type)
     save_output(OUTPUT_ROOT, "info", None, sub_dir, base_filename, meta.get("info", "none"))
 
-    base_title = meta.get("title_base", "Document")
-    base_summary = meta.get("summary_base", "No summary available.")
-
-    # 4. Tłumaczenia
+    # 4. Tłumaczenia - tylko etapy brakujące lub nieaktualne
     print(f"   🌍 Tłumaczenie na {len(TARGET_LANGUAGES)} języków...", end="", flush=True)
-    
-    for code, lang_name in TARGET_LANGUAGES.items():
-        # Tytuły
-        if code == "en": 
-            title = base_title
-        else: 
-            title = translate_section(base_title, lang_name, "title")
-        save_output(OUTPUT_ROOT, "titles", code, sub_dir, base_filename, title)
+    if needed:
+        for code, field in needed:
+            job_state.start(rel_path_str, label_stage(field, code))
+        for code, fields in translate_labels(base_title, base_summary, needed).items():
+            for field, value in fields.items():
+                job_state.finish_result(rel_path_str, label_stage(field, code), value,
+                                        fingerprint=fingerprints[(code, field)])
 
-        # Streszczenia
-        if code == "en": 
-            summary = base_summary
-        else: 
-            summary = translate_section(base_summary, lang_name, "summary")
+    for code in TARGET_LANGUAGES:
+        if code == "en":
+            title, summary = base_title, base_summary
+        else:
+            title = job_state.result(rel_path_str, label_stage("title", code))
+            summary = job_state.result(rel_path_str, label_stage("summary", code))
+        save_output(OUTPUT_ROOT, "titles", code, sub_dir, base_filename, title)
         save_output(OUTPUT_ROOT, "summary", code, sub_dir, base_filename, summary)
-
         print(".", end="", flush=True)
 
     print(" OK")
-    mark_as_done(str(rel_path))
+    dataset_writer.commit(make_doc_id(sub_dir, base_filename), rel_path_str)
 
 def main():
+    # --refresh: przejrzyj także zakończone pliki i przelicz tylko nieaktualne etapy
+    refresh = "--refresh" in sys.argv[1:]
+
     input_path = Path(INPUT_DIR)
     if not input_path.exists():
         print(f"❌ Brak folderu wejściowego: {INPUT_DIR}")
@@ -154,13 +300,18 @@ def main():
     processed = load_history()
     print(f"📂 Historia: {len(processed)} plików już przetworzonych.")
 
-    files = list(input_path.rglob("*.txt"))
+    files = sorted(input_path.rglob("*.txt"))
+    duplicates = near_duplicate_files(files, input_path, processed)
+    if duplicates:
+        print(f"♻️ Pomijam {len(duplicates)} bliskich duplikatów (bez zapytań do LLM).")
     print(f"🚀 Start: {len(files)} plików do analizy.")
 
     for f in files:
         rel_path = str(f.relative_to(input_path))
         
-        if rel_path in processed:
+        if rel_path in processed and not refresh:
+            continue
+        if rel_path in duplicates:
             continue
             
         print(f"📄 Przetwarzam: {rel_path}")
@@ -172,5 +323,7 @@ def main():
         except Exception as e:
             print(f"\n❌ Błąd krytyczny przy pliku {rel_path}: {e}")
 
+    dataset_writer.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
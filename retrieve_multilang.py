@@ -1,19 +1,38 @@
 import os
+import sys
 import json
-import pytesseract
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from PIL import Image
-from pdf2image import convert_from_path
 from langchain_ollama import OllamaLLM
+from llm_cache import cached_invoke
+from ocr import perform_ocr, document_settings
+from cache_store import file_sha256
+from ordered_pool import iter_ordered
+from dataset_store import DatasetWriter, PACKED_ROOT, REAL_SUBSET, make_doc_id
+from job_state import JobState, DONE_STAGE, make_fingerprint
 
 # --- KONFIGURACJA ---
-pytesseract.pytesseract.tesseract_cmd = r'/opt/homebrew/bin/tesseract'
-
 # Folder wejściowy
 INPUT_DIR = "scans"
-HISTORY_FILE = "processed_real_scans_files.txt"  # Plik z listą zrobionych skanów
+HISTORY_FILE = "processed_real_scans_files.txt"  # Stara historia - importowana raz do job_state
+PIPELINE_NAME = "real_scans"
 MODEL_NAME = "llama3"
 
+# Wersje promptów - podbij po edycji promptu; tryb --refresh przeliczy tylko zależne wyniki
+CORE_PROMPT_VERSION = 1
+TRANSLATION_PROMPT_VERSION = 1
+
+# OCR w osobnych procesach (Tesseract jest CPU-bound), LLM w procesie głównym
+OCR_WORKERS = os.cpu_count() or 1
+OCR_MAX_IN_FLIGHT = OCR_WORKERS * 2  # Limit plików w kolejce OCR (stała pamięć)
+
+# Tytuł i streszczenie we wszystkich językach w jednym zapytaniu do LLM
+BATCH_TRANSLATION = True
+
+# Wyniki trafiają do spakowanego zbioru (packed_dataset/real); stare drzewa .txt opcjonalnie
+WRITE_TEXT_TREES = True
+
 # Definicja języków
 TARGET_LANGUAGES = {
     "pl": "Polish",
@@ -26,6 +45,7 @@ TARGET_LANGUAGES = {
 }
 
 llm = OllamaLLM(model=MODEL_NAME, temperature=0)
+job_state = JobState(PIPELINE_NAME)
 
 # NOWA, SKONSOLIDOWANA LISTA TYPÓW (zgodna z nowym Enumem)
 ALLOWED_TYPES = [
@@ -54,39 +74,82 @@ ALLOWED_TYPES = [
 
 
 # --- OBSŁUGA HISTORII (RESUME) ---
+# Etapy na dokument: ocr -> core -> title:<kod>/summary:<kod> -> done
+OCR_STAGE = "ocr"
+CORE_STAGE = "core"
+LABEL_FIELDS = ("title", "summary")
+
+
+def label_stage(field, code):
+    return f"{field}:{code}"
+
+
+# Odciski wejść etapów: zmiana źródła, promptu, modelu lub języka unieważnia tylko zależne etapy
+def ocr_fingerprint(file_path):
+    return make_fingerprint(OCR_STAGE, file_sha256(file_path), document_settings(file_path))
+
+
+def core_fingerprint(raw_text, hinted_type):
+    return make_fingerprint(CORE_STAGE, CORE_PROMPT_VERSION, MODEL_NAME, hinted_type, raw_text)
+
+
+def label_fingerprint(field, code, source_text):
+    return make_fingerprint(field, TRANSLATION_PROMPT_VERSION, MODEL_NAME, code,
+                            TARGET_LANGUAGES[code], source_text)
+
+
 def load_history():
-    """Wczytuje listę przetworzonych plików do setu (dla szybkiego wyszukiwania)."""
-    if not os.path.exists(HISTORY_FILE):
-        return set()
-    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-        return set(line.strip() for line in f if line.strip())
+    """Zbiór w pełni przetworzonych plików (po jednorazowej migracji starej historii)."""
+    migrated = job_state.migrate_history_file(HISTORY_FILE)
+    if migrated:
+        print(f"📥 Zaimportowano {migrated} wpisów z {HISTORY_FILE} do bazy stanu.")
+    return job_state.done_docs()
 
 
 def mark_as_done(rel_path):
-    """Dopisuje plik do historii."""
-    with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{rel_path}\n")
+    """Oznacza cały dokument jako zakończony (transakcja SQLite)."""
+    job_state.finish(rel_path, DONE_STAGE)
+
+
+def mark_flushed_as_done(rel_paths):
+    for rel_path in rel_paths:
+        mark_as_done(rel_path)
+
+
+# Dokument oznaczany jako zakończony dopiero po zapisaniu jego shardu (twarde przerwanie nie gubi rekordów)
+dataset_writer = DatasetWriter(PACKED_ROOT / REAL_SUBSET, on_flush=mark_flushed_as_done)
 
 
 # --- OCR I LLM ---
-def perform_ocr(file_path):
-    text = ""
-    try:
-        langs = 'pol+eng'
-        if file_path.suffix.lower() == ".pdf":
-            pages = convert_from_path(file_path)
-            for page in pages:
-                text += pytesseract.image_to_string(page, lang=langs)
-        else:
-            text = pytesseract.image_to_string(Image.open(file_path), lang=langs)
-    except Exception as e:
-        print(f"  [!] Błąd OCR: {file_path.name}: {e}")
-    return text
+def iter_ocr_results(pool, files):
+    """
+    Zleca OCR do puli procesów z wyprzedzeniem, ale najwyżej OCR_MAX_IN_FLIGHT
+    plików naraz. Zwraca wyniki w kolejności wejściowej: (plik, odcisk, tekst).
+    `files` to trójki (plik, odcisk_ocr, ocr_gotowy) - plik z aktualnym etapem OCR
+    (wznowienie) nie idzie do puli, a tekst (None) czyta z bazy stanu dopiero process_file.
+    """
+    files = iter(files)
+    in_flight = deque()
+
+    def submit(f, fingerprint, ocr_done):
+        in_flight.append((f, fingerprint, None if ocr_done else pool.submit(perform_ocr, f)))
+
+    for item in files:
+        submit(*item)
+        if len(in_flight) >= OCR_MAX_IN_FLIGHT:
+            break
+
+    while in_flight:
+        f, fingerprint, future = in_flight.popleft()
+        next_item = next(files, None)
+        if next_item is not None:
+            submit(*next_item)
+        yield f, fingerprint, None if future is None else future.result()
 
 
 def ask_llm_json(prompt):
     try:
-        response = llm.invoke(prompt)
+        response = cached_invoke(llm, prompt)
         clean = response.replace("```json", "").replace("```", "").strip()
         start, end = clean.find('{'), clean.rfind('}') + 1
         return json.loads(clean[start:end])
@@ -96,7 +159,7 @@ def ask_llm_json(prompt):
 
 def ask_llm_text(prompt):
     try:
-        response = llm.invoke(prompt)
+        response = cached_invoke(llm, prompt)
         return response.strip().strip('"').strip("'")
     except Exception:
         return "Translation Error"
@@ -150,7 +213,64 @@ def translate_section(text, target_lang, content_type="text"):
     return ask_llm_text(prompt)
 
 
+def translate_labels(base_title, base_summary, needed=None):
+    """
+    Tłumaczy tytuł i streszczenie na TARGET_LANGUAGES (needed: zbiór par
+    (kod, pole) do przetłumaczenia; domyślnie wszystkie poza EN).
+    Tryb wsadowy: jedno zapytanie JSON dla wszystkich języków, a pojedyncze
+    wywołania translate_section tylko dla brakujących/pustych pól.
+    Zwraca {kod: {pole: tłumaczenie}} dla par z needed.
+    """
+    if needed is None:
+        needed = {(code, field) for code in TARGET_LANGUAGES if code != "en" for field in LABEL_FIELDS}
+    targets = {code: name for code, name in TARGET_LANGUAGES.items()
+               if any((code, field) in needed for field in LABEL_FIELDS)}
+
+    batch = None
+    if BATCH_TRANSLATION and targets:
+        lang_list = "\n".join(f"    - {code}: {name}" for code, name in targets.items())
+        example = ", ".join(f'"{code}": {{"title": "...", "summary": "..."}}' for code in targets)
+        prompt = f"""
+    Translate the document TITLE and SUMMARY below into each of these languages:
+{lang_list}
+
+    Return ONLY JSON with one key per language code:
+    {{{example}}}
+
+    TITLE:
+    {base_title}
+
+    SUMMARY:
+    {base_summary}
+    """
+        batch = ask_llm_json(prompt)
+
+    results = {}
+    missing = 0
+    for code, lang_name in targets.items():
+        entry = batch.get(code) if isinstance(batch, dict) else None
+        entry = entry if isinstance(entry, dict) else {}
+        translated = {}
+        for field, source in (("title", base_title), ("summary", base_summary)):
+            if (code, field) not in needed:
+                continue
+            value = entry.get(field)
+            if not isinstance(value, str) or not value.strip():
+                # Fallback: brakujący klucz -> osobne zapytanie tylko dla tego pola
+                missing += 1
+                value = translate_section(source, lang_name, field)
+            translated[field] = value.strip()
+        results[code] = translated
+
+    if BATCH_TRANSLATION and missing:
+        print(f"      ⚠️ Tłumaczenie wsadowe niepełne - dotłumaczono {missing} pól osobno.")
+    return results
+
+
 def save_file(root_folder, lang_code, sub_dir, filename, content):
+    dataset_writer.put(make_doc_id(sub_dir, filename), root_folder, content, lang=lang_code)
+    if not WRITE_TEXT_TREES:
+        return
     path = Path(root_folder) / lang_code / sub_dir
     path.mkdir(parents=True, exist_ok=True)
     with open(path / filename, "w", encoding="utf-8") as f:
@@ -158,76 +278,105 @@ def save_file(root_folder, lang_code, sub_dir, filename, content):
 
 
 def save_meta(root_folder, sub_dir, filename, content):
+    dataset_writer.put(make_doc_id(sub_dir, filename), root_folder, content)
+    if not WRITE_TEXT_TREES:
+        return
     path = Path(root_folder) / sub_dir
     path.mkdir(parents=True, exist_ok=True)
     with open(path / filename, "w", encoding="utf-8") as f:
         f.write(str(content))
 
 
-def process_file(file_path, input_root):
+def process_file(file_path, input_root, raw_text=None, ocr_fp=None):
     rel_path = file_path.relative_to(input_root)
-    rel_path_str = str(rel_path)  # Klucz do pliku historii
+    rel_path_str = str(rel_path)  # Klucz dokumentu w bazie stanu
 
     base_filename = rel_path.stem + ".txt"
     sub_dir = rel_path.parent
     hinted_type = sub_dir.name if sub_dir.name != input_root.name else None
 
-    # 1. OCR
-    raw_text = perform_ocr(file_path)
+    # 1. OCR (zwykle wykonany już wcześniej w puli procesów albo wznowiony z bazy)
+    # stale: czy któryś etap liczono od nowa - tylko wtedy zapisujemy wyniki ponownie
+    ocr_fp = ocr_fp or ocr_fingerprint(file_path)
+    stale = not job_state.is_done(rel_path_str, OCR_STAGE, ocr_fp)
+    raw_text = job_state.run(rel_path_str, OCR_STAGE,
+                             lambda: raw_text if raw_text is not None else perform_ocr(file_path),
+                             fingerprint=ocr_fp)
 
     if not raw_text.strip():
         print("   ⚠️ Pusty OCR - oznaczam jako przetworzony (bez wyników).")
         mark_as_done(rel_path_str)
         return
 
-    # Zapisz oryginał (Content) - to zostaje, bo to dane wejściowe
-    save_meta("content", sub_dir, base_filename, raw_text)
-
     # 2. Analiza podstawowa (Core)
-    core_data = get_core_metadata(raw_text, hinted_type)
+    core_fp = core_fingerprint(raw_text, hinted_type)
+    stale |= not job_state.is_done(rel_path_str, CORE_STAGE, core_fp)
+    core_data = job_state.run(rel_path_str, CORE_STAGE, lambda: get_core_metadata(raw_text, hinted_type),
+                              fingerprint=core_fp)
 
     if not core_data:
         print("   ❌ Błąd analizy AI. Przerywam dla tego pliku.")
         return
 
+    base_title = core_data.get("title_base", "Document")
+    base_summary = core_data.get("summary_base", "No summary.")
+
+    # 3. Pętla Tłumaczeń (TYLKO ETYKIETY) - tylko etapy brakujące lub nieaktualne
+    sources = {"title": base_title, "summary": base_summary}
+    fingerprints = {(code, field): label_fingerprint(field, code, sources[field])
+                    for code in TARGET_LANGUAGES if code != "en" for field in LABEL_FIELDS}
+    needed = {key for key, fp in fingerprints.items()
+              if not job_state.is_done(rel_path_str, label_stage(key[1], key[0]), fp)}
+
+    if not stale and not needed and job_state.is_done(rel_path_str, DONE_STAGE):
+        # --refresh: wszystkie etapy aktualne - bez ponownego zapisu drzew i rekordu w spakowanym zbiorze
+        print("   ⏩ Wszystkie etapy aktualne - pomijam zapis.")
+        return
+
+    # Zapisz oryginał (Content) - to zostaje, bo to dane wejściowe
+    save_meta("content", sub_dir, base_filename, raw_text)
+
     # Zapisz dane niezależne od języka
     save_meta("category", sub_dir, base_filename, core_data.get("category", "other"))
     save_meta("type", sub_dir, base_filename, core_data.get("type", "other"))
     save_meta("info", sub_dir, base_filename, core_data.get("info", "none"))
 
-    base_title = core_data.get("title_base", "Document")
-    base_summary = core_data.get("summary_base", "No summary.")
-
-    # 3. Pętla Tłumaczeń (TYLKO ETYKIETY)
-    print("   🌍 Rozpoczynam generowanie etykiet (tytuły/podsumowania)...")
+    if needed:
+        print(f"   🌍 Generowanie etykiet (tytuły/podsumowania): {len(needed)} do przeliczenia...")
+        for code, field in needed:
+            job_state.start(rel_path_str, label_stage(field, code))
+        for code, fields in translate_labels(base_title, base_summary, needed).items():
+            for field, value in fields.items():
+                job_state.finish_result(rel_path_str, label_stage(field, code), value,
+                                        fingerprint=fingerprints[(code, field)])
 
     for code, lang_name in TARGET_LANGUAGES.items():
         print(f"      -> [{code.upper()}] {lang_name}...", end="", flush=True)
 
-        # A. Tytuł
         if code == "en":
-            final_title = base_title
+            labels = {"title": base_title, "summary": base_summary}
         else:
-            final_title = translate_section(base_title, lang_name, "title")
-        save_file("titles", code, sub_dir, base_filename, final_title)
+            labels = {field: job_state.result(rel_path_str, label_stage(field, code)) for field in LABEL_FIELDS}
+
+        # A. Tytuł
+        save_file("titles", code, sub_dir, base_filename, labels["title"])
 
         # B. Streszczenie
-        if code == "en":
-            final_summary = base_summary
-        else:
-            final_summary = translate_section(base_summary, lang_name, "summary")
-        save_file("summary", code, sub_dir, base_filename, final_summary)
+        save_file("summary", code, sub_dir, base_filename, labels["summary"])
 
         # C. Pełna treść - USUNIĘTO (Oszczędność czasu i tokenów)
-        
+
         print(" OK.")
 
-    # SUKCES! Dopiero tutaj zapisujemy do historii
+    # SUKCES! Dopiero tutaj zamykamy rekord; dokument zostanie oznaczony po zapisie shardu
+    dataset_writer.commit(make_doc_id(sub_dir, base_filename), rel_path_str)
     print(f"✅ Zakończono: {file_path.name}")
-    mark_as_done(rel_path_str)
 
 
 def main():
+    # --refresh: przejrzyj także zakończone dokumenty i przelicz tylko nieaktualne etapy
+    refresh = "--refresh" in sys.argv[1:]
+
     input_root = Path(INPUT_DIR)
     if not input_root.exists():
         print(f"Brak folderu wejściowego: {INPUT_DIR}")
@@ -236,27 +385,60 @@ def main():
     # Wczytaj historię
     processed_files = load_history()
     print(f"📂 Załadowano historię: {len(processed_files)} plików już przetworzonych.")
+    if refresh:
+        print("🔄 Tryb odświeżania: przeliczam tylko etapy z nieaktualnym odciskiem wejść.")
 
     all_files = [f for f in input_root.rglob("*") if
                  f.is_file() and f.suffix.lower() in [".pdf", ".jpg", ".png", ".jpeg"]]
     print(f"🚀 Znaleziono łącznie {len(all_files)} plików do analizy.")
 
+    # Dokumenty ze starej historii nie mają zapisanych etapów ani odcisków - nie wiemy,
+    # z jakich wejść powstały, więc także w trybie --refresh uznajemy je za aktualne
+    legacy_files = processed_files - job_state.staged_docs(OCR_STAGE) if refresh else set()
+    if legacy_files:
+        print(f"⏩ Pomijam {len(legacy_files)} dokumentów ze starej historii (brak odcisków wejść).")
+
+    pending_files = []
     for f in all_files:
         rel_path_str = str(f.relative_to(input_root))
 
         # Sprawdzenie w historii
-        if rel_path_str in processed_files:
-            print(f"⏩ Pomijam (już w historii): {rel_path_str}")
+        if rel_path_str in processed_files and (not refresh or rel_path_str in legacy_files):
+            if not refresh:
+                print(f"⏩ Pomijam (już w historii): {rel_path_str}")
             continue
-
-        print(f"\n📄 Przetwarzanie: {rel_path_str}")
-        try:
-            process_file(f, input_root)
-        except KeyboardInterrupt:
-            print("\n🛑 Zatrzymano przez użytkownika. Postęp zapisany.")
-            break
-        except Exception as e:
-            print(f"\n❌ Krytyczny błąd dla {rel_path_str}: {e}")
+        pending_files.append(f)
+
+    def pending(hash_pool):
+        """
+        Odciski OCR (hash pliku) liczone równolegle w puli wątków z wyprzedzeniem okna OCR;
+        stan sprawdzany leniwie, gdy plik wchodzi do okna - bez wczytywania tekstów z góry.
+        """
+        for f, fingerprint, error in iter_ordered(hash_pool, pending_files, ocr_fingerprint, OCR_MAX_IN_FLIGHT):
+            if error is not None:  # Błąd odczytu pliku zgłosi process_file
+                yield f, None, False
+                continue
+            # Wznowienie: plik z aktualnym etapem OCR nie trafia ponownie do puli
+            yield f, fingerprint, job_state.is_done(str(f.relative_to(input_root)), OCR_STAGE, fingerprint)
+
+    print(f"⚙️  OCR: {OCR_WORKERS} procesów, maks. {OCR_MAX_IN_FLIGHT} plików w kolejce.")
+
+    pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    hash_pool = ThreadPoolExecutor(max_workers=OCR_WORKERS)
+    try:
+        for f, fingerprint, raw_text in iter_ocr_results(pool, pending(hash_pool)):
+            rel_path_str = str(f.relative_to(input_root))
+            print(f"\n📄 Przetwarzanie: {rel_path_str}")
+            try:
+                process_file(f, input_root, raw_text, fingerprint)
+            except Exception as e:
+                print(f"\n❌ Krytyczny błąd dla {rel_path_str}: {e}")
+    except KeyboardInterrupt:
+        print("\n🛑 Zatrzymano przez użytkownika. Postęp zapisany.")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        hash_pool.shutdown(wait=False, cancel_futures=True)
+        dataset_writer.close()
 
 
 if __name__ == "__main__":
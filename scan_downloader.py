@@ -0,0 +1,322 @@
+import json
+import time
+import random
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from urllib.parse import quote_plus, urlsplit
+import requests
+from bs4 import BeautifulSoup
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from image_prefilter import PhashIndex, phash
+from scan_manifest import ScanManifest, MANIFEST_FILE
+
+# --- KONFIGURACJA ---
+SEARCH_URL = "https://www.bing.com/images/search?q={query}&form=HDRSC2"  # Podmienialny (np. lokalny serwer testowy)
+DOWNLOAD_WORKERS = 8          # Łączna liczba równoległych pobrań (wszystkie kategorie)
+CATEGORY_WORKERS = 4          # Kategorie przetwarzane naraz
+PER_HOST_CONCURRENCY = 2      # Maks. równoległych połączeń do jednego hosta
+HOST_DELAY = (0.2, 0.5)       # Odstęp [s] między zapytaniami do tego samego hosta (losowy z przedziału)
+SEARCH_HOST_DELAY = (3, 6)    # Wyszukiwarka - dawna przerwa między kategoriami, teraz limit per host
+MAX_IMAGE_BYTES = 15 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = (5, 15)             # (połączenie, odczyt)
+SKIPPED_URL_PARTS = (".pdf", ".html", ".php")
+SEARCH_MAX_AGE = 7 * 24 * 3600  # Młodsze wyniki wyszukiwania z manifestu używane bez nowego zapytania
+STOP_POLL = 0.5               # Co ile [s] kategoria sprawdza flagę zatrzymania, czekając na pobrania
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+# Rozpoznawanie formatu po pierwszych bajtach (nagłówek Content-Type bywa błędny)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"BM", ".bmp"),
+)
+IMAGE_EXTENSIONS = (".jpg", ".png", ".bmp", ".webp")
+
+# Wyniki pobierania
+SAVED = "saved"
+DUPLICATE = "duplicate"
+TOO_LARGE = "too_large"
+NOT_IMAGE = "not_image"
+FAILED = "failed"
+
+
+def sniff_extension(head):
+    """Rozszerzenie obrazu na podstawie sygnatury pliku albo None."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return next((ext for signature, ext in IMAGE_SIGNATURES if head.startswith(signature)), None)
+
+
+def make_session(pool_size):
+    """Sesja z pulą połączeń keep-alive i ponawianiem błędów przejściowych."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HostLimiter:
+    """Limit równoległych połączeń i minimalny odstęp między zapytaniami - osobno dla każdego hosta."""
+
+    def __init__(self, concurrency=PER_HOST_CONCURRENCY, delay=HOST_DELAY, overrides=None):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.overrides = overrides or {}
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._next_time = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._slots.setdefault(host, threading.Semaphore(self.concurrency))
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_time.get(host, now))
+                self._next_time[host] = start + random.uniform(*self.overrides.get(host, self.delay))
+            time.sleep(start - now)
+            yield
+
+
+class ScanDownloader:
+    """
+    Równoległe pobieranie obrazów z wyników wyszukiwania: wspólna pula połączeń,
+    limity per host, zapis strumieniowy z limitem rozmiaru, rozpoznawanie formatu
+    po zawartości i deduplikacja (SHA-256 + pHash) już przy pobieraniu.
+    Manifest (scan_manifest.py) pozwala wznawiać: znane adresy są pomijane,
+    a kategoria jest dopełniana tylko do `limit` obrazów.
+    """
+
+    def __init__(self, output_dir, limit, search_url=SEARCH_URL, workers=DOWNLOAD_WORKERS,
+                 max_bytes=MAX_IMAGE_BYTES):
+        self.output_dir = Path(output_dir)
+        self.limit = limit
+        self.search_url = search_url
+        self.max_bytes = max_bytes
+        self.session = make_session(workers + CATEGORY_WORKERS)
+        self.limiter = HostLimiter(overrides={urlsplit(search_url).netloc: SEARCH_HOST_DELAY})
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.manifest = ScanManifest(self.output_dir / MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()  # Ustawiana przy przerwaniu - kategorie przestają zlecać pobrania
+        self._hashes = set()
+        self._phashes = PhashIndex()
+        self._next_index = {}  # (folder, prefiks) -> pierwszy wolny numer {prefiks}_{n}
+        self._seed_existing()
+
+    def _seed_existing(self):
+        """
+        Pliki pobrane wcześniej też są punktem odniesienia dla duplikatów (hashe z manifestu, gdy są).
+        Obrazy sprzed manifestu ({folder}_{n}.jpg) są do niego dopisywane jako zapisane
+        (adres "file:<ścieżka>"), więc liczą się do limitu kategorii i nie są hashowane ponownie.
+        """
+        known = set()
+        for file, sha, value in self.manifest.saved_files():
+            known.add(file)
+            self._hashes.add(sha)
+            if value is not None:
+                self._phashes.add(int(value, 16), file)
+        if not self.output_dir.exists():
+            return
+        for file_path in sorted(self.output_dir.rglob("*")):
+            rel = self._rel(file_path)
+            if file_path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            prefix, _, number = file_path.stem.rpartition("_")
+            if number.isdigit():
+                key = (file_path.parent, prefix)
+                self._next_index[key] = max(self._next_index.get(key, 0), int(number) + 1)
+            if rel in known:
+                continue
+            sha = hashlib.sha256(file_path.read_bytes()).hexdigest()
+            self._hashes.add(sha)
+            value = None
+            try:
+                with Image.open(file_path) as image:
+                    value = phash(image)
+                self._phashes.add(value, rel)
+            except Exception:
+                pass
+            if file_path.parent != self.output_dir:
+                self.manifest.record(f"file:{rel}", rel.split("/")[0], SAVED, rel, sha,
+                                     None if value is None else f"{value:016x}", "sprzed manifestu")
+
+    def _rel(self, file_path):
+        return file_path.relative_to(self.output_dir).as_posix()
+
+    def search(self, query, folder_name):
+        """
+        Adresy obrazów z wyników wyszukiwania. Świeże wyniki z manifestu nie wymagają
+        zapytania; starsze są odświeżane warunkowo (ETag/Last-Modified, 304 = bez zmian).
+        """
+        cached = self.manifest.search(folder_name, query)
+        if cached is not None and time.time() - cached["fetched_at"] < SEARCH_MAX_AGE:
+            return cached["links"]
+
+        headers = {}
+        if cached is not None and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached is not None and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        url = self.search_url.format(query=quote_plus(query))
+        with self.limiter.slot(url):
+            response = self.session.get(url, timeout=TIMEOUT, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            links = cached["links"]
+        else:
+            response.raise_for_status()
+            soup = BeautifulSoup(response.text, 'html.parser')
+            links = []
+            for a in soup.find_all("a", {"class": "iusc"}):
+                if "m" in a.attrs:
+                    links.append(json.loads(a["m"])["murl"])
+            if cached is not None:
+                links = list(dict.fromkeys(links + cached["links"]))  # Starsze, jeszcze niepobrane adresy zostają
+        self.manifest.save_search(folder_name, query, links,
+                                  response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return links
+
+    def fetch(self, url, target_dir, name_prefix):
+        """Pobiera jeden obraz i zapisuje wynik w manifeście: (status, ścieżka albo szczegóły)."""
+        status, detail, sha, value = self._fetch(url, target_dir, name_prefix)
+        file = self._rel(detail) if status == SAVED else None
+        self.manifest.record(url, target_dir.name, status, file, sha,
+                             None if value is None else f"{value:016x}", None if status == SAVED else detail)
+        return status, detail
+
+    def _fetch(self, url, target_dir, name_prefix):
+        tmp_path = target_dir / f".{hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}.part"
+        try:
+            with self.limiter.slot(url):
+                with self.session.get(url, timeout=TIMEOUT, stream=True) as response:
+                    if response.status_code != 200:
+                        return FAILED, f"HTTP {response.status_code}", None, None
+                    declared = int(response.headers.get("Content-Length") or 0)
+                    if declared > self.max_bytes:
+                        return TOO_LARGE, f"{declared} B", None, None
+
+                    digest = hashlib.sha256()
+                    size, ext = 0, None
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            if ext is None:
+                                ext = sniff_extension(chunk)
+                                if ext is None:
+                                    return NOT_IMAGE, response.headers.get("Content-Type", "?"), None, None
+                            size += len(chunk)
+                            if size > self.max_bytes:
+                                return TOO_LARGE, f"> {self.max_bytes} B", None, None
+                            digest.update(chunk)
+                            f.write(chunk)
+            if ext is None:
+                return NOT_IMAGE, "pusta odpowiedź", None, None
+
+            try:
+                with Image.open(tmp_path) as image:
+                    value = phash(image)
+            except Exception:
+                return NOT_IMAGE, "nie da się zdekodować", None, None
+
+            with self._lock:
+                sha = digest.hexdigest()
+                if sha in self._hashes:
+                    return DUPLICATE, "SHA-256", sha, value
+                match = self._phashes.find(value)
+                if match is not None:
+                    return DUPLICATE, f"pHash ~ {match[0]} (odległość {match[1]})", sha, value
+                target = self._reserve_path(target_dir, name_prefix, ext)
+                self._hashes.add(sha)
+                self._phashes.add(value, self._rel(target))
+            tmp_path.replace(target)
+            return SAVED, target, sha, value
+        except Exception as e:  # Sieć, zerwane połączenie, dysk (OSError) - błąd jednego adresu, nie kategorii
+            return FAILED, f"{type(e).__name__}: {e}", None, None
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _reserve_path(self, target_dir, name_prefix, ext):
+        """Kolejna wolna nazwa {prefiks}_{n} z licznika folderu (wywoływane pod self._lock)."""
+        key = (target_dir, name_prefix)
+        index = self._next_index.get(key, 0)
+        self._next_index[key] = index + 1
+        return target_dir / f"{name_prefix}_{index}{ext}"
+
+    def download_category(self, query, folder_name):
+        """
+        Dopełnia kategorię do `limit` unikalnych obrazów (pliki z manifestu, które
+        nadal istnieją, się liczą); zleceń w locie nigdy więcej niż brakuje.
+        """
+        # Zbiór, bo nazwa usuniętego pliku może zostać użyta ponownie przez nowszy wpis
+        have = len({file for file, _, _ in self.manifest.saved_files(folder_name) if (self.output_dir / file).exists()})
+        missing = self.limit - have
+        if missing <= 0:
+            print(f"✅ [{folder_name}] komplet ({have}/{self.limit}) - pomijam.")
+            return 0
+
+        print(f"\n🚀 POBIERANIE WYPEŁNIONYCH: {folder_name.upper()} (brakuje {missing})")
+        try:
+            links = self.search(query, folder_name)
+        except Exception as e:
+            print(f"  🚨 Błąd [{folder_name}]: {e}")
+            return 0
+        links = [url for url in dict.fromkeys(links)
+                 if not any(part in url.lower() for part in SKIPPED_URL_PARTS) and self.manifest.should_fetch(url)]
+        print(f"  🔍 [{folder_name}] Nowe linki: {len(links)}")
+
+        target_dir = self.output_dir / folder_name
+        target_dir.mkdir(parents=True, exist_ok=True)
+        links = iter(links)
+        downloaded, pending = 0, set()
+        while downloaded < missing and not self._stop.is_set():
+            while len(pending) < missing - downloaded:
+                url = next(links, None)
+                if url is None:
+                    break
+                pending.add(self.pool.submit(self.fetch, url, target_dir, folder_name))
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=STOP_POLL, return_when=FIRST_COMPLETED)
+            for future in done:
+                status, detail = future.result()
+                if status == SAVED:
+                    downloaded += 1
+                    print(f"    ✅ [{folder_name} {have + downloaded}/{self.limit}] {detail.name}")
+        for future in pending:  # Zatrzymanie - niezaczęte pobrania odpadają
+            future.cancel()
+        return downloaded
+
+    def run(self, categories):
+        """
+        Wszystkie kategorie ({folder: zapytanie}) równolegle, z limitami per host.
+        Przerwanie (Ctrl+C, błąd) zatrzymuje zlecanie i anuluje kolejki obu pul,
+        zamiast czekać na dokończenie całego pobierania.
+        """
+        category_pool = ThreadPoolExecutor(max_workers=CATEGORY_WORKERS)
+        futures = {category_pool.submit(self.download_category, query, folder): folder
+                   for folder, query in categories.items()}
+        try:
+            return {futures[future]: future.result() for future in futures}
+        except BaseException:
+            self._stop.set()
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            category_pool.shutdown(wait=False, cancel_futures=True)
+            self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+# --- KONFIGURACJA ---
+MANIFEST_FILE = "scan_manifest.sqlite"  # W katalogu wyjściowym scrapera
+MAX_URL_ATTEMPTS = 3                    # Po tylu nieudanych próbach adres jest pomijany
+
+# Statusy adresów, których nie pobieramy ponownie (FAILED - ponawiany do MAX_URL_ATTEMPTS)
+FINAL_STATUSES = ("saved", "duplicate", "too_large", "not_image")
+STATUS_SAVED = "saved"
+STATUS_FAILED = "failed"
+
+
+class ScanManifest:
+    """
+    Trwały manifest scrapera (SQLite, WAL): zapytanie -> adresy z wyników
+    (z ETag/Last-Modified do zapytań warunkowych) oraz adres -> plik, hash i status.
+    Ponowne uruchomienie pomija znane adresy i dopełnia tylko brakujące kategorie.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS searches (
+                    folder TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    links TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (folder, query)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    folder TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    file TEXT,
+                    sha256 TEXT,
+                    phash TEXT,
+                    detail TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_urls_folder ON urls(folder, status)")
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _write(self, sql, params=()):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(sql, params)
+            conn.commit()
+
+    # --- Wyniki wyszukiwania ---
+    def search(self, folder, query):
+        """Zapisane wyniki: {'links', 'etag', 'last_modified', 'fetched_at'} albo None."""
+        rows = self._query("SELECT links, etag, last_modified, fetched_at FROM searches "
+                           "WHERE folder = ? AND query = ?", (folder, query))
+        if not rows:
+            return None
+        links, etag, last_modified, fetched_at = rows[0]
+        return {"links": json.loads(links), "etag": etag, "last_modified": last_modified,
+                "fetched_at": fetched_at}
+
+    def save_search(self, folder, query, links, etag=None, last_modified=None):
+        self._write("INSERT OR REPLACE INTO searches (folder, query, links, etag, last_modified, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (folder, query, json.dumps(links), etag, last_modified, time.time()))
+
+    # --- Adresy obrazów ---
+    def should_fetch(self, url):
+        rows = self._query("SELECT status, attempts FROM urls WHERE url = ?", (url,))
+        if not rows:
+            return True
+        status, attempts = rows[0]
+        return status not in FINAL_STATUSES and attempts < MAX_URL_ATTEMPTS
+
+    def record(self, url, folder, status, file=None, sha256=None, phash=None, detail=None):
+        self._write("""
+            INSERT INTO urls (url, folder, status, file, sha256, phash, detail, attempts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                status = excluded.status, file = excluded.file, sha256 = excluded.sha256,
+                phash = excluded.phash, detail = excluded.detail,
+                attempts = urls.attempts + 1, updated_at = excluded.updated_at
+        """, (url, folder, status, file, sha256, phash, detail, time.time()))
+
+    def saved_files(self, folder=None):
+        """[(plik, sha256, phash)] zapisanych obrazów (opcjonalnie jednej kategorii)."""
+        if folder is None:
+            return self._query("SELECT file, sha256, phash FROM urls WHERE status = ?", (STATUS_SAVED,))
+        return self._query("SELECT file, sha256, phash FROM urls WHERE status = ? AND folder = ?",
+                           (STATUS_SAVED, folder))
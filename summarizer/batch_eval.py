@@ -0,0 +1,108 @@
+import sys
+import json
+import time
+import torch
+from pathlib import Path
+
+# --- KONFIGURACJA ---
+SUMMARIZER_DIR = Path(__file__).resolve().parent
+BASE_DIR = SUMMARIZER_DIR.parent
+REPORT_DIR = SUMMARIZER_DIR / "reports"
+
+TASKS = ("headline", "summarize")
+DEFAULT_BATCH_SIZE = 8
+SCAN_EXTENSIONS = {".jpg", ".jpeg", ".png", ".pdf"}
+
+# Wspólny moduł OCR (z cache) leży w katalogu głównym projektu
+sys.path.append(str(BASE_DIR))
+from ocr import perform_ocr  # noqa: E402
+
+
+def default_report_path(prefix):
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    return REPORT_DIR / f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"
+
+
+def list_scans(directory):
+    return sorted(f for f in Path(directory).glob("*") if f.suffix.lower() in SCAN_EXTENSIONS)
+
+
+def build_prompts(files, tasks=TASKS):
+    """OCR plików -> lista {file, task, prompt}. Pliki z pustym OCR są pomijane."""
+    items = []
+    for file_path in files:
+        ocr_text = perform_ocr(file_path).strip()
+        if not ocr_text:
+            print(f"⚠️ Pusty OCR: {file_path.name} - pomijam.")
+            continue
+        for task in tasks:
+            items.append({"file": file_path.name, "task": task, "prompt": f"{task}: {ocr_text}"})
+    return items
+
+
+def length_batches(items, tokenizer, batch_size, max_length):
+    """Grupuje prompty o podobnej długości (w tokenach), żeby ograniczyć padding."""
+    lengths = [len(tokenizer(item["prompt"], max_length=max_length, truncation=True)["input_ids"])
+               for item in items]
+    order = sorted(range(len(items)), key=lambda i: lengths[i])
+    for start in range(0, len(order), batch_size):
+        yield [items[i] for i in order[start:start + batch_size]]
+
+
+def generate_batch(prompts, tokenizer, model, device, max_length, **generate_kwargs):
+    """model.generate dla całej paczki (padding do najdłuższego promptu w paczce)."""
+    inputs = tokenizer(prompts, return_tensors="pt", max_length=max_length,
+                       truncation=True, padding=True).to(device)
+    with torch.no_grad():
+        outputs = model.generate(**inputs, **generate_kwargs)
+    texts = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    input_lens = inputs["attention_mask"].sum(dim=1).tolist()
+    return texts, input_lens
+
+
+class JsonlReport:
+    """Raport JSONL zapisywany strumieniowo (jedna linia na wynik, flush po każdej)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "w", encoding="utf-8")
+        return self
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+def run_batched(items, tokenizer, model, device, report, batch_size, max_length,
+                on_result=None, **generate_kwargs):
+    """
+    Generuje wyniki paczkami i strumieniuje je do raportu.
+    on_result(item, text) może dopisać do rekordu dodatkowe pola (np. wynik TFLite).
+    """
+    done = 0
+    start = time.perf_counter()
+    for batch in length_batches(items, tokenizer, batch_size, max_length):
+        batch_start = time.perf_counter()
+        texts, input_lens = generate_batch([item["prompt"] for item in batch], tokenizer, model,
+                                           device, max_length, **generate_kwargs)
+        batch_time = time.perf_counter() - batch_start
+
+        for item, text, input_len in zip(batch, texts, input_lens):
+            record = {"file": item["file"], "task": item["task"], "input_tokens": input_len,
+                      "output": text, "batch_size": len(batch), "batch_seconds": round(batch_time, 4)}
+            if on_result is not None:
+                record.update(on_result(item, text) or {})
+            report.write(record)
+
+        done += len(batch)
+        print(f"  📦 {done}/{len(items)} promptów ({batch_time:.2f}s / paczka {len(batch)})")
+
+    elapsed = time.perf_counter() - start
+    print(f"⏱️  {len(items)} promptów w {elapsed:.1f}s ({len(items) / max(elapsed, 1e-9):.2f} promptów/s)")
@@ -0,0 +1,315 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+# --- KONFIGURACJA ---
+SUMMARIZER_DIR = Path(__file__).resolve().parent
+BASE_DIR = SUMMARIZER_DIR.parent
+MODELS_DIR = SUMMARIZER_DIR / "models"
+PT_MODEL_PATH = MODELS_DIR / "flan_t5_custom"
+CONTENT_DIR = BASE_DIR / "content"
+RESULTS_DIR = SUMMARIZER_DIR / "benchmarks"
+BASELINE_FILE = RESULTS_DIR / "baseline.json"
+
+PYTORCH_BACKEND = "pytorch"
+TASKS = ("headline", "summarize")
+CORPUS_SIZE = 20        # Dokumentów z content/ (x2 prompty: headline + summarize)
+CORPUS_SEED = 42        # Stały seed = zawsze ten sam korpus
+MAX_LEN = 256           # Zgodne z konwersją TFLite
+MAX_NEW_TOKENS = 64
+WARMUP_PROMPTS = 2      # Nie wliczane do wyników
+TFLITE_THREADS = os.cpu_count() or 1
+REGRESSION_TOLERANCE = 0.10  # 10% gorzej niż baseline = regresja
+
+# Metryki porównywane z baseline: nazwa -> czy mniejsza wartość jest lepsza
+COMPARED_METRICS = {
+    "load_s": True,
+    "peak_rss_mb": True,
+    "encoder_ms": True,
+    "ttft_ms": True,
+    "decode_ms_per_token": True,
+    "tokens_per_s": False,
+}
+
+# ru_maxrss: kilobajty na Linuksie, bajty na macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+# --- KORPUS ---
+
+def load_corpus(size=CORPUS_SIZE, seed=CORPUS_SEED):
+    """Deterministyczna próbka dokumentów z content/ -> lista {doc, task, prompt} + odcisk korpusu."""
+    files = sorted(CONTENT_DIR.rglob("*.txt"))
+    chosen = sorted(random.Random(seed).sample(files, min(size, len(files))))
+
+    prompts = []
+    digest = hashlib.sha256()
+    for file_path in chosen:
+        text = file_path.read_text(encoding="utf-8").strip()
+        doc = file_path.relative_to(CONTENT_DIR).as_posix()
+        digest.update(doc.encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+        for task in TASKS:
+            prompts.append({"doc": doc, "task": task, "prompt": f"{task}: {text}"})
+    return prompts, digest.hexdigest()
+
+
+def list_backends():
+    backends = [PYTORCH_BACKEND] if PT_MODEL_PATH.exists() else []
+    return backends + [path.stem for path in sorted(MODELS_DIR.glob("*.tflite"))]
+
+
+# --- POMIARY (uruchamiane w osobnym procesie na backend) ---
+
+def _sample_metrics(start, encoder_s, token_stamps):
+    """Metryki jednego promptu z czasu startu i znaczników czasu kolejnych tokenów."""
+    steps = [b - a for a, b in zip(token_stamps, token_stamps[1:])]
+    total = token_stamps[-1] - start if token_stamps else 0.0
+    return {
+        "encoder_ms": None if encoder_s is None else encoder_s * 1000,
+        "ttft_ms": (token_stamps[0] - start) * 1000 if token_stamps else None,
+        "decode_ms_per_token": statistics.mean(steps) * 1000 if steps else None,
+        "tokens_per_s": len(token_stamps) / total if total > 0 else None,
+        "tokens": len(token_stamps),
+    }
+
+
+def _bench_pytorch(max_new_tokens):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+    device = "mps" if torch.backends.mps.is_available() else "cpu"
+    load_start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(PT_MODEL_PATH)
+    model = AutoModelForSeq2SeqLM.from_pretrained(PT_MODEL_PATH).to(device).eval()
+    load_s = time.perf_counter() - load_start
+
+    def sync():
+        if device == "mps":
+            torch.mps.synchronize()
+
+    def run(prompt):
+        # Ręczny greedy z cache K/V, żeby zmierzyć enkoder i każdy krok dekodera osobno
+        inputs = tokenizer(prompt, return_tensors="pt", max_length=MAX_LEN, truncation=True).to(device)
+        stamps = []
+        with torch.no_grad():
+            start = time.perf_counter()
+            encoder_outputs = model.get_encoder()(**inputs)
+            sync()
+            encoder_s = time.perf_counter() - start
+
+            decoder_input_ids = torch.tensor([[model.config.decoder_start_token_id]], device=device)
+            past = None
+            for _ in range(max_new_tokens):
+                output = model(encoder_outputs=encoder_outputs, attention_mask=inputs["attention_mask"],
+                               decoder_input_ids=decoder_input_ids, past_key_values=past, use_cache=True)
+                past = output.past_key_values
+                next_token = int(output.logits[0, -1].argmax())  # int() synchronizuje urządzenie
+                stamps.append(time.perf_counter())
+                if next_token == model.config.eos_token_id:
+                    break
+                decoder_input_ids = torch.tensor([[next_token]], device=device)
+        return _sample_metrics(start, encoder_s, stamps)
+
+    return load_s, run
+
+
+def _bench_tflite(model_path, max_new_tokens):
+    import numpy as np
+    import tensorflow as tf
+    from transformers import AutoTokenizer
+    from tflite_generation import generate_tflite, has_kv_signatures, kv_signature_suffix
+
+    load_start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(PT_MODEL_PATH)
+    interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=TFLITE_THREADS)
+    interpreter.allocate_tensors()
+    load_s = time.perf_counter() - load_start
+    kv_model = has_kv_signatures(interpreter)
+
+    def run(prompt):
+        encoder_s = None
+        if kv_model:
+            # Enkoder mierzony osobnym wywołaniem (w generowaniu jest częścią TTFT)
+            encode = interpreter.get_signature_runner("encode" + kv_signature_suffix(interpreter, tokenizer, prompt))
+            max_len = int(encode.get_input_details()["input_ids"]["shape"][1])
+            encoded = tokenizer(prompt, max_length=max_len, truncation=True, padding="max_length")
+            enc_start = time.perf_counter()
+            encode(input_ids=np.array([encoded["input_ids"]], dtype=np.int32),
+                   attention_mask=np.array([encoded["attention_mask"]], dtype=np.int32))
+            encoder_s = time.perf_counter() - enc_start
+
+        stamps = []
+        start = time.perf_counter()
+        generate_tflite(prompt, interpreter, tokenizer, max_new_tokens,
+                        on_token=lambda i, token: stamps.append(time.perf_counter()))
+        return _sample_metrics(start, encoder_s, stamps)
+
+    return load_s, run
+
+
+def _aggregate(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return {
+        "mean": statistics.mean(values),
+        "p50": values[len(values) // 2],
+        "p90": values[min(len(values) - 1, int(len(values) * 0.9))],
+    }
+
+
+def run_worker(backend, prompts, max_new_tokens):
+    """Pełny pomiar jednego backendu (w czystym procesie, żeby peak RSS i load time były miarodajne)."""
+    if backend == PYTORCH_BACKEND:
+        load_s, run = _bench_pytorch(max_new_tokens)
+    else:
+        load_s, run = _bench_tflite(MODELS_DIR / f"{backend}.tflite", max_new_tokens)
+
+    for item in prompts[:WARMUP_PROMPTS]:
+        run(item["prompt"])
+
+    samples = [run(item["prompt"]) for item in prompts]
+    metrics = {name: _aggregate([s[name] for s in samples])
+               for name in ("encoder_ms", "ttft_ms", "decode_ms_per_token", "tokens_per_s")}
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT / 2**20,
+        "prompts": len(samples),
+        "generated_tokens": sum(s["tokens"] for s in samples),
+        "metrics": metrics,
+    }
+
+
+# --- PORÓWNANIE Z BASELINE ---
+
+def _metric_value(result, name):
+    if name in result:
+        return result[name]
+    stats = result["metrics"].get(name)
+    return stats["mean"] if stats else None
+
+
+def compare_with_baseline(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Zwraca listę regresji (backend, metryka, baseline, teraz, zmiana)."""
+    if baseline.get("corpus_hash") != report["corpus_hash"]:
+        print("⚠️ Baseline policzony na innym korpusie - porównanie orientacyjne.")
+
+    regressions = []
+    for backend, result in report["backends"].items():
+        base = baseline.get("backends", {}).get(backend)
+        if base is None:
+            print(f"ℹ️ [{backend}] brak w baseline.")
+            continue
+        for name, lower_is_better in COMPARED_METRICS.items():
+            old, new = _metric_value(base, name), _metric_value(result, name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            marker = "❌" if worse else "✅"
+            print(f"  {marker} [{backend}] {name:<20} {old:>10.2f} -> {new:>10.2f} ({change:+.1%})")
+            if worse:
+                regressions.append((backend, name, old, new, change))
+    return regressions
+
+
+# --- MAIN ---
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark summaryzatora: PyTorch vs eksporty TFLite.")
+    parser.add_argument("--backends", nargs="*", help="Domyślnie: pytorch + wszystkie models/*.tflite")
+    parser.add_argument("--corpus-size", type=int, default=CORPUS_SIZE)
+    parser.add_argument("--max-new-tokens", type=int, default=MAX_NEW_TOKENS)
+    parser.add_argument("--output", type=Path, help="Plik JSON z wynikami")
+    parser.add_argument("--baseline", type=Path, nargs="?", const=BASELINE_FILE,
+                        help="Porównaj z zapisanym baseline (domyślnie benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Zapisz wynik jako nowy baseline")
+    # Tryb wewnętrzny: pomiar jednego backendu w osobnym procesie
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--prompts-file", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", type=Path, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.worker:
+        prompts = json.loads(args.prompts_file.read_text(encoding="utf-8"))
+        result = run_worker(args.worker, prompts, args.max_new_tokens)
+        args.result_file.write_text(json.dumps(result), encoding="utf-8")
+        return
+
+    backends = args.backends or list_backends()
+    if not backends:
+        print(f"❌ Brak modeli w {MODELS_DIR}.")
+        sys.exit(1)
+
+    prompts, corpus_hash = load_corpus(args.corpus_size)
+    print(f"📚 Korpus: {len(prompts)} promptów z {CONTENT_DIR} (hash {corpus_hash[:12]})")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "platform": sys.platform,
+        "corpus_hash": corpus_hash,
+        "prompts": len(prompts),
+        "max_new_tokens": args.max_new_tokens,
+        "tflite_threads": TFLITE_THREADS,
+        "backends": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prompts_file = Path(tmp) / "prompts.json"
+        prompts_file.write_text(json.dumps(prompts, ensure_ascii=False), encoding="utf-8")
+
+        for backend in backends:
+            print(f"⏱️  Pomiar: {backend}...")
+            result_file = Path(tmp) / f"{backend}.json"
+            subprocess.run([sys.executable, str(Path(__file__).resolve()), "--worker", backend,
+                            "--prompts-file", str(prompts_file), "--result-file", str(result_file),
+                            "--max-new-tokens", str(args.max_new_tokens)],
+                           cwd=SUMMARIZER_DIR, check=True)
+            result = json.loads(result_file.read_text(encoding="utf-8"))
+            report["backends"][backend] = result
+
+            tps = _metric_value(result, "tokens_per_s")
+            ttft = _metric_value(result, "ttft_ms")
+            print(f"   ✅ load {result['load_s']:.2f}s | RSS {result['peak_rss_mb']:.0f} MB | "
+                  f"TTFT {ttft or 0:.1f} ms | {tps or 0:.1f} tok/s")
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = args.output or RESULTS_DIR / f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"💾 Wyniki: {output}")
+
+    regressions = []
+    if args.baseline:
+        if args.baseline.exists():
+            print(f"\n📊 Porównanie z baseline: {args.baseline}")
+            regressions = compare_with_baseline(report, json.loads(args.baseline.read_text(encoding="utf-8")))
+            print(f"❌ Wykryto {len(regressions)} regresji (tolerancja {REGRESSION_TOLERANCE:.0%})."
+                  if regressions else "✅ Brak regresji.")
+        else:
+            print(f"⚠️ Brak baseline: {args.baseline}")
+
+    if args.save_baseline:
+        BASELINE_FILE.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"📌 Zapisano baseline: {BASELINE_FILE}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,25 @@
 import os
+import sys
 import torch
-import numpy as np
-import tensorflow as tf
-import pytesseract
 from pathlib import Path
-from PIL import Image
-from pdf2image import convert_from_path
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from tflite_generation import generate_tflite, load_tflite_model
 
 # --- KONFIGURACJA ---
-pytesseract.pytesseract.tesseract_cmd = r'/opt/homebrew/bin/tesseract'
-
 SUMMARIZER_DIR = Path(__file__).resolve().parent
 BASE_DIR = SUMMARIZER_DIR.parent
-PT_MODEL_PATH = SUMMARIZER_DIR / "models" / "flan_t5_custom"
-TFLITE_MODEL_PATH = SUMMARIZER_DIR / "models" / "summarizer.tflite"
+MODELS_DIR = SUMMARIZER_DIR / "models"
+PT_MODEL_PATH = MODELS_DIR / "flan_t5_custom"
+TFLITE_MODEL_PATH = MODELS_DIR / "summarizer.tflite"
 VERIFY_DIR = SUMMARIZER_DIR / "scans_to_verify_summary"
 
+# Wspólny moduł OCR (z cache) leży w katalogu głównym projektu
+sys.path.append(str(BASE_DIR))
+from ocr import perform_ocr  # noqa: E402
+from batch_eval import (  # noqa: E402
+    DEFAULT_BATCH_SIZE, JsonlReport, build_prompts, default_report_path, list_scans, run_batched
+)
+
 MAX_LEN = 256  # Musi być zgodne z ostatnią konwersją
 device = "mps" if torch.backends.mps.is_available() else "cpu"
 
@@ -30,11 +33,9 @@ def load_pt_model():
     return tokenizer, model
 
 
-def load_tflite_model():
-    print(f"🚀 Ładowanie modelu TFLite z: {TFLITE_MODEL_PATH}")
-    interpreter = tf.lite.Interpreter(model_path=str(TFLITE_MODEL_PATH))
-    interpreter.allocate_tensors()
-    return interpreter
+def load_tflite_models():
+    """Wszystkie dostępne eksporty TFLite (models/*.tflite): {nazwa: interpreter}."""
+    return {path.stem: load_tflite_model(path) for path in sorted(MODELS_DIR.glob("*.tflite"))}
 
 
 # --- GENEROWANIE ---
@@ -45,57 +46,48 @@ def generate_pytorch(prompt, tokenizer, model):
     return tokenizer.decode(outputs[0], skip_special_tokens=True)
 
 
-def generate_tflite(prompt, interpreter, tokenizer):
-    input_ids = tokenizer.encode(prompt, max_length=MAX_LEN, truncation=True, padding="max_length")
-    input_ids = np.array([input_ids], dtype=np.int32)
-    decoder_input_ids = np.zeros((1, MAX_LEN), dtype=np.int32)
-    output_tokens = [0]
-
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-
-    for i in range(MAX_LEN - 1):
-        for j, token in enumerate(output_tokens):
-            decoder_input_ids[0, j] = token
-
-        # Dopasowanie tensorów po nazwach
-        for detail in input_details:
-            if "input_ids" in detail['name'] and "decoder" not in detail['name']:
-                interpreter.set_tensor(detail['index'], input_ids)
-            elif "decoder_input_ids" in detail['name']:
-                interpreter.set_tensor(detail['index'], decoder_input_ids)
-
-        interpreter.invoke()
-        output_data = interpreter.get_tensor(output_details[0]['index'])
-
-        # Pobieramy logity dla aktualnej pozycji
-        next_token_logits = output_data[0, len(output_tokens) - 1, :]
-        next_token = int(np.argmax(next_token_logits))
+# --- MAIN ---
 
-        if next_token == 1: break
-        output_tokens.append(next_token)
-        if len(output_tokens) >= 128: break  # Limit bezpieczeństwa
+def main_batch(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Tryb wsadowy: PyTorch generuje paczkami (prompty grupowane po długości),
+    eksporty TFLite (stały batch 1) liczone są per prompt. Wyniki idą do raportu JSONL.
+    """
+    tokenizer, pt_model = load_pt_model()
+    tflite_interpreters = load_tflite_models()
 
-    return tokenizer.decode(output_tokens, skip_special_tokens=True)
+    files = list_scans(VERIFY_DIR)
+    if not files:
+        print(f"ℹ️ Brak plików w {VERIFY_DIR}")
+        return
 
+    print(f"⏳ OCR {len(files)} dokumentów...")
+    items = build_prompts(files)
+    report_path = default_report_path("compare_tflite")
+    matches = {name: 0 for name in tflite_interpreters}
 
-# --- OCR ---
+    def compare(item, pt_res):
+        result = {}
+        for name, interpreter in tflite_interpreters.items():
+            tfl_res = generate_tflite(item["prompt"], interpreter, tokenizer)
+            match = pt_res.strip() == tfl_res.strip()
+            matches[name] += match
+            result[f"tflite:{name}"] = tfl_res
+            result[f"match:{name}"] = match
+        return result
 
-def perform_ocr(file_path):
-    try:
-        if file_path.suffix.lower() == ".pdf":
-            pages = convert_from_path(file_path)
-            return "".join([pytesseract.image_to_string(p, lang='pol+eng') for p in pages])
-        return pytesseract.image_to_string(Image.open(file_path), lang='pol+eng')
-    except Exception as e:
-        return f"Błąd OCR: {e}"
+    with JsonlReport(report_path) as report:
+        run_batched(items, tokenizer, pt_model, device, report, batch_size, max_length=MAX_LEN,
+                    on_result=compare, max_new_tokens=128, num_beams=1, do_sample=False)
 
+    for name, count in matches.items():
+        print(f"📊 [{name}] zgodność: {count}/{len(items)}")
+    print(f"✅ Raport: {report_path}")
 
-# --- MAIN ---
 
 def main():
     tokenizer, pt_model = load_pt_model()
-    tflite_interpreter = load_tflite_model()
+    tflite_interpreters = load_tflite_models()
 
     files = [f for f in VERIFY_DIR.glob("*") if f.suffix.lower() in [".jpg", ".jpeg", ".png", ".pdf"]]
     if not files:
@@ -113,18 +105,26 @@ def main():
 
             # Wynik PyTorch
             pt_res = generate_pytorch(prompt, tokenizer, pt_model)
-            # Wynik TFLite
-            tfl_res = generate_tflite(prompt, tflite_interpreter, tokenizer)
-
             print(f"{'PyTorch:':<10} {pt_res}")
-            print(f"{'TFLite:':<10} {tfl_res}")
 
-            # Prosta weryfikacja zgodności
-            if pt_res.strip() == tfl_res.strip():
-                print("✅ ZGODNOŚĆ: 100%")
-            else:
-                print("⚠️ ROZBIEŻNOŚĆ WYKRYTA")
+            # Wynik każdego eksportu TFLite
+            for name, interpreter in tflite_interpreters.items():
+                tfl_res = generate_tflite(prompt, interpreter, tokenizer)
+                print(f"{'TFLite:':<10} [{name}] {tfl_res}")
+
+                # Prosta weryfikacja zgodności
+                if pt_res.strip() == tfl_res.strip():
+                    print("✅ ZGODNOŚĆ: 100%")
+                else:
+                    print("⚠️ ROZBIEŻNOŚĆ WYKRYTA")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # --batch [rozmiar]: wsadowa ewaluacja katalogu z raportem JSONL
+    args = sys.argv[1:]
+    if "--batch" in args:
+        position = args.index("--batch") + 1
+        size = int(args[position]) if position < len(args) and args[position].isdigit() else DEFAULT_BATCH_SIZE
+        main_batch(size)
+    else:
+        main()
\ No newline at end of file
@@ -1,4 +1,9 @@
 import os
+import sys
+import json
+import time
+import tempfile
+import numpy as np
 import tensorflow as tf
 from transformers import TFT5ForConditionalGeneration, AutoTokenizer
 from pathlib import Path
@@ -6,36 +11,33 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 MODEL_INPUT_DIR = BASE_DIR / "summarizer" / "models" / "flan_t5_custom"
 TFLITE_OUTPUT_FILE = BASE_DIR / "summarizer" / "models" / "summarizer.tflite"
+TFLITE_KV_OUTPUT_FILE = BASE_DIR / "summarizer" / "models" / "summarizer_kv.tflite"
+TFLITE_DYNAMIC_OUTPUT_FILE = BASE_DIR / "summarizer" / "models" / "summarizer_dynamic.tflite"
+TFLITE_INT8_OUTPUT_FILE = BASE_DIR / "summarizer" / "models" / "summarizer_int8.tflite"
+TFLITE_BUCKETS_OUTPUT_FILE = BASE_DIR / "summarizer" / "models" / "summarizer_buckets.tflite"
+TFLITE_KV_BUCKETS_OUTPUT_FILE = BASE_DIR / "summarizer" / "models" / "summarizer_kv_buckets.tflite"
+QUANT_REPORT_FILE = BASE_DIR / "summarizer" / "models" / "quantization_report.json"
 
 # USTAWAMY IDENTYCZNE WARTOŚCI - to rozwiązuje błąd "not broadcastable"
 MAX_LEN = 256
 
+# Kubełki długości (--buckets): runtime wybiera najmniejszy, który mieści prompt / pozycję dekodera
+ENCODER_BUCKETS = (64, 128, 256)
+DECODER_BUCKETS = (32, 64, 128)  # Generujemy maks. 128 tokenów
 
-def convert():
-    print(f"🚀 Konwersja z wyrównaniem kształtów do {MAX_LEN}...")
+# Tryby kwantyzacji
+FLOAT = "float"      # Dotychczasowy eksport (wagi float32)
+DYNAMIC = "dynamic"  # Wagi int8, aktywacje float (bez kalibracji)
+INT8 = "int8"        # Wagi i aktywacje int8 (kalibracja na naszym korpusie)
 
-    model = TFT5ForConditionalGeneration.from_pretrained(MODEL_INPUT_DIR, from_pt=True)
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_INPUT_DIR)
+CALIBRATION_DOCS = 50      # Dokumentów z content/ do kalibracji (x2 prompty)
+CALIBRATION_SEED = 7
+EVAL_DOCS = 10             # Osobna próbka do raportu zgodności
+EVAL_SEED = 42
+LABEL_DIRS = {"headline": "titles", "summarize": "summary"}  # Etykiety jako wejście dekodera
 
-    class T5MergedModel(tf.Module):
-        def __init__(self, model):
-            super(T5MergedModel, self).__init__()
-            self.model = model
-
-        @tf.function(input_signature=[
-            tf.TensorSpec([1, MAX_LEN], tf.int32, name="input_ids"),
-            tf.TensorSpec([1, MAX_LEN], tf.int32, name="decoder_input_ids")
-        ])
-        def __call__(self, input_ids, decoder_input_ids):
-            # training=False jest kluczowe dla usunięcia węzłów treningowych
-            output = self.model(input_ids=input_ids, decoder_input_ids=decoder_input_ids, training=False)
-            return output.logits
-
-    t5_module = T5MergedModel(model)
-    converter = tf.lite.TFLiteConverter.from_concrete_functions(
-        [t5_module.__call__.get_concrete_function()], t5_module
-    )
 
+def _make_converter(converter, mode=FLOAT, representative_dataset=None):
     converter.target_spec.supported_ops = [
         tf.lite.OpsSet.TFLITE_BUILTINS,
         tf.lite.OpsSet.SELECT_TF_OPS
@@ -43,14 +45,288 @@ def convert():
 
     # Optymalizacja pod kątem rozmiaru i stabilności
     converter.optimizations = [tf.lite.Optimize.DEFAULT]
-    converter.target_spec.supported_types = [tf.float32]
+    if mode == FLOAT:
+        converter.target_spec.supported_types = [tf.float32]
+    elif mode == INT8:
+        # Operacje int8 tam, gdzie się da; reszta (np. SELECT_TF_OPS) zostaje float
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8] + converter.target_spec.supported_ops
+    return converter
+
+
+class T5MergedModel(tf.Module):
+    def __init__(self, model):
+        super(T5MergedModel, self).__init__()
+        self.model = model
+
+    @tf.function(input_signature=[
+        tf.TensorSpec([1, MAX_LEN], tf.int32, name="input_ids"),
+        tf.TensorSpec([1, MAX_LEN], tf.int32, name="decoder_input_ids")
+    ])
+    def __call__(self, input_ids, decoder_input_ids):
+        # training=False jest kluczowe dla usunięcia węzłów treningowych
+        output = self.model(input_ids=input_ids, decoder_input_ids=decoder_input_ids, training=False)
+        return output.logits
+
+
+class T5BucketModel(tf.Module):
+    """Model scalony dla jednej pary kubełków (--buckets) - sygnatura z nazwanym wyjściem "logits"."""
+
+    def __init__(self, model, encoder_len, decoder_len):
+        super(T5BucketModel, self).__init__()
+        self.model = model
+        self.logits = tf.function(self._logits, input_signature=[
+            tf.TensorSpec([1, encoder_len], tf.int32, name="input_ids"),
+            tf.TensorSpec([1, decoder_len], tf.int32, name="decoder_input_ids")
+        ])
+
+    def _logits(self, input_ids, decoder_input_ids):
+        output = self.model(input_ids=input_ids, decoder_input_ids=decoder_input_ids, training=False)
+        return {"logits": output.logits}
+
+
+def convert(output_file=TFLITE_OUTPUT_FILE, mode=FLOAT, representative_dataset=None):
+    print(f"🚀 Konwersja [{mode}] z wyrównaniem kształtów do {MAX_LEN}...")
+
+    model = TFT5ForConditionalGeneration.from_pretrained(MODEL_INPUT_DIR, from_pt=True)
+
+    t5_module = T5MergedModel(model)
+    converter = _make_converter(tf.lite.TFLiteConverter.from_concrete_functions(
+        [t5_module.__call__.get_concrete_function()], t5_module
+    ), mode, representative_dataset)
 
     tflite_model = converter.convert()
-    with open(TFLITE_OUTPUT_FILE, "wb") as f:
+    with open(output_file, "wb") as f:
+        f.write(tflite_model)
+
+    print(f"✨ Model gotowy: {output_file}")
+
+
+class T5KVCacheModel(tf.Module):
+    """
+    Enkoder i krok dekodera jako osobne sygnatury. Enkoder liczony raz na
+    dokument, a każdy krok dekodera dostaje tylko nowy token + cache K/V:
+      encode:        input_ids, attention_mask -> encoder_hidden_states
+      decoder_init:  pierwszy token -> logits, self_kv, cross_kv
+      decoder_step:  kolejny token + self_kv/cross_kv -> logits, self_kv (dłuższy o 1)
+    self_kv: [warstwy, 2 (K/V), 1, głowy, pozycje, d_kv]; cross_kv jak self_kv, ale po wejściu.
+    """
+
+    def __init__(self, model, max_len=MAX_LEN):
+        super(T5KVCacheModel, self).__init__()
+        self.model = model
+        config = model.config
+        layers, heads, d_kv = config.num_decoder_layers, config.num_heads, config.d_kv
+
+        self.encode = tf.function(self._encode, input_signature=[
+            tf.TensorSpec([1, max_len], tf.int32, name="input_ids"),
+            tf.TensorSpec([1, max_len], tf.int32, name="attention_mask"),
+        ])
+        self.decoder_init = tf.function(self._decoder_init, input_signature=[
+            tf.TensorSpec([1, 1], tf.int32, name="decoder_input_ids"),
+            tf.TensorSpec([1, max_len, config.d_model], tf.float32, name="encoder_hidden_states"),
+            tf.TensorSpec([1, max_len], tf.int32, name="attention_mask"),
+        ])
+        self.decoder_step = tf.function(self._decoder_step, input_signature=[
+            tf.TensorSpec([1, 1], tf.int32, name="decoder_input_ids"),
+            tf.TensorSpec([1, max_len, config.d_model], tf.float32, name="encoder_hidden_states"),
+            tf.TensorSpec([1, max_len], tf.int32, name="attention_mask"),
+            tf.TensorSpec([layers, 2, 1, heads, None, d_kv], tf.float32, name="self_kv"),
+            tf.TensorSpec([layers, 2, 1, heads, max_len, d_kv], tf.float32, name="cross_kv"),
+        ])
+
+    def _encode(self, input_ids, attention_mask):
+        hidden = self.model.encoder(input_ids=input_ids, attention_mask=attention_mask, training=False)[0]
+        return {"encoder_hidden_states": hidden}
+
+    def _decode(self, decoder_input_ids, encoder_hidden_states, attention_mask, past_key_values):
+        output = self.model(
+            attention_mask=attention_mask,
+            decoder_input_ids=decoder_input_ids,
+            encoder_outputs=(encoder_hidden_states,),
+            past_key_values=past_key_values,
+            use_cache=True,
+            training=False,
+        )
+        # Krotka na warstwę: (self_k, self_v, cross_k, cross_v)
+        self_kv = tf.stack([tf.stack(layer[:2]) for layer in output.past_key_values])
+        cross_kv = tf.stack([tf.stack(layer[2:]) for layer in output.past_key_values])
+        return output.logits[:, -1, :], self_kv, cross_kv
+
+    def _decoder_init(self, decoder_input_ids, encoder_hidden_states, attention_mask):
+        logits, self_kv, cross_kv = self._decode(decoder_input_ids, encoder_hidden_states, attention_mask, None)
+        return {"logits": logits, "self_kv": self_kv, "cross_kv": cross_kv}
+
+    def _decoder_step(self, decoder_input_ids, encoder_hidden_states, attention_mask, self_kv, cross_kv):
+        past = tuple(
+            (self_kv[i, 0], self_kv[i, 1], cross_kv[i, 0], cross_kv[i, 1])
+            for i in range(self_kv.shape[0])
+        )
+        logits, new_self_kv, _ = self._decode(decoder_input_ids, encoder_hidden_states, attention_mask, past)
+        return {"logits": logits, "self_kv": new_self_kv}
+
+    def signatures(self, suffix=""):
+        return {
+            "encode" + suffix: self.encode.get_concrete_function(),
+            "decoder_init" + suffix: self.decoder_init.get_concrete_function(),
+            "decoder_step" + suffix: self.decoder_step.get_concrete_function(),
+        }
+
+
+def _convert_signatures(module, signatures, output_file):
+    """Konwersja przez SavedModel - każda sygnatura staje się osobnym wejściem modelu TFLite."""
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        tf.saved_model.save(module, saved_model_dir, signatures=signatures)
+        converter = _make_converter(tf.lite.TFLiteConverter.from_saved_model(
+            saved_model_dir, signature_keys=list(signatures)
+        ))
+        tflite_model = converter.convert()
+
+    with open(output_file, "wb") as f:
         f.write(tflite_model)
 
-    print(f"✨ Model gotowy: {TFLITE_OUTPUT_FILE}")
+    print(f"✨ Model gotowy: {output_file}")
+
+
+def convert_kv_cache(output_file=TFLITE_KV_OUTPUT_FILE):
+    """Eksport enkoder/dekoder z cache K/V (sygnatury encode/decoder_init/decoder_step)."""
+    print(f"🚀 Konwersja enkoder + krok dekodera (cache K/V), wejście {MAX_LEN}...")
+
+    model = TFT5ForConditionalGeneration.from_pretrained(MODEL_INPUT_DIR, from_pt=True)
+    kv_module = T5KVCacheModel(model)
+    _convert_signatures(kv_module, kv_module.signatures(), output_file)
+
+
+def convert_buckets(output_file=TFLITE_BUCKETS_OUTPUT_FILE):
+    """
+    Eksport scalony z kubełkami długości: sygnatura merged_<wejście>x<dekoder>
+    dla każdej pary kubełków. Wagi są współdzielone między sygnaturami.
+    """
+    print(f"🚀 Konwersja z kubełkami: wejście {ENCODER_BUCKETS}, dekoder {DECODER_BUCKETS}...")
+
+    model = TFT5ForConditionalGeneration.from_pretrained(MODEL_INPUT_DIR, from_pt=True)
+    pairs = [(enc, dec) for enc in ENCODER_BUCKETS for dec in DECODER_BUCKETS]
+    root = tf.Module()
+    root.buckets = [T5BucketModel(model, enc, dec) for enc, dec in pairs]
+    signatures = {f"merged_{enc}x{dec}": bucket.logits.get_concrete_function()
+                  for (enc, dec), bucket in zip(pairs, root.buckets)}
+    _convert_signatures(root, signatures, output_file)
+
+
+def convert_kv_cache_buckets(output_file=TFLITE_KV_BUCKETS_OUTPUT_FILE):
+    """Eksport z cache K/V z kubełkami wejścia: encode_<n>, decoder_init_<n>, decoder_step_<n>."""
+    print(f"🚀 Konwersja enkoder + krok dekodera (cache K/V), kubełki wejścia {ENCODER_BUCKETS}...")
+
+    model = TFT5ForConditionalGeneration.from_pretrained(MODEL_INPUT_DIR, from_pt=True)
+    root = tf.Module()
+    root.buckets = [T5KVCacheModel(model, n) for n in ENCODER_BUCKETS]
+    signatures = {}
+    for n, bucket in zip(ENCODER_BUCKETS, root.buckets):
+        signatures.update(bucket.signatures(f"_{n}"))
+    _convert_signatures(root, signatures, output_file)
+
+
+# --- KWANTYZACJA ---
+
+def _label_text(task, doc):
+    """Etykieta dokumentu - stary układ titles/<rel> albo titles/en/<rel>."""
+    label_root = BASE_DIR / LABEL_DIRS[task]
+    for path in (label_root / doc, label_root / "en" / doc):
+        if path.exists():
+            return path.read_text(encoding="utf-8").strip()
+    return ""
+
+
+def calibration_dataset(tokenizer, docs=CALIBRATION_DOCS, seed=CALIBRATION_SEED):
+    """
+    Kalibracja int8 na promptach headline:/summarize: z content/. Wejście dekodera
+    to token startu + etykieta dokumentu, więc zakresy aktywacji odpowiadają generowaniu.
+    """
+    from benchmark import load_corpus
+
+    prompts, _ = load_corpus(docs, seed)
+
+    def generator():
+        for item in prompts:
+            input_ids = tokenizer.encode(item["prompt"], max_length=MAX_LEN, truncation=True, padding="max_length")
+            label_ids = tokenizer.encode(_label_text(item["task"], item["doc"]), max_length=MAX_LEN - 1,
+                                         truncation=True)
+            decoder_input_ids = np.zeros((1, MAX_LEN), dtype=np.int32)
+            decoder_input_ids[0, 1:len(label_ids) + 1] = label_ids
+            yield [np.array([input_ids], dtype=np.int32), decoder_input_ids]
+
+    return generator
+
+
+def quantization_report(variants, reference=TFLITE_OUTPUT_FILE):
+    """Rozmiar, średni czas generowania i zgodność tekstu z modelem float (logika z compare_model...)."""
+    from benchmark import load_corpus
+    from tflite_generation import generate_tflite, load_tflite_model
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_INPUT_DIR)
+    prompts, corpus_hash = load_corpus(EVAL_DOCS, EVAL_SEED)
+
+    def evaluate(model_path):
+        interpreter = load_tflite_model(model_path)
+        outputs, times = [], []
+        for item in prompts:
+            start = time.perf_counter()
+            outputs.append(generate_tflite(item["prompt"], interpreter, tokenizer).strip())
+            times.append(time.perf_counter() - start)
+        return outputs, sum(times) / len(times)
+
+    ref_outputs, ref_latency = evaluate(reference)
+    report = {"corpus_hash": corpus_hash, "prompts": len(prompts), "models": {}}
+    for name, path in [(FLOAT, reference)] + list(variants.items()):
+        outputs, latency = (ref_outputs, ref_latency) if path == reference else evaluate(path)
+        agreement = sum(a == b for a, b in zip(outputs, ref_outputs)) / len(prompts)
+        report["models"][name] = {
+            "file": Path(path).name,
+            "size_mb": os.path.getsize(path) / 2**20,
+            "latency_s": latency,
+            "speedup": ref_latency / latency if latency else None,
+            "agreement": agreement,
+        }
+        print(f"  📊 {name:<8} {report['models'][name]['size_mb']:>8.1f} MB | "
+              f"{latency:.2f} s/prompt | zgodność z float: {agreement:.0%}")
+
+    with open(QUANT_REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Raport: {QUANT_REPORT_FILE}")
+    return report
+
+
+def convert_quantized():
+    """Warianty dynamic-range i pełny int8 (kalibrowany) + raport względem modelu float."""
+    from benchmark import CONTENT_DIR, load_corpus
+
+    # Kalibracja int8 i raport zgodności potrzebują tekstów - sprawdzamy przed (długą) konwersją
+    if not load_corpus(EVAL_DOCS, EVAL_SEED)[0]:
+        print(f"❌ Brak dokumentów .txt w {CONTENT_DIR} - kwantyzacja wymaga korpusu do kalibracji i raportu.")
+        sys.exit(1)
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_INPUT_DIR)
+    if not TFLITE_OUTPUT_FILE.exists():
+        convert()
+    convert(TFLITE_DYNAMIC_OUTPUT_FILE, DYNAMIC)
+    convert(TFLITE_INT8_OUTPUT_FILE, INT8, calibration_dataset(tokenizer))
+
+    print("\n📏 Porównanie z modelem float...")
+    quantization_report({DYNAMIC: TFLITE_DYNAMIC_OUTPUT_FILE, INT8: TFLITE_INT8_OUTPUT_FILE})
 
 
 if __name__ == "__main__":
-    convert()
\ No newline at end of file
+    # --kv-cache: eksport z osobnymi sygnaturami enkodera i kroku dekodera
+    # --quantize: warianty dynamic-range i int8 + raport rozmiar/czas/zgodność
+    # --buckets: sygnatury dla kubełków długości (64/128/256) zamiast stałego 256
+    args = sys.argv[1:]
+    if "--kv-cache" in args and "--buckets" in args:
+        convert_kv_cache_buckets()
+    elif "--kv-cache" in args:
+        convert_kv_cache()
+    elif "--buckets" in args:
+        convert_buckets()
+    elif "--quantize" in args:
+        convert_quantized()
+    else:
+        convert()
@@ -1,7 +1,11 @@
 import os
+import sys
+import json
+import shutil
+import hashlib
 import torch
 from pathlib import Path
-from datasets import Dataset
+from datasets import Dataset, load_from_disk
 from transformers import (
     AutoTokenizer, 
     AutoModelForSeq2SeqLM, 
@@ -17,14 +21,53 @@ DATA_ROOT = BASE_DIR / "content"
 TITLE_ROOT = BASE_DIR / "titles"
 SUMMARY_ROOT = BASE_DIR / "summary"
 
+# Spakowany zbiór (dataset_store.py) - jeśli istnieje, zastępuje drzewa .txt
+sys.path.append(str(BASE_DIR))
+from dataset_store import DatasetReader, PACKED_ROOT, REAL_SUBSET, INDEX_FILE  # noqa: E402
+from cache_store import CACHE_DIR, make_key, file_sha256  # noqa: E402
+from near_duplicates import find_leakage  # noqa: E402
+
+PACKED_DATA = PACKED_ROOT / REAL_SUBSET
+TARGET_LANG = "en"
+
 MODEL_ID = "google/flan-t5-small"
 OUTPUT_MODEL_DIR = BASE_DIR / "summarizer" / "models" / "flan_t5_custom"
 
 MAX_INPUT_LEN = 512
 MAX_TARGET_LEN = 128
 
+# Stokenizowany zbiór (Arrow, memory-map) - klucz: hash tokenizera + odcisk danych
+TOKENIZED_CACHE_DIR = CACHE_DIR / "summarizer_tokenized"
+TEST_SIZE = 0.1
+SPLIT_SEED = 42  # Stały podział, żeby cache był powtarzalny
+
+def load_packed_data(reader):
+    """Pary Instrukcja + Tekst -> Wynik ze spakowanego zbioru (memory-map)."""
+    dataset_dict = {"input_text": [], "target_text": []}
+
+    print(f"📦 Wczytuję spakowany zbiór: {PACKED_DATA} ({len(reader)} dokumentów)")
+    for record in reader.iter_records(["content", "titles", "summaries"]):
+        ocr_content = (record["content"] or "").strip()
+        if not ocr_content: continue
+
+        title = record["titles"].get(TARGET_LANG)
+        if title:
+            dataset_dict["input_text"].append(f"headline: {ocr_content}")
+            dataset_dict["target_text"].append(title.strip())
+
+        summary = record["summaries"].get(TARGET_LANG)
+        if summary:
+            dataset_dict["input_text"].append(f"summarize: {ocr_content}")
+            dataset_dict["target_text"].append(summary.strip())
+
+    return Dataset.from_dict(dataset_dict)
+
 def load_data():
     """Wczytuje dane i tworzy pary: Instrukcja + Tekst -> Wynik."""
+    reader = DatasetReader(PACKED_DATA)
+    if reader.exists():
+        return load_packed_data(reader)
+
     dataset_dict = {"input_text": [], "target_text": []}
     
     print(f"📂 Szukam danych w: {DATA_ROOT}")
@@ -56,28 +99,87 @@ def load_data():
                 
     return Dataset.from_dict(dataset_dict)
 
-def main():
-    # 1. Przygotowanie danych
+def tokenizer_fingerprint(tokenizer):
+    """Hash słownika i reguł tokenizera (zmiana tokenizera = nowy cache)."""
+    if tokenizer.is_fast:
+        definition = tokenizer.backend_tokenizer.to_str()
+    else:
+        definition = json.dumps(sorted(tokenizer.get_vocab().items()))
+    return hashlib.sha256(definition.encode("utf-8")).hexdigest()
+
+def data_fingerprint():
+    """Odcisk danych bez czytania treści: indeks spakowanego zbioru albo rozmiary/daty plików .txt."""
+    reader = DatasetReader(PACKED_DATA)
+    if reader.exists():
+        return make_key("packed", file_sha256(PACKED_DATA / INDEX_FILE), TARGET_LANG)
+
+    stats = []
+    for root in (DATA_ROOT, TITLE_ROOT, SUMMARY_ROOT):
+        for txt_file in sorted(root.rglob("*.txt")):
+            stat = txt_file.stat()
+            stats.append((txt_file.relative_to(BASE_DIR).as_posix(), stat.st_size, stat.st_mtime_ns))
+    return make_key("trees", stats)
+
+def report_leakage(dataset):
+    """Ostrzega o bliskich duplikatach tekstu między train i test (w obrębie tego samego zadania)."""
+    for task in ("headline: ", "summarize: "):
+        train = [t for t in dataset["train"]["input_text"] if t.startswith(task)]
+        test = [t for t in dataset["test"]["input_text"] if t.startswith(task)]
+        leaks = find_leakage(train, test)
+        if leaks:
+            print(f"⚠️ Przeciek [{task.strip(': ')}]: {len(leaks)}/{len(test)} przykładów testowych "
+                  f"ma bliski duplikat w zbiorze treningowym.")
+
+def load_tokenized_dataset(tokenizer):
+    """
+    Stokenizowany podział train/test z cache na dysku albo tokenizacja od zera.
+    Bez paddingu - dopełnianie robi DataCollatorForSeq2Seq per batch.
+    """
+    cache_key = make_key(tokenizer_fingerprint(tokenizer), data_fingerprint(),
+                         MAX_INPUT_LEN, MAX_TARGET_LEN, TEST_SIZE, SPLIT_SEED)
+    cache_path = TOKENIZED_CACHE_DIR / cache_key
+    if cache_path.exists():
+        print(f"♻️ Stokenizowany zbiór z cache: {cache_path}")
+        return load_from_disk(str(cache_path))
+
     raw_dataset = load_data()
     if len(raw_dataset) == 0:
-        print("❌ Nie znaleziono plików w content/titles/summary. Sprawdź ścieżki.")
-        return
-        
-    dataset = raw_dataset.train_test_split(test_size=0.1)
-    
-    # 2. Tokenizer i Model
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_ID)
+        return None
+
+    dataset = raw_dataset.train_test_split(test_size=TEST_SIZE, seed=SPLIT_SEED)
+    report_leakage(dataset)
 
     def preprocess(examples):
-        inputs = [ex for ex in examples["input_text"]]
-        model_inputs = tokenizer(inputs, max_length=MAX_INPUT_LEN, truncation=True, padding="max_length")
-        
-        labels = tokenizer(text_target=examples["target_text"], max_length=MAX_TARGET_LEN, truncation=True, padding="max_length")
+        model_inputs = tokenizer(examples["input_text"], max_length=MAX_INPUT_LEN, truncation=True)
+        labels = tokenizer(text_target=examples["target_text"], max_length=MAX_TARGET_LEN, truncation=True)
         model_inputs["labels"] = labels["input_ids"]
+        model_inputs["length"] = [len(ids) for ids in model_inputs["input_ids"]]  # Dla group_by_length
         return model_inputs
 
-    tokenized_dataset = dataset.map(preprocess, batched=True)
+    tokenized_dataset = dataset.map(preprocess, batched=True, remove_columns=["input_text", "target_text"])
+
+    # Zapis do katalogu tymczasowego i podmiana - przerwany zapis nie zostawia połowicznego cache
+    TOKENIZED_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tokenized_dataset.save_to_disk(str(tmp_path))
+    os.replace(tmp_path, cache_path)
+    print(f"💾 Zapisano stokenizowany zbiór: {cache_path}")
+    return load_from_disk(str(cache_path))
+
+def count_tokens(dataset):
+    """Rzeczywiste (niedopełnione) tokeny wejścia i etykiet."""
+    return sum(dataset["length"]) + sum(len(labels) for labels in dataset["labels"])
+
+def main():
+    # 1. Tokenizer, Model i dane (stokenizowane, z cache)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_ID)
+
+    tokenized_dataset = load_tokenized_dataset(tokenizer)
+    if tokenized_dataset is None:
+        print("❌ Nie znaleziono plików w content/titles/summary. Sprawdź ścieżki.")
+        return
 
     # 3. Argumenty treningu
     # 3. Argumenty treningu
@@ -96,6 +198,8 @@ def main():
         # Opcjonalnie dodaj te parametry dla lepszego generowania:
         generation_max_length=MAX_TARGET_LEN,
         generation_num_beams=4,
+        # Podobne długości w jednym batchu = mniej paddingu
+        group_by_length=True,
     )
 
     # 4. Trener
@@ -105,11 +209,18 @@ def main():
         train_dataset=tokenized_dataset["train"],
         eval_dataset=tokenized_dataset["test"],
         tokenizer=tokenizer,
-        data_collator=DataCollatorForSeq2Seq(tokenizer, model=model),
+        # Dopełnianie do najdłuższego przykładu w batchu (etykiety: -100, pomijane w stracie)
+        data_collator=DataCollatorForSeq2Seq(tokenizer, model=model, padding="longest", pad_to_multiple_of=8),
     )
 
-    print(f"🚀 Rozpoczynam uczenie na {len(raw_dataset)} przykładach...")
-    trainer.train()
+    total_examples = len(tokenized_dataset["train"]) + len(tokenized_dataset["test"])
+    print(f"🚀 Rozpoczynam uczenie na {total_examples} przykładach...")
+    train_result = trainer.train()
+
+    runtime = train_result.metrics.get("train_runtime")
+    if runtime:
+        train_tokens = count_tokens(tokenized_dataset["train"]) * training_args.num_train_epochs
+        print(f"⏱️ Trening: {runtime:.0f}s, {train_tokens / runtime:,.0f} tokenów/s (bez paddingu)")
 
     # 5. Zapisywanie modelu
     os.makedirs(OUTPUT_MODEL_DIR, exist_ok=True)
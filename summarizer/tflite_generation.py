@@ -0,0 +1,185 @@
+import re
+import numpy as np
+
+# Tokeny specjalne T5
+DECODER_START_ID = 0
+EOS_ID = 1
+
+KV_SIGNATURES = {"encode", "decoder_init", "decoder_step"}
+MERGED_BUCKET_PATTERN = re.compile(r"merged_(\d+)x(\d+)")
+
+
+def load_tflite_model(model_path, num_threads=None):
+    """Interpreter TFLite z zaalokowanymi tensorami (bez ładowania torch/OCR)."""
+    import tensorflow as tf
+
+    print(f"🚀 Ładowanie modelu TFLite z: {model_path}")
+    interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def pick_bucket(length, buckets):
+    """Najmniejszy kubełek, który mieści `length` (albo największy, gdy żaden nie mieści)."""
+    return next((size for size in buckets if size >= length), buckets[-1])
+
+
+def kv_buckets(interpreter):
+    """Kubełki wejścia eksportu K/V (--kv-cache --buckets), np. [64, 128, 256]."""
+    names = interpreter.get_signature_list()
+    sizes = [int(name[len("encode_"):]) for name in names
+             if name.startswith("encode_") and name[len("encode_"):].isdigit()]
+    return sorted(n for n in sizes if {f"decoder_init_{n}", f"decoder_step_{n}"}.issubset(names))
+
+
+def merged_buckets(interpreter):
+    """Pary (wejście, dekoder) eksportu scalonego z kubełkami (--buckets)."""
+    matches = (MERGED_BUCKET_PATTERN.fullmatch(name) for name in interpreter.get_signature_list())
+    return sorted((int(m.group(1)), int(m.group(2))) for m in matches if m)
+
+
+def has_kv_signatures(interpreter):
+    """Czy model TFLite to eksport enkoder/dekoder z cache K/V (convert_to_tflite.py --kv-cache)."""
+    return KV_SIGNATURES.issubset(interpreter.get_signature_list()) or bool(kv_buckets(interpreter))
+
+
+def kv_signature_suffix(interpreter, tokenizer, prompt):
+    """Sufiks sygnatur K/V dla promptu: "" dla stałej długości, "_<n>" dla kubełków."""
+    buckets = kv_buckets(interpreter)
+    if not buckets:
+        return ""
+    length = len(tokenizer(prompt, max_length=buckets[-1], truncation=True)["input_ids"])
+    return f"_{pick_bucket(length, buckets)}"
+
+
+def _signature_input_len(runner, name):
+    return int(runner.get_input_details()[name]["shape"][1])
+
+
+def generate_tflite_kv(prompt, interpreter, tokenizer, max_new_tokens=128, on_token=None):
+    """
+    Greedy decoding z cache K/V: enkoder uruchamiany raz, a każdy krok dekodera
+    przetwarza tylko jeden nowy token (zamiast pełnych 256 pozycji od nowa).
+    Przy eksporcie z kubełkami wybierany jest najmniejszy kubełek mieszczący prompt.
+    on_token(krok, token) - opcjonalny callback (np. do pomiaru czasu/logowania).
+    """
+    suffix = kv_signature_suffix(interpreter, tokenizer, prompt)
+    encode = interpreter.get_signature_runner("encode" + suffix)
+    decoder_init = interpreter.get_signature_runner("decoder_init" + suffix)
+    decoder_step = interpreter.get_signature_runner("decoder_step" + suffix)
+
+    max_len = _signature_input_len(encode, "input_ids")
+    encoded = tokenizer(prompt, max_length=max_len, truncation=True, padding="max_length")
+    input_ids = np.array([encoded["input_ids"]], dtype=np.int32)
+    attention_mask = np.array([encoded["attention_mask"]], dtype=np.int32)
+
+    encoder_hidden_states = encode(input_ids=input_ids, attention_mask=attention_mask)["encoder_hidden_states"]
+
+    step = decoder_init(
+        decoder_input_ids=np.array([[DECODER_START_ID]], dtype=np.int32),
+        encoder_hidden_states=encoder_hidden_states,
+        attention_mask=attention_mask,
+    )
+    self_kv, cross_kv = step["self_kv"], step["cross_kv"]
+
+    output_tokens = []
+    for i in range(max_new_tokens):
+        next_token = int(np.argmax(step["logits"][0]))
+        if on_token is not None:
+            on_token(i, next_token)
+        if next_token == EOS_ID:
+            break
+        output_tokens.append(next_token)
+
+        step = decoder_step(
+            decoder_input_ids=np.array([[next_token]], dtype=np.int32),
+            encoder_hidden_states=encoder_hidden_states,
+            attention_mask=attention_mask,
+            self_kv=self_kv,
+            cross_kv=cross_kv,
+        )
+        self_kv = step["self_kv"]
+
+    return tokenizer.decode(output_tokens, skip_special_tokens=True)
+
+
+def generate_tflite_merged(prompt, interpreter, tokenizer, max_new_tokens=128, on_token=None):
+    """
+    Greedy decoding dla eksportu scalonego (convert_to_tflite.py bez flag):
+    każdy krok uruchamia cały model na wejściu i dekoderze dopełnionych do MAX_LEN.
+    """
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+    max_len = int(input_details[0]["shape"][1])
+
+    input_ids = tokenizer.encode(prompt, max_length=max_len, truncation=True, padding="max_length")
+    input_ids = np.array([input_ids], dtype=np.int32)
+    decoder_input_ids = np.zeros((1, max_len), dtype=np.int32)
+    output_tokens = [DECODER_START_ID]
+
+    for i in range(min(max_new_tokens, max_len - 1)):
+        decoder_input_ids[0, len(output_tokens) - 1] = output_tokens[-1]
+
+        # Dopasowanie tensorów po nazwach
+        for detail in input_details:
+            if "input_ids" in detail["name"] and "decoder" not in detail["name"]:
+                interpreter.set_tensor(detail["index"], input_ids)
+            elif "decoder_input_ids" in detail["name"]:
+                interpreter.set_tensor(detail["index"], decoder_input_ids)
+
+        interpreter.invoke()
+        output_data = interpreter.get_tensor(output_details[0]["index"])
+
+        # Logity dla aktualnej pozycji
+        next_token = int(np.argmax(output_data[0, len(output_tokens) - 1, :]))
+        if on_token is not None:
+            on_token(i, next_token)
+        if next_token == EOS_ID:
+            break
+        output_tokens.append(next_token)
+
+    return tokenizer.decode(output_tokens, skip_special_tokens=True)
+
+
+def generate_tflite_buckets(prompt, interpreter, tokenizer, max_new_tokens=128, on_token=None):
+    """
+    Greedy decoding dla eksportu scalonego z kubełkami długości: wejście dopełniane
+    do najmniejszego kubełka mieszczącego prompt, a dekoder do najmniejszego
+    kubełka mieszczącego aktualną pozycję (rośnie w trakcie generowania).
+    """
+    buckets = merged_buckets(interpreter)
+    encoder_sizes = sorted({enc for enc, _ in buckets})
+    decoder_sizes = sorted({dec for _, dec in buckets})
+
+    length = len(tokenizer.encode(prompt, max_length=encoder_sizes[-1], truncation=True))
+    encoder_len = pick_bucket(length, encoder_sizes)
+    input_ids = tokenizer.encode(prompt, max_length=encoder_len, truncation=True, padding="max_length")
+    input_ids = np.array([input_ids], dtype=np.int32)
+
+    runners = {}
+    output_tokens = [DECODER_START_ID]
+    for i in range(min(max_new_tokens, decoder_sizes[-1])):
+        decoder_len = pick_bucket(len(output_tokens), decoder_sizes)
+        if decoder_len not in runners:
+            runners[decoder_len] = interpreter.get_signature_runner(f"merged_{encoder_len}x{decoder_len}")
+        decoder_input_ids = np.zeros((1, decoder_len), dtype=np.int32)
+        decoder_input_ids[0, :len(output_tokens)] = output_tokens
+
+        logits = runners[decoder_len](input_ids=input_ids, decoder_input_ids=decoder_input_ids)["logits"]
+        next_token = int(np.argmax(logits[0, len(output_tokens) - 1]))
+        if on_token is not None:
+            on_token(i, next_token)
+        if next_token == EOS_ID:
+            break
+        output_tokens.append(next_token)
+
+    return tokenizer.decode(output_tokens, skip_special_tokens=True)
+
+
+def generate_tflite(prompt, interpreter, tokenizer, max_new_tokens=128, on_token=None):
+    """Greedy decoding dla dowolnego eksportu (wybór ścieżki po sygnaturach modelu)."""
+    if has_kv_signatures(interpreter):
+        return generate_tflite_kv(prompt, interpreter, tokenizer, max_new_tokens, on_token)
+    if merged_buckets(interpreter):
+        return generate_tflite_buckets(prompt, interpreter, tokenizer, max_new_tokens, on_token)
+    return generate_tflite_merged(prompt, interpreter, tokenizer, max_new_tokens, on_token)
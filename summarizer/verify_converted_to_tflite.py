@@ -1,84 +1,64 @@
-import numpy as np
+import sys
 import tensorflow as tf
 from transformers import AutoTokenizer
 from pathlib import Path
+from tflite_generation import has_kv_signatures, merged_buckets, generate_tflite
 
 # --- KONFIGURACJA ---
 BASE_DIR = Path(__file__).resolve().parent.parent
 MODEL_PATH = BASE_DIR / "summarizer" / "models" / "summarizer.tflite"
+# Eksport z cache K/V (convert_to_tflite.py --kv-cache) - używany, jeśli istnieje
+KV_MODEL_PATH = BASE_DIR / "summarizer" / "models" / "summarizer_kv.tflite"
+# Eksporty z kubełkami długości (convert_to_tflite.py --buckets [--kv-cache]) - tylko z flagą --buckets
+BUCKETS_MODEL_PATH = BASE_DIR / "summarizer" / "models" / "summarizer_buckets.tflite"
+KV_BUCKETS_MODEL_PATH = BASE_DIR / "summarizer" / "models" / "summarizer_kv_buckets.tflite"
 TOKENIZER_DIR = BASE_DIR / "summarizer" / "models" / "flan_t5_custom"
 
 # Te wartości muszą być zgodne z tymi, które ustawiliśmy podczas konwersji (256)
 MAX_LEN = 256
 
 
-def generate_tflite(prompt, interpreter, tokenizer):
-    # 1. Tokenizacja wejścia (Enkoder)
-    input_ids = tokenizer.encode(prompt, max_length=MAX_LEN, truncation=True, padding="max_length")
-    input_ids = np.array([input_ids], dtype=np.int32)
-
-    # 2. Przygotowanie wejścia dla Dekodera (zaczynamy od tokena PAD/START = 0)
-    decoder_input_ids = np.zeros((1, MAX_LEN), dtype=np.int32)
-    output_tokens = [0]
-
-    # Pobranie szczegółów tensorów wejściowych i wyjściowych
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-
-    # Logika generowania (identyczna jak we Flutterze)
-    generated_text = ""
-    print(f"⏳ Generowanie dla promptu: '{prompt[:30]}...'")
-
-    for i in range(MAX_LEN - 1):
-        # Wypełniamy decoder_input_ids dotychczasowymi tokenami
-        for j, token in enumerate(output_tokens):
-            decoder_input_ids[0, j] = token
-
-        # Uruchomienie interpretera
-        # Uwaga: kolejność zależy od tego, jak model został zapisany
-        # Sprawdzamy nazwy tensorów, aby dopasować dane
-        for detail in input_details:
-            if "input_ids" in detail['name'] and "decoder" not in detail['name']:
-                interpreter.set_tensor(detail['index'], input_ids)
-            elif "decoder_input_ids" in detail['name']:
-                interpreter.set_tensor(detail['index'], decoder_input_ids)
-
-        interpreter.invoke()
-
-        # Pobranie logitów z wyjścia [1, 256, 32128]
-        output_data = interpreter.get_tensor(output_details[0]['index'])
-
-        # Interesuje nas logit dla ostatniego wygenerowanego tokena
-        next_token_logits = output_data[0, len(output_tokens) - 1, :]
+def print_step(tokenizer):
+    def on_token(i, token):
+        if token == 1:  # 1 to EOS (End of String) w T5
+            print("LOG: Otrzymano token EOS (1)")
+        else:
+            print(f"  Step {i}: {token} -> '{tokenizer.decode([token])}'")
+    return on_token
 
-        # Greedy Search (wybieramy najlepszy token - Argmax)
-        next_token = int(np.argmax(next_token_logits))
 
-        # Warunki stopu
-        if next_token == 1:  # 1 to EOS (End of String) w T5
-            print("LOG: Otrzymano token EOS (1)")
-            break
+def describe(interpreter):
+    if has_kv_signatures(interpreter):
+        return "cache K/V"
+    if merged_buckets(interpreter):
+        return "kubełki długości"
+    return "model scalony"
 
-        output_tokens.append(next_token)
 
-        # Dekodowanie na bieżąco
-        word = tokenizer.decode([next_token])
-        generated_text += word
-        print(f"  Step {i}: {next_token} -> '{word}'")
+def verify_generate(prompt, interpreter, tokenizer):
+    """Wspólna ścieżka generowania (tflite_generation) z logowaniem kroków."""
+    print(f"⏳ Generowanie ({describe(interpreter)}) dla promptu: '{prompt[:30]}...'")
+    return generate_tflite(prompt, interpreter, tokenizer, max_new_tokens=MAX_LEN,
+                           on_token=print_step(tokenizer)).strip()
 
-        if len(output_tokens) >= MAX_LEN:
-            break
 
-    return generated_text.strip()
+def select_model_path(args):
+    """--buckets [--kv-cache]: eksport z kubełkami; bez flag - K/V, jeśli istnieje, inaczej scalony."""
+    if "--buckets" in args:
+        return KV_BUCKETS_MODEL_PATH if "--kv-cache" in args else BUCKETS_MODEL_PATH
+    if "--kv-cache" in args:
+        return KV_MODEL_PATH
+    return KV_MODEL_PATH if KV_MODEL_PATH.exists() else MODEL_PATH
 
 
 def main():
-    if not MODEL_PATH.exists():
-        print(f"❌ Nie znaleziono pliku modelu w: {MODEL_PATH}")
+    model_path = select_model_path(sys.argv[1:])
+    if not model_path.exists():
+        print(f"❌ Nie znaleziono pliku modelu w: {model_path}")
         return
 
-    print(f"🚀 Ładowanie modelu TFLite: {MODEL_PATH}")
-    interpreter = tf.lite.Interpreter(model_path=str(MODEL_PATH))
+    print(f"🚀 Ładowanie modelu TFLite: {model_path}")
+    interpreter = tf.lite.Interpreter(model_path=str(model_path))
     interpreter.allocate_tensors()
 
     print(f"🚀 Ładowanie tokenizera z: {TOKENIZER_DIR}")
@@ -88,11 +68,11 @@ def main():
     sample_text = "Matura 2005 przykład RZECZPOSPOLITA POLSKA ŚWIADECTWO DOJRZAŁOŚCI Janina Kosińska-Iksińska"
 
     # Test 1: Tytuł
-    title = generate_tflite(f"headline: {sample_text}", interpreter, tokenizer)
+    title = verify_generate(f"headline: {sample_text}", interpreter, tokenizer)
     print(f"\n📌 FINALNY TYTUŁ TFLITE: {title}")
 
     # Test 2: Podsumowanie
-    summary = generate_tflite(f"summarize: {sample_text}", interpreter, tokenizer)
+    summary = verify_generate(f"summarize: {sample_text}", interpreter, tokenizer)
     print(f"\n📝 FINALNE PODSUMOWANIE TFLITE: {summary}")
 
 
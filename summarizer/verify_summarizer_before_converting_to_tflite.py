@@ -1,41 +1,28 @@
 import os
+import sys
 import torch
-import pytesseract
 import json
 from pathlib import Path
-from PIL import Image
-from pdf2image import convert_from_path
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
 # --- KONFIGURACJA ---
-# Ścieżka do Tesseracta (zgodnie z Twoim systemem)
-pytesseract.pytesseract.tesseract_cmd = r'/opt/homebrew/bin/tesseract'
-
 # Ścieżki relatywne
 SUMMARIZER_DIR = Path(__file__).resolve().parent
 BASE_DIR = SUMMARIZER_DIR.parent
 MODEL_PATH = SUMMARIZER_DIR / "models" / "flan_t5_custom"
 VERIFY_DIR = SUMMARIZER_DIR / "scans_to_verify_summary"
 
+# Wspólny moduł OCR (z cache) leży w katalogu głównym projektu
+sys.path.append(str(BASE_DIR))
+from ocr import perform_ocr  # noqa: E402
+from batch_eval import (  # noqa: E402
+    DEFAULT_BATCH_SIZE, JsonlReport, build_prompts, default_report_path, list_scans, run_batched
+)
+
 # Urządzenie (wykryte mps w Twoich logach)
 device = "mps" if torch.backends.mps.is_available() else "cpu"
 
 
-def perform_ocr(file_path):
-    """Konwertuje obraz/PDF na tekst."""
-    text = ""
-    try:
-        if file_path.suffix.lower() == ".pdf":
-            pages = convert_from_path(file_path)
-            for page in pages:
-                text += pytesseract.image_to_string(page, lang='pol+eng')
-        else:
-            text = pytesseract.image_to_string(Image.open(file_path), lang='pol+eng')
-    except Exception as e:
-        print(f"  [!] Błąd OCR dla {file_path.name}: {e}")
-    return text
-
-
 def load_model():
     print(f"🚀 Ładowanie modelu z: {MODEL_PATH}...")
     if not MODEL_PATH.exists():
@@ -78,6 +65,26 @@ def generate_text(prompt, tokenizer, model):
     return result, input_len
 
 
+def main_batch(batch_size=DEFAULT_BATCH_SIZE):
+    """Tryb wsadowy: OCR całego katalogu, prompty grupowane po długości, raport JSONL."""
+    tokenizer, model = load_model()
+
+    files = list_scans(VERIFY_DIR)
+    if not files:
+        print(f"ℹ️ Brak obrazów lub plików PDF w {VERIFY_DIR}.")
+        return
+
+    print(f"⏳ OCR {len(files)} dokumentów...")
+    items = build_prompts(files)
+    report_path = default_report_path("verify_summarizer")
+
+    print(f"🔍 {len(items)} promptów, paczki po {batch_size}.")
+    with JsonlReport(report_path) as report:
+        run_batched(items, tokenizer, model, device, report, batch_size, max_length=512,
+                    max_new_tokens=128, num_beams=4, early_stopping=True)
+    print(f"✅ Raport: {report_path}")
+
+
 def main():
     tokenizer, model = load_model()
 
@@ -121,4 +128,11 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # --batch [rozmiar]: wsadowa ewaluacja katalogu z raportem JSONL
+    args = sys.argv[1:]
+    if "--batch" in args:
+        position = args.index("--batch") + 1
+        size = int(args[position]) if position < len(args) and args[position].isdigit() else DEFAULT_BATCH_SIZE
+        main_batch(size)
+    else:
+        main()
\ No newline at end of file